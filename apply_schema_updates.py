@@ -70,6 +70,51 @@ def main():
             except Exception as e:
                 print(f"Error handling end_time: {e}")
 
+            # Venues: índice del listado paginado (keyset por created_at, id)
+            cur.execute("CREATE INDEX IF NOT EXISTS idx_venues_created ON venues (created_at DESC, id DESC);")
+            print("Ensured index idx_venues_created.")
+
+            # Orders: listados paginados por usuario y por evento
+            cur.execute("CREATE INDEX IF NOT EXISTS idx_orders_user_created ON orders (user_id, created_at DESC, id DESC);")
+            cur.execute("CREATE INDEX IF NOT EXISTS idx_orders_event_created ON orders (event_id, created_at DESC, id DESC);")
+            print("Ensured indexes idx_orders_user_created, idx_orders_event_created.")
+
+            # Events: listado público por estado y fecha (paginado)
+            cur.execute("CREATE INDEX IF NOT EXISTS idx_events_status_start ON events (status, start_time, id);")
+            print("Ensured index idx_events_status_start.")
+
+            # Idempotency-Key de las compras (orders)
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS idempotency_keys (
+                    user_id       INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+                    idem_key      VARCHAR(255) NOT NULL,
+                    endpoint      VARCHAR(255) NOT NULL,
+                    request_hash  CHAR(64) NOT NULL,
+                    status_code   INTEGER,
+                    response      JSONB,
+                    created_at    TIMESTAMP NOT NULL DEFAULT NOW(),
+                    PRIMARY KEY (user_id, idem_key)
+                );
+            """)
+            cur.execute("CREATE INDEX IF NOT EXISTS idx_idempotency_created ON idempotency_keys (created_at);")
+            print("Ensured table idempotency_keys.")
+
+            # Refresh tokens (sesiones renovables del Auth Service)
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS refresh_tokens (
+                    id          SERIAL PRIMARY KEY,
+                    user_id     INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+                    token_hash  CHAR(64) UNIQUE NOT NULL,
+                    family_id   VARCHAR(32) NOT NULL,
+                    expires_at  TIMESTAMP NOT NULL,
+                    revoked_at  TIMESTAMP,
+                    created_at  TIMESTAMP NOT NULL DEFAULT NOW()
+                );
+            """)
+            cur.execute("CREATE INDEX IF NOT EXISTS idx_refresh_family ON refresh_tokens (family_id);")
+            cur.execute("CREATE INDEX IF NOT EXISTS idx_refresh_expires ON refresh_tokens (expires_at);")
+            print("Ensured table refresh_tokens.")
+
         conn.close()
         print("Schema update completed.")
     except Exception as e:
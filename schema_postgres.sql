@@ -35,6 +35,8 @@ CREATE TABLE IF NOT EXISTS venues (
     created_at  TIMESTAMP NOT NULL DEFAULT NOW()
 );
 
+CREATE INDEX idx_venues_created ON venues (created_at DESC, id DESC);
+
 -- ============================================================
 -- TABLA: events (eventos)
 -- ============================================================
@@ -53,6 +55,7 @@ CREATE TABLE IF NOT EXISTS events (
 );
 
 CREATE INDEX idx_events_status ON events (status);
+CREATE INDEX idx_events_status_start ON events (status, start_time, id);
 CREATE INDEX idx_events_venue  ON events (venue_id);
 
 -- ============================================================
@@ -71,6 +74,8 @@ CREATE TABLE IF NOT EXISTS orders (
 
 CREATE INDEX idx_orders_user  ON orders (user_id);
 CREATE INDEX idx_orders_event ON orders (event_id);
+CREATE INDEX idx_orders_user_created  ON orders (user_id, created_at DESC, id DESC);
+CREATE INDEX idx_orders_event_created ON orders (event_id, created_at DESC, id DESC);
 
 -- ============================================================
 -- TABLA: tickets (boletos generados)
@@ -88,6 +93,38 @@ CREATE INDEX idx_tickets_order ON tickets (order_id);
 CREATE INDEX idx_tickets_event ON tickets (event_id);
 CREATE INDEX idx_tickets_code  ON tickets (code);
 
+-- ============================================================
+-- TABLA: idempotency_keys (reintentos seguros de compra)
+-- ============================================================
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+    user_id       INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    idem_key      VARCHAR(255) NOT NULL,
+    endpoint      VARCHAR(255) NOT NULL,
+    request_hash  CHAR(64) NOT NULL,
+    status_code   INTEGER,
+    response      JSONB,
+    created_at    TIMESTAMP NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (user_id, idem_key)
+);
+
+CREATE INDEX idx_idempotency_created ON idempotency_keys (created_at);
+
+-- ============================================================
+-- TABLA: refresh_tokens (renovación de sesión, rotativos)
+-- ============================================================
+CREATE TABLE IF NOT EXISTS refresh_tokens (
+    id          SERIAL PRIMARY KEY,
+    user_id     INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    token_hash  CHAR(64) UNIQUE NOT NULL,
+    family_id   VARCHAR(32) NOT NULL,
+    expires_at  TIMESTAMP NOT NULL,
+    revoked_at  TIMESTAMP,
+    created_at  TIMESTAMP NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX idx_refresh_family  ON refresh_tokens (family_id);
+CREATE INDEX idx_refresh_expires ON refresh_tokens (expires_at);
+
 -- ============================================================
 -- TABLA: audit_log (registro de auditoría)
 -- ============================================================
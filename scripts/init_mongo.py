@@ -20,6 +20,9 @@ from dotenv import load_dotenv
 # Cargar .env del proyecto
 load_dotenv(os.path.join(os.path.dirname(__file__), '..', '.env'))
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'services', 'events'))
+from seat_store import make_store  # noqa: E402
+
 POSTGRES_HOST = os.environ.get('POSTGRES_HOST', 'localhost')
 POSTGRES_PORT = int(os.environ.get('POSTGRES_PORT', 5432))
 POSTGRES_DB   = os.environ.get('POSTGRES_DB', 'teatro')
@@ -28,6 +31,7 @@ POSTGRES_PASS = os.environ.get('POSTGRES_PASS', 'teatro123')
 
 MONGO_URI = os.environ.get('MONGO_URI', 'mongodb://localhost:27017')
 MONGO_DB  = os.environ.get('MONGO_DB', 'teatro')
+SEAT_STORE = os.environ.get('SEAT_STORE', 'embedded')
 
 ADMIN_EMAIL    = 'admin@teatro.com'
 ADMIN_PASSWORD = 'Admin123!'
@@ -65,8 +69,8 @@ def init_seat_maps():
     )
 
     client = MongoClient(MONGO_URI)
-    db = client[MONGO_DB]
-    seat_maps = db['seat_maps']
+    store = make_store(client[MONGO_DB], SEAT_STORE)
+    store.ensure_indexes()
 
     with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
         cur.execute("""
@@ -77,30 +81,16 @@ def init_seat_maps():
         events = cur.fetchall()
 
     for event in events:
-        existing = seat_maps.find_one({'event_id': event['event_id']})
+        existing = store.maps.find_one({'event_id': event['event_id']})
         if existing:
             print(f"   ⏭️  Evento {event['event_id']} ({event['title']}) ya tiene mapa.")
             continue
 
-        seats = {}
-        for r in range(event['rows_count']):
-            row_letter = chr(65 + r)
-            for c in range(1, event['cols_count'] + 1):
-                seat_id = f"{row_letter}{c}"
-                seats[seat_id] = {
-                    'status': 'FREE',
-                    'zone': 'GENERAL',
-                    'held_by': None,
-                    'hold_until': None
-                }
-
-        seat_maps.insert_one({
-            'event_id': event['event_id'],
-            'venue_id': event['venue_id'],
-            'venue_name': event['venue_name'],
-            'rows': event['rows_count'],
-            'cols': event['cols_count'],
-            'seats': seats
+        store.create_map(event['event_id'], {
+            'id': event['venue_id'],
+            'name': event['venue_name'],
+            'rows_count': event['rows_count'],
+            'cols_count': event['cols_count']
         })
         total = event['rows_count'] * event['cols_count']
         print(f"   ✅ Evento {event['event_id']} ({event['title']}): {total} asientos creados.")
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+migrate_seats.py — Migra los mapas de asientos del formato embebido
+(un documento por evento con el sub-dict `seats`) al formato por asiento
+(colección `seats`, un documento por asiento).
+
+Después de migrar, arrancar el Events Service con SEAT_STORE=per_seat.
+Es idempotente: los mapas ya migrados se omiten.
+
+Uso:
+    python3 scripts/migrate_seats.py [--dry-run]
+"""
+
+import os
+import sys
+from pymongo import MongoClient
+from pymongo.errors import BulkWriteError
+from dotenv import load_dotenv
+
+# Cargar .env del proyecto
+load_dotenv(os.path.join(os.path.dirname(__file__), '..', '.env'))
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'services', 'events'))
+from seat_store import PerSeatStore  # noqa: E402
+
+MONGO_URI = os.environ.get('MONGO_URI', 'mongodb://localhost:27017')
+MONGO_DB  = os.environ.get('MONGO_DB', 'teatro')
+
+
+def migrate(dry_run=False):
+    print("🪑 Migrando mapas de asientos al formato por asiento...")
+
+    client = MongoClient(MONGO_URI)
+    store = PerSeatStore(client[MONGO_DB])
+    if not dry_run:
+        store.ensure_indexes()
+
+    migrated = 0
+    for doc in store.maps.find({'seats': {'$exists': True}}):
+        event_id = doc['event_id']
+        seat_docs = list(PerSeatStore.seat_docs(event_id, doc['rows'], doc['cols'], doc['seats']))
+
+        if dry_run:
+            print(f"   🔎 Evento {event_id}: {len(seat_docs)} asientos por migrar.")
+            continue
+
+        try:
+            store.seats.insert_many(seat_docs, ordered=False)
+        except BulkWriteError as e:
+            # Reintento tras una migración interrumpida: los asientos ya
+            # insertados chocan con el índice único y se ignoran.
+            if any(err['code'] != 11000 for err in e.details.get('writeErrors', [])):
+                raise
+
+        store.maps.update_one(
+            {'_id': doc['_id']},
+            {'$unset': {'seats': ''}, '$set': {'layout': 'per_seat'}}
+        )
+        migrated += 1
+        print(f"   ✅ Evento {event_id}: {len(seat_docs)} asientos migrados.")
+
+    client.close()
+    print(f"   {migrated} mapa(s) migrado(s).")
+
+
+if __name__ == '__main__':
+    try:
+        migrate(dry_run='--dry-run' in sys.argv[1:])
+        print("\n🎉 Migración completada. Usa SEAT_STORE=per_seat en el .env.")
+    except Exception as e:
+        print(f"\n❌ Error: {e}", file=sys.stderr)
+        sys.exit(1)
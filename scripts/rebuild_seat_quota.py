@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+rebuild_seat_quota.py — Reconstruye la colección `seat_quota` (cupo de
+boletos por usuario) a partir de los mapas de asientos.
+
+Necesario una vez al actualizar una instalación con eventos en venta:
+los HOLDs y compras anteriores al cupo no están contabilizados. También
+sirve para corregir un cupo si se editaron asientos a mano en Mongo.
+
+Uso:
+    python3 scripts/rebuild_seat_quota.py [--dry-run] [EVENT_ID ...]
+"""
+
+import os
+import sys
+import datetime
+from pymongo import MongoClient
+from dotenv import load_dotenv
+
+# Cargar .env del proyecto
+load_dotenv(os.path.join(os.path.dirname(__file__), '..', '.env'))
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'services', 'events'))
+from seat_store import SeatQuota, make_store  # noqa: E402
+
+MONGO_URI  = os.environ.get('MONGO_URI', 'mongodb://localhost:27017')
+MONGO_DB   = os.environ.get('MONGO_DB', 'teatro')
+SEAT_STORE = os.environ.get('SEAT_STORE', 'embedded')
+
+
+def rebuild(event_ids=None, dry_run=False):
+    print("🎫 Reconstruyendo cupos por usuario...")
+
+    client = MongoClient(MONGO_URI)
+    store = make_store(client[MONGO_DB], SEAT_STORE)
+    quota = SeatQuota(client[MONGO_DB])
+    if not dry_run:
+        quota.ensure_indexes()
+
+    if not event_ids:
+        event_ids = [doc['event_id'] for doc in store.maps.find({}, {'event_id': 1})]
+
+    now = datetime.datetime.utcnow()
+    for event_id in event_ids:
+        usage = store.usage_by_user(event_id, now)
+        seats = sum(u['sold'] + len(u['holds']) for u in usage.values())
+        if dry_run:
+            print(f"   🔎 Evento {event_id}: {len(usage)} usuario(s), {seats} asiento(s).")
+            continue
+        quota.rebuild(event_id, usage)
+        print(f"   ✅ Evento {event_id}: {len(usage)} usuario(s), {seats} asiento(s).")
+
+    client.close()
+
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    try:
+        rebuild(
+            event_ids=[int(a) for a in args if a != '--dry-run'],
+            dry_run='--dry-run' in args
+        )
+        print("\n🎉 Cupos reconstruidos.")
+    except Exception as e:
+        print(f"\n❌ Error: {e}", file=sys.stderr)
+        sys.exit(1)
@@ -31,12 +31,21 @@ if [ -z "$PYTHON" ]; then
     exit 1
 fi
 
+# gunicorn (modo producción) junto al Python elegido; si no está instalado,
+# o con FLASK_DEBUG=true, se usa el servidor de desarrollo de Flask
+GUNICORN="$(dirname "$PYTHON")/gunicorn"
+if [ ! -x "$GUNICORN" ] || [ "${FLASK_DEBUG:-false}" = "true" ]; then
+    GUNICORN=""
+fi
+
 echo "🐍 Usando: $PYTHON"
+[ -n "$GUNICORN" ] && echo "🦄 Servidor: $GUNICORN" || echo "🧪 Servidor: Flask (desarrollo)"
 echo "📁 Proyecto: $PROJECT_DIR"
 echo ""
 
 # Detener servicios anteriores si existen
 pkill -f 'services/.*/app\.py' 2>/dev/null || true
+pkill -f 'gunicorn_conf\.py' 2>/dev/null || true
 sleep 1
 
 # Función para iniciar un servicio
@@ -46,7 +55,15 @@ start_service() {
     local port="$3"
 
     echo "🚀 Iniciando $name en puerto $port..."
-    nohup "$PYTHON" "$PROJECT_DIR/$path" > "/tmp/teatro-${name}.log" 2>&1 &
+    if [ -n "$GUNICORN" ]; then
+        TEATRO_SERVICE="$name" nohup "$GUNICORN" \
+            -c "$PROJECT_DIR/services/common/gunicorn_conf.py" \
+            --chdir "$PROJECT_DIR/$(dirname "$path")" \
+            --pid "/tmp/teatro-${name}.pid" \
+            app:app > "/tmp/teatro-${name}.log" 2>&1 &
+    else
+        nohup "$PYTHON" "$PROJECT_DIR/$path" > "/tmp/teatro-${name}.log" 2>&1 &
+    fi
     echo "   PID: $! → log en /tmp/teatro-${name}.log"
 }
 
@@ -70,5 +87,10 @@ echo "  🎟️  Orders Service:   http://localhost:${ORDERS_PORT:-7002}"
 echo "  🌐 Web (Frontend):   http://localhost:${WEB_PORT:-8080}"
 echo ""
 echo "  Para ver los logs:   tail -f /tmp/teatro-*.log"
-echo "  Para detener todo:   pkill -f 'services/.*/app.py'"
+if [ -n "$GUNICORN" ]; then
+    echo "  Recargar sin cortes: kill -HUP \$(cat /tmp/teatro-<servicio>.pid)"
+    echo "  Para detener todo:   pkill -f gunicorn_conf.py"
+else
+    echo "  Para detener todo:   pkill -f 'services/.*/app.py'"
+fi
 echo "═══════════════════════════════════════════════════════"
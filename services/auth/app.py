@@ -1,98 +1,110 @@
 """
 Auth Service — Puerto 7000
-Maneja registro, login, verificación de token JWT.
-Base de datos: PostgreSQL (tabla users, audit_log)
+Maneja registro, login, renovación (refresh tokens) y verificación de token JWT.
+Base de datos: PostgreSQL (tablas users, refresh_tokens, audit_log)
 """
 
 import os
+import sys
 import datetime
+import hashlib
+import secrets
 import psycopg2
 import psycopg2.extras
-import bcrypt
 import jwt
 from flask import Flask, request, jsonify
-from functools import wraps
 from dotenv import load_dotenv
 
 load_dotenv(os.path.join(os.path.dirname(__file__), '..', '..', '.env'))
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common import audit, db, metrics  # noqa: E402
+from common.auth import token_required  # noqa: E402
+import passwords  # noqa: E402
+from throttle import LoginThrottle  # noqa: E402
+
 app = Flask(__name__)
 
 SECRET_KEY = os.environ.get('JWT_SECRET', 'super-secret-key-change-me')
+ACCESS_TOKEN_MINUTES = int(os.environ.get('ACCESS_TOKEN_MINUTES', 15))
+REFRESH_TOKEN_DAYS = int(os.environ.get('REFRESH_TOKEN_DAYS', 30))
+# Un refresh token ya rotado que se reusa dentro de este margen se asume
+# una carrera del propio gateway (dos peticiones a la vez), no un robo
+REFRESH_REUSE_GRACE = int(os.environ.get('REFRESH_REUSE_GRACE', 10))
 
 
-# ── Conexión a PostgreSQL ──────────────────────────────────────
-def get_db():
-    return psycopg2.connect(
-        host=os.environ.get('POSTGRES_HOST', 'localhost'),
-        port=int(os.environ.get('POSTGRES_PORT', 5432)),
-        database=os.environ.get('POSTGRES_DB', 'teatro'),
-        user=os.environ.get('POSTGRES_USER', 'teatro'),
-        password=os.environ.get('POSTGRES_PASS', 'teatro123')
-    )
-
-
-# ── Decoradores de autenticación ──────────────────────────────
-def token_required(f):
-    @wraps(f)
-    def decorated(*args, **kwargs):
-        token = request.headers.get('Authorization', '').replace('Bearer ', '')
-        if not token:
-            return jsonify({'error': 'Token requerido'}), 401
-        try:
-            data = jwt.decode(token, SECRET_KEY, algorithms=['HS256'])
-            request.user_id = data['user_id']
-            request.user_role = data['role']
-            request.user_email = data['email']
-        except jwt.ExpiredSignatureError:
-            return jsonify({'error': 'Token expirado'}), 401
-        except jwt.InvalidTokenError:
-            return jsonify({'error': 'Token inválido'}), 401
-        return f(*args, **kwargs)
-    return decorated
-
-
-def admin_required(f):
-    @wraps(f)
-    def decorated(*args, **kwargs):
-        token = request.headers.get('Authorization', '').replace('Bearer ', '')
-        if not token:
-            return jsonify({'error': 'Token requerido'}), 401
-        try:
-            data = jwt.decode(token, SECRET_KEY, algorithms=['HS256'])
-            if data['role'] != 'ADMIN':
-                return jsonify({'error': 'Acceso denegado: se requiere rol ADMIN'}), 403
-            request.user_id = data['user_id']
-            request.user_role = data['role']
-            request.user_email = data['email']
-        except jwt.ExpiredSignatureError:
-            return jsonify({'error': 'Token expirado'}), 401
-        except jwt.InvalidTokenError:
-            return jsonify({'error': 'Token inválido'}), 401
-        return f(*args, **kwargs)
-    return decorated
+# ── Conexión a PostgreSQL (pool compartido) ───────────────────
+get_db = db.get_db
+db.init_app(app)
+metrics.init_app(app)
+
+
+# ── Límite de intentos de login ───────────────────────────────
+login_throttle = LoginThrottle(
+    max_per_email=int(os.environ.get('LOGIN_MAX_FAILURES_EMAIL', 5)),
+    max_per_ip=int(os.environ.get('LOGIN_MAX_FAILURES_IP', 20)),
+    window=int(os.environ.get('LOGIN_THROTTLE_WINDOW', 300))
+)
+TRUSTED_PROXIES = {ip.strip() for ip in os.environ.get('TRUSTED_PROXIES', '127.0.0.1,::1').split(',') if ip.strip()}
 
 
 # ── Utilidades ─────────────────────────────────────────────────
+def client_ip():
+    """IP del usuario: el gateway la envía en X-Forwarded-For."""
+    ip = request.remote_addr or ''
+    forwarded = request.headers.get('X-Forwarded-For', '')
+    if forwarded and ip in TRUSTED_PROXIES:
+        return forwarded.split(',')[0].strip()
+    return ip
+
+
+def busy_response():
+    resp = jsonify({'error': 'Servicio ocupado, intenta de nuevo en unos segundos'})
+    resp.headers['Retry-After'] = '1'
+    return resp, 503
+
+
 def make_token(user):
-    """Genera un JWT con expiración de 24 h."""
+    """Genera el JWT de acceso (vida corta: ACCESS_TOKEN_MINUTES)."""
     return jwt.encode({
         'user_id': user['id'],
         'email': user['email'],
         'name': user['name'],
         'role': user['role'],
-        'exp': datetime.datetime.utcnow() + datetime.timedelta(hours=24)
+        'exp': datetime.datetime.utcnow() + datetime.timedelta(minutes=ACCESS_TOKEN_MINUTES)
     }, SECRET_KEY, algorithm='HS256')
 
 
-def audit(conn, user_id, action, detail=''):
-    with conn.cursor() as cur:
-        ip = request.remote_addr or ''
-        cur.execute(
-            "INSERT INTO audit_log (user_id, action, detail, ip_address) VALUES (%s,%s,%s,%s)",
-            (user_id, action, detail, ip)
-        )
-    conn.commit()
+def _token_hash(raw):
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def issue_refresh_token(cur, user_id, family_id=None):
+    """
+    Crea un refresh token y devuelve su valor. En la base solo queda el
+    sha256. Los tokens que salen de una misma sesión (rotaciones) comparten
+    `family_id`.
+    """
+    raw = secrets.token_urlsafe(32)
+    cur.execute("""
+        INSERT INTO refresh_tokens (user_id, token_hash, family_id, expires_at)
+        VALUES (%s, %s, %s, NOW() + make_interval(days => %s))
+    """, (user_id, _token_hash(raw), family_id or secrets.token_hex(16), REFRESH_TOKEN_DAYS))
+    return raw
+
+
+def token_response(user, refresh_token):
+    return {
+        'token': make_token(user),
+        'refresh_token': refresh_token,
+        'expires_in': ACCESS_TOKEN_MINUTES * 60,
+        'user': {
+            'id': user['id'],
+            'email': user['email'],
+            'name': user['name'],
+            'role': user['role']
+        }
+    }
 
 
 # ── Endpoints ──────────────────────────────────────────────────
@@ -109,7 +121,10 @@ def register():
     if len(password) < 6:
         return jsonify({'error': 'La contraseña debe tener al menos 6 caracteres'}), 400
 
-    password_hash = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(12)).decode('utf-8')
+    try:
+        password_hash = passwords.hash_password(password)
+    except passwords.Busy:
+        return busy_response()
 
     conn = get_db()
     try:
@@ -120,11 +135,11 @@ def register():
                 (email, password_hash, name)
             )
             user = cur.fetchone()
+            refresh_token = issue_refresh_token(cur, user['id'])
             conn.commit()
 
-        audit(conn, user['id'], 'REGISTER', f'Registro: {email}')
-        token = make_token(user)
-        return jsonify({'token': token, 'user': dict(user)}), 201
+        audit.log(user['id'], 'REGISTER', f'Registro: {email}', ip=client_ip())
+        return jsonify(token_response(user, refresh_token)), 201
 
     except psycopg2.errors.UniqueViolation:
         conn.rollback()
@@ -138,33 +153,136 @@ def login():
     data = request.get_json() or {}
     email = data.get('email', '').strip().lower()
     password = data.get('password', '')
+    ip = client_ip()
+
+    # Bloqueado por demasiados fallos: ni base de datos ni bcrypt
+    wait = login_throttle.retry_after(email, ip)
+    if wait:
+        resp = jsonify({'error': 'Demasiados intentos fallidos. Intenta más tarde.'})
+        resp.headers['Retry-After'] = str(wait)
+        return resp, 429
 
     conn = get_db()
     try:
         with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
             cur.execute("SELECT * FROM users WHERE email = %s AND enabled = true", (email,))
             user = cur.fetchone()
+    finally:
+        conn.close()
 
-        if not user:
-            return jsonify({'error': 'Credenciales inválidas'}), 401
-
-        if not bcrypt.checkpw(password.encode('utf-8'), user['password_hash'].encode('utf-8')):
-            return jsonify({'error': 'Credenciales inválidas'}), 401
-
-        audit(conn, user['id'], 'LOGIN', f'Inicio de sesión: {email}')
-        token = make_token(user)
-        return jsonify({
-            'token': token,
-            'user': {
-                'id': user['id'],
-                'email': user['email'],
-                'name': user['name'],
-                'role': user['role']
-            }
-        })
+    if not user:
+        login_throttle.failure(email, ip)
+        return jsonify({'error': 'Credenciales inválidas'}), 401
+
+    # La conexión ya se devolvió al pool: bcrypt puede tardar
+    try:
+        valid = passwords.check_password(password, user['password_hash'])
+    except passwords.Busy:
+        return busy_response()
+    if not valid:
+        login_throttle.failure(email, ip)
+        return jsonify({'error': 'Credenciales inválidas'}), 401
+    login_throttle.success(email)
+
+    # Costo de bcrypt cambiado (BCRYPT_ROUNDS): regenerar el hash ahora que
+    # se conoce la contraseña. Si el pool está ocupado, será en otro login.
+    new_hash = None
+    if passwords.needs_rehash(user['password_hash']):
+        try:
+            new_hash = passwords.hash_password(password)
+        except passwords.Busy:
+            pass
+
+    conn = get_db()
+    try:
+        with conn.cursor() as cur:
+            if new_hash:
+                cur.execute("UPDATE users SET password_hash = %s WHERE id = %s", (new_hash, user['id']))
+            refresh_token = issue_refresh_token(cur, user['id'])
+        conn.commit()
+    finally:
+        conn.close()
+
+    audit.log(user['id'], 'LOGIN', f'Inicio de sesión: {email}', ip=ip)
+    return jsonify(token_response(user, refresh_token))
+
+
+@app.route('/api/auth/refresh', methods=['POST'])
+def refresh():
+    """
+    Cambia un refresh token por un access token nuevo y otro refresh token
+    (rotación). Sin bcrypt: una búsqueda por índice y un INSERT.
+    Body: { "refresh_token": "..." }
+
+    Reusar un refresh token ya rotado indica que pudo ser robado: se
+    revoca toda su familia y el usuario debe volver a iniciar sesión.
+    """
+    raw = (request.get_json() or {}).get('refresh_token', '')
+    if not raw:
+        return jsonify({'error': 'refresh_token es requerido'}), 400
+    token_hash = _token_hash(raw)
+
+    conn = get_db()
+    try:
+        with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+            # Rotar: marcar el token como usado solo si sigue vigente
+            cur.execute("""
+                WITH used AS (
+                    UPDATE refresh_tokens SET revoked_at = NOW()
+                    WHERE token_hash = %s AND revoked_at IS NULL AND expires_at > NOW()
+                      AND user_id IN (SELECT id FROM users WHERE enabled = true)
+                    RETURNING user_id, family_id
+                )
+                SELECT u.id, u.email, u.name, u.role, used.family_id
+                FROM used JOIN users u ON u.id = used.user_id
+            """, (token_hash,))
+            user = cur.fetchone()
+            if user:
+                refresh_token = issue_refresh_token(cur, user['id'], user['family_id'])
+                conn.commit()
+                return jsonify(token_response(user, refresh_token))
+
+            cur.execute("""
+                SELECT user_id, family_id, revoked_at > NOW() - make_interval(secs => %s) AS recent
+                FROM refresh_tokens WHERE token_hash = %s AND revoked_at IS NOT NULL
+            """, (REFRESH_REUSE_GRACE, token_hash))
+            reused = cur.fetchone()
+            if reused and reused['recent']:
+                conn.commit()
+                return jsonify({'error': 'Refresh token ya renovado'}), 409
+            if reused:
+                cur.execute("""
+                    UPDATE refresh_tokens SET revoked_at = NOW()
+                    WHERE family_id = %s AND revoked_at IS NULL
+                """, (reused['family_id'],))
+            conn.commit()
     finally:
         conn.close()
 
+    if reused:
+        audit.log(reused['user_id'], 'REFRESH_REUSE', 'Refresh token reutilizado; sesión revocada',
+                  ip=client_ip())
+    return jsonify({'error': 'Refresh token inválido o expirado'}), 401
+
+
+@app.route('/api/auth/logout', methods=['POST'])
+def logout():
+    """Revoca la sesión del refresh token (él y sus rotaciones). Body: { "refresh_token": "..." }"""
+    raw = (request.get_json() or {}).get('refresh_token', '')
+    if raw:
+        conn = get_db()
+        try:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    UPDATE refresh_tokens SET revoked_at = NOW()
+                    WHERE family_id = (SELECT family_id FROM refresh_tokens WHERE token_hash = %s)
+                      AND revoked_at IS NULL
+                """, (_token_hash(raw),))
+            conn.commit()
+        finally:
+            conn.close()
+    return jsonify({'message': 'Sesión cerrada'})
+
 
 @app.route('/api/auth/me', methods=['GET'])
 @token_required
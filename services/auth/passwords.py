@@ -0,0 +1,120 @@
+"""
+Hash y verificación de contraseñas (bcrypt) fuera del hilo de la petición.
+
+bcrypt consume ~250 ms de CPU por llamada con costo 12. Se ejecuta en un
+pool de procesos acotado (BCRYPT_WORKERS) para que una ráfaga de logins
+no deje sin CPU al resto de peticiones del proceso. Si ya hay
+BCRYPT_MAX_PENDING operaciones en el pool (en espera o corriendo, aunque
+quien las pidió ya haya desistido), o una no termina en
+BCRYPT_TIMEOUT segundos, se lanza `Busy` y el endpoint responde 503 de
+inmediato en lugar de seguir encolando trabajo.
+
+El costo se configura con BCRYPT_ROUNDS; los hashes con otro costo se
+regeneran en el siguiente login correcto (`needs_rehash`).
+"""
+
+import os
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+import bcrypt
+
+from common import metrics
+
+ROUNDS = int(os.environ.get('BCRYPT_ROUNDS', 12))
+WORKERS = int(os.environ.get('BCRYPT_WORKERS', 2))
+MAX_PENDING = int(os.environ.get('BCRYPT_MAX_PENDING', WORKERS * 8))
+TIMEOUT = float(os.environ.get('BCRYPT_TIMEOUT', 5))
+
+
+class Busy(Exception):
+    """El pool de bcrypt está saturado; reintentar más tarde."""
+    pass
+
+
+# ── Funciones que corren en los procesos del pool ──────────────
+def _hash(password, rounds):
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds)).decode('utf-8')
+
+
+def _check(password, hashed):
+    return bcrypt.checkpw(password, hashed)
+
+
+# ── Pool por proceso ───────────────────────────────────────────
+# Se crea en el primer uso de cada worker de gunicorn. Contexto `spawn`:
+# un fork desde un proceso con hilos puede heredar locks tomados.
+_pool = None
+_pool_pid = None
+_lock = threading.Lock()
+_pending = 0
+_stats = {'completed': 0, 'rejected': 0, 'timeouts': 0}
+
+
+def _get_pool():
+    global _pool, _pool_pid
+    if _pool is None or _pool_pid != os.getpid():
+        with _lock:
+            if _pool is None or _pool_pid != os.getpid():
+                _pool = ProcessPoolExecutor(max_workers=WORKERS,
+                                            mp_context=multiprocessing.get_context('spawn'))
+                _pool_pid = os.getpid()
+    return _pool
+
+
+def _release(_future):
+    global _pending
+    with _lock:
+        _pending -= 1
+
+
+def _run(fn, *args):
+    global _pending
+    with _lock:
+        if _pending >= MAX_PENDING:
+            _stats['rejected'] += 1
+            raise Busy()
+        _pending += 1
+    try:
+        future = _get_pool().submit(fn, *args)
+    except Exception:
+        _release(None)
+        raise
+    # Se descuenta cuando la tarea termina de verdad: tras un timeout,
+    # cancel() no detiene un bcrypt que ya corre y ese trabajo sigue
+    # ocupando el pool
+    future.add_done_callback(_release)
+    try:
+        result = future.result(timeout=TIMEOUT)
+    except FutureTimeout:
+        future.cancel()
+        _stats['timeouts'] += 1
+        raise Busy()
+    _stats['completed'] += 1
+    return result
+
+
+def hash_password(password):
+    return _run(_hash, password.encode('utf-8'), ROUNDS)
+
+
+def check_password(password, hashed):
+    return _run(_check, password.encode('utf-8'), hashed.encode('utf-8'))
+
+
+def needs_rehash(hashed):
+    """True si el hash ($2b$<costo>$...) no usa el costo configurado."""
+    try:
+        return int(hashed.split('$')[2]) != ROUNDS
+    except (IndexError, ValueError):
+        return True
+
+
+def _pool_stats():
+    data = dict(_stats)
+    data.update({'pending': _pending, 'max_pending': MAX_PENDING,
+                 'workers': WORKERS, 'rounds': ROUNDS})
+    return data
+
+
+metrics.register('bcrypt', _pool_stats)
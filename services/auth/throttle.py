@@ -0,0 +1,71 @@
+"""
+Límite de intentos fallidos de login por email y por IP.
+
+Se cuentan los fallos en una ventana fija de LOGIN_THROTTLE_WINDOW
+segundos. Al llegar al máximo, los intentos siguientes de ese email o esa
+IP se rechazan (429) sin consultar la base ni ejecutar bcrypt, hasta que
+termine la ventana. Un login correcto borra los fallos del email.
+
+Los contadores son por proceso, igual que las cachés (common/cache.py):
+con varios workers el límite efectivo es el máximo × workers.
+"""
+
+import time
+import threading
+from collections import OrderedDict
+
+from common import metrics
+
+
+class LoginThrottle:
+
+    def __init__(self, max_per_email, max_per_ip, window, maxsize=100000):
+        self.max_per_email = max_per_email
+        self.max_per_ip = max_per_ip
+        self.window = window
+        self.maxsize = maxsize
+        self._failures = OrderedDict()     # ('email'|'ip', valor) → (fin de ventana, fallos)
+        self._lock = threading.Lock()
+        self._stats = {'blocked': 0, 'failures': 0}
+        metrics.register('login_throttle', self.stats)
+
+    def _count(self, key, now):
+        item = self._failures.get(key)
+        if item is None or item[0] <= now:
+            return None, 0
+        return item
+
+    def retry_after(self, email, ip):
+        """Segundos hasta poder intentar de nuevo, o 0 si no está bloqueado."""
+        now = time.monotonic()
+        wait = 0
+        with self._lock:
+            for key, limit in ((('email', email), self.max_per_email), (('ip', ip), self.max_per_ip)):
+                ends, count = self._count(key, now)
+                if count >= limit:
+                    wait = max(wait, ends - now)
+            if wait:
+                self._stats['blocked'] += 1
+        return int(wait) + 1 if wait else 0
+
+    def failure(self, email, ip):
+        now = time.monotonic()
+        with self._lock:
+            self._stats['failures'] += 1
+            for key in (('email', email), ('ip', ip)):
+                ends, count = self._count(key, now)
+                self._failures[key] = (ends or now + self.window, count + 1)
+                self._failures.move_to_end(key)
+            while len(self._failures) > self.maxsize:
+                self._failures.popitem(last=False)
+
+    def success(self, email):
+        with self._lock:
+            self._failures.pop(('email', email), None)
+
+    def stats(self):
+        with self._lock:
+            data = dict(self._stats)
+            data.update({'tracked': len(self._failures), 'window': self.window,
+                         'max_per_email': self.max_per_email, 'max_per_ip': self.max_per_ip})
+        return data
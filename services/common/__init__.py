@@ -0,0 +1,6 @@
+"""
+Módulos compartidos por los microservicios del teatro.
+
+Cada servicio agrega `services/` al sys.path y los importa como
+`from common import db`.
+"""
@@ -0,0 +1,62 @@
+"""
+Tokens de admisión de la sala de espera.
+
+El gateway (waiting_room.py) emite un JWT firmado cuando a un comprador le
+toca el turno; el Events Service lo exige en `hold_seats` (cabecera
+`X-Admission-Token`) mientras WAITING_ROOM_ENABLED=true. El token vale
+para un evento y un usuario, y vence a los WAITING_ROOM_TOKEN_TTL segundos.
+
+Configuración (.env), leída en cada llamada porque el gateway carga .env
+después de importar `common`:
+    WAITING_ROOM_ENABLED    activa la sala de espera (false)
+    ADMISSION_SECRET        clave de firma (por defecto JWT_SECRET)
+    WAITING_ROOM_TOKEN_TTL  segundos de validez de la admisión (900)
+"""
+
+import os
+import time
+import datetime
+import jwt
+
+
+def enabled():
+    return os.environ.get('WAITING_ROOM_ENABLED', 'false').lower() == 'true'
+
+
+def _secret():
+    return os.environ.get('ADMISSION_SECRET') or os.environ.get('JWT_SECRET', 'super-secret-key-change-me')
+
+
+def token_ttl():
+    return int(os.environ.get('WAITING_ROOM_TOKEN_TTL', 900))
+
+
+def issue(event_id, user_id):
+    return jwt.encode({
+        'typ': 'admission',
+        'event_id': int(event_id),
+        'user_id': user_id,
+        'exp': datetime.datetime.utcnow() + datetime.timedelta(seconds=token_ttl())
+    }, _secret(), algorithm='HS256')
+
+
+def verify(token, event_id, user_id):
+    """True si el token admite a `user_id` en `event_id` y no venció."""
+    if not token:
+        return False
+    try:
+        claims = jwt.decode(token, _secret(), algorithms=['HS256'])
+    except jwt.InvalidTokenError:
+        return False
+    return (claims.get('typ') == 'admission'
+            and claims.get('event_id') == int(event_id)
+            and claims.get('user_id') == user_id)
+
+
+def seconds_left(token):
+    """Segundos de validez que le quedan a un token ya emitido (0 si no sirve)."""
+    try:
+        claims = jwt.decode(token, _secret(), algorithms=['HS256'])
+    except jwt.InvalidTokenError:
+        return 0
+    return max(0, int(claims['exp'] - time.time()))
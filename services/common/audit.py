@@ -0,0 +1,137 @@
+"""
+Registro de auditoría asíncrono y por lotes (tabla audit_log).
+
+`audit.log(...)` solo encola el registro; un hilo por proceso lo escribe
+junto con los demás pendientes en un único INSERT de varias filas, cada
+AUDIT_FLUSH_INTERVAL segundos o al juntar AUDIT_BATCH_SIZE registros. Así
+auditar no agrega un viaje a la base de datos a holds, logins ni compras.
+
+- La cola es acotada (AUDIT_QUEUE_SIZE): si se llena, el registro se
+  descarta y se cuenta en `dropped` en vez de frenar la petición.
+- Un lote que falla al escribirse se descarta y se cuenta en `failed`.
+- Lo pendiente se escribe al terminar el proceso (atexit y worker_exit
+  de gunicorn): flush() detiene el hilo escritor, espera a que escriba el
+  lote que tiene en curso y luego vacía la cola.
+
+Contadores en /internal/metrics como `audit`.
+"""
+
+import os
+import time
+import queue
+import atexit
+import threading
+import psycopg2.extras
+from flask import has_request_context, request
+
+from common import db, metrics
+
+_queue = queue.Queue(maxsize=int(os.environ.get('AUDIT_QUEUE_SIZE', 10000)))
+_BATCH_SIZE = int(os.environ.get('AUDIT_BATCH_SIZE', 200))
+_FLUSH_INTERVAL = float(os.environ.get('AUDIT_FLUSH_INTERVAL', 1))
+
+_stats = {'queued': 0, 'written': 0, 'dropped': 0, 'failed': 0, 'batches': 0}
+_write_lock = threading.Lock()
+
+# ── Hilo escritor por proceso ──────────────────────────────────
+# Se arranca en el primer log() de cada proceso (después del fork de gunicorn).
+_writer_pid = None
+_writer_thread = None
+_writer_lock = threading.Lock()
+_stop = threading.Event()
+
+
+def log(user_id, action, detail='', ip=None):
+    """Encola un registro de auditoría. No bloquea ni lanza excepciones."""
+    if ip is None:
+        ip = (request.remote_addr or '') if has_request_context() else ''
+    _ensure_writer()
+    try:
+        _queue.put_nowait((user_id, action, detail, ip))
+        _stats['queued'] += 1
+    except queue.Full:
+        _stats['dropped'] += 1
+
+
+def _ensure_writer():
+    global _writer_pid, _writer_thread
+    if _writer_pid == os.getpid() or _stop.is_set():
+        return
+    with _writer_lock:
+        if _writer_pid != os.getpid():
+            _writer_thread = threading.Thread(target=_writer_loop, name='audit-writer', daemon=True)
+            _writer_thread.start()
+            _writer_pid = os.getpid()
+
+
+def _drain(limit):
+    rows = []
+    while len(rows) < limit:
+        try:
+            rows.append(_queue.get_nowait())
+        except queue.Empty:
+            break
+    return rows
+
+
+def _write(rows):
+    with _write_lock:
+        try:
+            conn = db.get_db()
+            try:
+                with conn.cursor() as cur:
+                    psycopg2.extras.execute_values(
+                        cur,
+                        "INSERT INTO audit_log (user_id, action, detail, ip_address) VALUES %s",
+                        rows, page_size=len(rows)
+                    )
+                conn.commit()
+            finally:
+                conn.close()
+            _stats['written'] += len(rows)
+            _stats['batches'] += 1
+        except Exception as e:
+            _stats['failed'] += len(rows)
+            print(f"[AUDIT] Error escribiendo {len(rows)} registros: {e}")
+
+
+def _writer_loop():
+    while not _stop.is_set():
+        try:
+            first = _queue.get(timeout=_FLUSH_INTERVAL)
+        except queue.Empty:
+            continue
+        # Esperar un poco a que se junte un lote, sin pasar del intervalo
+        # (al detenerse se escribe de inmediato lo ya juntado)
+        deadline = time.monotonic() + _FLUSH_INTERVAL
+        rows = [first] + _drain(_BATCH_SIZE - 1)
+        while len(rows) < _BATCH_SIZE and time.monotonic() < deadline and not _stop.wait(0.05):
+            rows += _drain(_BATCH_SIZE - len(rows))
+        _write(rows)
+
+
+def flush():
+    """
+    Escribe de inmediato todo lo pendiente (al terminar el proceso): detiene
+    el hilo escritor, espera a que escriba su lote en curso y vacía la cola.
+    """
+    _stop.set()
+    writer = _writer_thread
+    if writer is not None and _writer_pid == os.getpid() and writer is not threading.current_thread():
+        writer.join(timeout=_FLUSH_INTERVAL + 10)
+    while True:
+        rows = _drain(_BATCH_SIZE)
+        if not rows:
+            return
+        _write(rows)
+
+
+def _queue_stats():
+    data = dict(_stats)
+    data['pending'] = _queue.qsize()
+    data['queue_size'] = _queue.maxsize
+    return data
+
+
+atexit.register(flush)
+metrics.register('audit', _queue_stats)
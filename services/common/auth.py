@@ -0,0 +1,113 @@
+"""
+Verificación de JWT compartida por los servicios.
+
+Los claims de un token ya verificado se guardan en una caché LRU (clave:
+sha256 del token) hasta su `exp`, como máximo TOKEN_CACHE_TTL segundos.
+Las peticiones siguientes con el mismo token se resuelven sin repetir la
+firma HMAC ni el parseo del JSON. Solo se guardan tokens válidos.
+
+Decoradores para los endpoints de API (token en `Authorization: Bearer`):
+
+    @auth.token_required   → 401 sin token o con token inválido/expirado
+    @auth.admin_required   → además 403 si el rol no es ADMIN
+
+Ambos dejan en `request`: user_id, user_role, user_email y token_raw.
+
+Configuración (.env):
+    JWT_SECRET        clave de firma
+    TOKEN_CACHE_SIZE  tokens verificados en memoria por proceso (4096)
+    TOKEN_CACHE_TTL   segundos máximos que se reutiliza una verificación (300)
+"""
+
+import os
+import time
+import hashlib
+from functools import wraps
+import jwt
+from flask import request, jsonify
+
+from common import cache
+
+token_cache = cache.TTLCache(
+    'tokens',
+    maxsize=int(os.environ.get('TOKEN_CACHE_SIZE', 4096)),
+    ttl=float(os.environ.get('TOKEN_CACHE_TTL', 300))
+)
+
+
+def decode(token):
+    """
+    Claims del token. Lanza jwt.ExpiredSignatureError / jwt.InvalidTokenError.
+    JWT_SECRET se lee en cada verificación porque algunos servicios cargan
+    .env después de importar este módulo.
+    """
+    key = hashlib.sha256(token.encode('utf-8')).hexdigest()
+    claims = token_cache.get(key)
+    if claims is not None:
+        # La entrada nunca dura más que el token, pero puede vencer en medio
+        if claims.get('exp', float('inf')) > time.time():
+            return claims
+        token_cache.invalidate(key)
+        raise jwt.ExpiredSignatureError('Signature has expired')
+
+    claims = jwt.decode(token, os.environ.get('JWT_SECRET', 'super-secret-key-change-me'),
+                        algorithms=['HS256'])
+    remaining = claims['exp'] - time.time() if 'exp' in claims else token_cache.ttl
+    if remaining > 0:
+        token_cache.set(key, claims, ttl=min(token_cache.ttl, remaining))
+    return claims
+
+
+def bearer_token():
+    return request.headers.get('Authorization', '').replace('Bearer ', '')
+
+
+def optional_claims():
+    """Claims del token de la petición, o None si no hay o no es válido."""
+    token = bearer_token()
+    if not token:
+        return None
+    try:
+        return decode(token)
+    except jwt.InvalidTokenError:
+        return None
+
+
+def _authenticate(admin):
+    """(None, None) si pasa; si no, la respuesta de error."""
+    token = bearer_token()
+    if not token:
+        return jsonify({'error': 'Token requerido'}), 401
+    try:
+        data = decode(token)
+    except jwt.ExpiredSignatureError:
+        return jsonify({'error': 'Token expirado'}), 401
+    except jwt.InvalidTokenError:
+        return jsonify({'error': 'Token inválido'}), 401
+    if admin and data['role'] != 'ADMIN':
+        return jsonify({'error': 'Acceso denegado: se requiere rol ADMIN'}), 403
+    request.user_id = data['user_id']
+    request.user_role = data['role']
+    request.user_email = data.get('email', '')
+    request.token_raw = token
+    return None, None
+
+
+def token_required(f):
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        error, code = _authenticate(admin=False)
+        if error is not None:
+            return error, code
+        return f(*args, **kwargs)
+    return decorated
+
+
+def admin_required(f):
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        error, code = _authenticate(admin=True)
+        if error is not None:
+            return error, code
+        return f(*args, **kwargs)
+    return decorated
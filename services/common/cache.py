@@ -0,0 +1,72 @@
+"""
+Caché en memoria con vencimiento (TTL) y tamaño máximo (LRU).
+
+Es por proceso: cada worker tiene la suya, así que un dato cambiado en
+otro proceso puede verse viejo hasta que venza el TTL. Quien modifica un
+dato invalida su clave en el proceso donde ocurre el cambio.
+
+Cada caché publica sus contadores en /internal/metrics como `cache.<nombre>`.
+"""
+
+import time
+import threading
+from collections import OrderedDict
+
+from common import metrics
+
+
+class TTLCache:
+
+    def __init__(self, name, maxsize=256, ttl=30.0):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()     # key → (vence, valor)
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0}
+        metrics.register(f'cache.{name}', self.stats)
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and item[0] > time.monotonic():
+                self._data.move_to_end(key)
+                self._stats['hits'] += 1
+                return item[1]
+            if item is not None:
+                del self._data[key]
+            self._stats['misses'] += 1
+            return default
+
+    def set(self, key, value, ttl=None):
+        """`ttl` reemplaza al de la caché para esta clave (p. ej. hasta el `exp` de un token)."""
+        with self._lock:
+            self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    def get_or_load(self, key, loader):
+        """Valor en caché o `loader()`. Un resultado None no se guarda."""
+        value = self.get(key)
+        if value is None:
+            value = loader()
+            if value is not None:
+                self.set(key, value)
+        return value
+
+    def invalidate(self, key=None):
+        """Quita una clave, o todas si no se indica."""
+        with self._lock:
+            if key is None:
+                self._data.clear()
+            else:
+                self._data.pop(key, None)
+            self._stats['invalidations'] += 1
+
+    def stats(self):
+        with self._lock:
+            data = dict(self._stats)
+            data.update({'size': len(self._data), 'maxsize': self.maxsize, 'ttl': self.ttl})
+        return data
@@ -0,0 +1,285 @@
+"""
+Pool compartido de conexiones PostgreSQL.
+
+Reemplaza el `psycopg2.connect()` por petición de cada servicio. Las
+conexiones se reutilizan entre peticiones, se verifican antes de
+entregarse si llevan tiempo inactivas y se devuelven al pool al llamar
+`conn.close()` (o al terminar la petición, si el handler lo olvidó).
+
+Configuración (.env):
+    PG_POOL_MIN          conexiones abiertas al crear el pool (1)
+    PG_POOL_MAX          máximo de conexiones por proceso (10)
+    PG_POOL_TIMEOUT      segundos de espera por una conexión libre (5)
+    PG_POOL_CHECK_IDLE   segundos de inactividad tras los que se hace
+                         `SELECT 1` antes de entregar la conexión (30)
+    PG_QUERY_COUNT       "true" para contar las sentencias SQL de cada
+                         petición y devolverlas en la cabecera
+                         `X-Query-Count` (verificación de N+1; false)
+"""
+
+import os
+import time
+import threading
+import psycopg2
+import psycopg2.extensions
+from flask import g, has_app_context, jsonify
+
+from common import metrics
+
+
+class PoolExhausted(Exception):
+    """No hubo conexión libre dentro de PG_POOL_TIMEOUT."""
+
+
+class PgPool:
+    def __init__(self, minconn, maxconn, timeout, check_idle, **dsn):
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.check_idle = check_idle
+        self._dsn = dsn
+        self._cond = threading.Condition()
+        self._idle = []          # [(conn, último uso)]
+        self._size = 0           # conexiones abiertas (libres + prestadas)
+        self._stats = {
+            'checkouts': 0,
+            'waits': 0,
+            'exhausted': 0,
+            'created': 0,
+            'discarded': 0,
+            'health_check_failures': 0,
+        }
+        for _ in range(minconn):
+            self._size += 1
+            self._stats['created'] += 1
+            self._idle.append((self._connect(), time.monotonic()))
+
+    def _connect(self):
+        return psycopg2.connect(**self._dsn)
+
+    def _healthy(self, conn, last_used):
+        if conn.closed:
+            return False
+        if time.monotonic() - last_used < self.check_idle:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+        with self._cond:
+            self._size -= 1
+            self._stats['discarded'] += 1
+            self._cond.notify()
+
+    def getconn(self):
+        deadline = time.monotonic() + self.timeout
+        waited = False
+        while True:
+            with self._cond:
+                while not self._idle and self._size >= self.maxconn:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats['exhausted'] += 1
+                        raise PoolExhausted(f'Sin conexiones libres ({self.maxconn} en uso)')
+                    if not waited:
+                        waited = True
+                        self._stats['waits'] += 1
+                    self._cond.wait(remaining)
+
+                if self._idle:
+                    conn, last_used = self._idle.pop()
+                else:
+                    conn, last_used = None, None
+                    self._size += 1
+
+            if conn is None:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+                with self._cond:
+                    self._stats['created'] += 1
+            elif not self._healthy(conn, last_used):
+                with self._cond:
+                    self._stats['health_check_failures'] += 1
+                self._discard(conn)
+                continue
+
+            with self._cond:
+                self._stats['checkouts'] += 1
+            return conn
+
+    def putconn(self, conn):
+        if conn.closed:
+            self._discard(conn)
+            return
+        try:
+            if conn.info.transaction_status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+            if conn.autocommit:
+                conn.autocommit = False
+        except psycopg2.Error:
+            self._discard(conn)
+            return
+        with self._cond:
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    def stats(self):
+        with self._cond:
+            data = dict(self._stats)
+            data.update({
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': self._size - len(self._idle),
+                'min': self.minconn,
+                'max': self.maxconn,
+            })
+        return data
+
+
+class _CountingCursor:
+    """Cursor que suma cada execute() al contador de la petición."""
+
+    def __init__(self, cur):
+        object.__setattr__(self, '_cur', cur)
+
+    def __getattr__(self, name):
+        return getattr(self._cur, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._cur, name, value)
+
+    def __enter__(self):
+        self._cur.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        return self._cur.__exit__(*exc)
+
+    def __iter__(self):
+        return iter(self._cur)
+
+    def execute(self, *args, **kwargs):
+        g._pg_queries = g.get('_pg_queries', 0) + 1
+        return self._cur.execute(*args, **kwargs)
+
+    def executemany(self, *args, **kwargs):
+        g._pg_queries = g.get('_pg_queries', 0) + 1
+        return self._cur.executemany(*args, **kwargs)
+
+
+class PooledConnection:
+    """
+    Envoltorio de una conexión prestada. Se comporta como la conexión de
+    psycopg2, pero `close()` la devuelve al pool en lugar de cerrarla.
+    """
+
+    def __init__(self, pool, conn):
+        object.__setattr__(self, '_pool', pool)
+        object.__setattr__(self, '_conn', conn)
+
+    def __getattr__(self, name):
+        conn = object.__getattribute__(self, '_conn')
+        if conn is None:
+            raise psycopg2.InterfaceError('La conexión ya fue devuelta al pool')
+        return getattr(conn, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._conn, name, value)
+
+    def cursor(self, *args, **kwargs):
+        cur = self.__getattr__('cursor')(*args, **kwargs)
+        if _COUNT_QUERIES and has_app_context():
+            return _CountingCursor(cur)
+        return cur
+
+    def close(self):
+        conn = self._conn
+        if conn is None:
+            return
+        object.__setattr__(self, '_conn', None)
+        self._pool.putconn(conn)
+
+    @property
+    def closed(self):
+        return self._conn is None or self._conn.closed
+
+
+# ── Pool por proceso ───────────────────────────────────────────
+# Se crea en el primer uso para que cada worker (tras el fork) tenga
+# sus propias conexiones.
+_pool = None
+_pool_lock = threading.Lock()
+
+_COUNT_QUERIES = os.environ.get('PG_QUERY_COUNT', 'false').lower() == 'true'
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = PgPool(
+                    minconn=int(os.environ.get('PG_POOL_MIN', 1)),
+                    maxconn=int(os.environ.get('PG_POOL_MAX', 10)),
+                    timeout=float(os.environ.get('PG_POOL_TIMEOUT', 5)),
+                    check_idle=float(os.environ.get('PG_POOL_CHECK_IDLE', 30)),
+                    host=os.environ.get('POSTGRES_HOST', 'localhost'),
+                    port=int(os.environ.get('POSTGRES_PORT', 5432)),
+                    database=os.environ.get('POSTGRES_DB', 'teatro'),
+                    user=os.environ.get('POSTGRES_USER', 'teatro'),
+                    password=os.environ.get('POSTGRES_PASS', 'teatro123')
+                )
+    return _pool
+
+
+def get_db():
+    """
+    Presta una conexión del pool. Dentro de una petición queda registrada
+    en `g` y se devuelve automáticamente al terminar si no se cerró antes.
+    """
+    pool = get_pool()
+    conn = PooledConnection(pool, pool.getconn())
+    if has_app_context():
+        g.setdefault('_pg_borrowed', []).append(conn)
+    return conn
+
+
+def _pool_stats():
+    return _pool.stats() if _pool is not None else {'size': 0}
+
+
+def init_app(app):
+    """Registra la devolución al final de la petición, el 503 y la métrica del pool."""
+
+    if _COUNT_QUERIES:
+        @app.after_request
+        def _query_count_header(resp):
+            resp.headers['X-Query-Count'] = str(g.get('_pg_queries', 0))
+            return resp
+
+    @app.teardown_appcontext
+    def _return_connections(exc):
+        for conn in g.pop('_pg_borrowed', []):
+            conn.close()
+
+    @app.errorhandler(PoolExhausted)
+    def _pool_exhausted(e):
+        resp = jsonify({'error': 'Servicio saturado, intenta de nuevo en unos segundos'})
+        resp.headers['Retry-After'] = '1'
+        return resp, 503
+
+    metrics.register('pg_pool', _pool_stats)
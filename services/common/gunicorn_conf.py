@@ -0,0 +1,80 @@
+"""
+Configuración de gunicorn para los cuatro servicios (modo producción).
+
+El servicio se elige con TEATRO_SERVICE; puerto y tipo de worker salen de
+aquí y el resto de .env:
+
+    TEATRO_SERVICE=events gunicorn -c services/common/gunicorn_conf.py \\
+        --chdir services/events app:app
+
+- auth, events, orders: workers `gthread` (procesos × hilos). Cada proceso
+  tiene su propio pool de PostgreSQL de hasta PG_POOL_MAX conexiones.
+- gateway: workers `gevent`, para las conexiones SSE del mapa en vivo.
+
+Recarga sin cortar peticiones: `kill -HUP <pid del master>` (o
+`systemctl reload teatro-<servicio>`) levanta workers nuevos y deja que los
+viejos terminen lo que están atendiendo.
+
+Configuración (.env):
+    GUNICORN_WORKERS           procesos por servicio (CPUs + 1; gateway: CPUs, o 1 con
+                               WAITING_ROOM_ENABLED=true)
+    GUNICORN_THREADS           hilos por proceso en auth/events/orders (4)
+    GUNICORN_KEEPALIVE         segundos que se mantiene abierta una conexión ociosa (5)
+    GUNICORN_TIMEOUT           segundos sin respuesta antes de reiniciar un worker (30)
+    GUNICORN_GRACEFUL_TIMEOUT  segundos para terminar peticiones al recargar o detener (30)
+"""
+
+import os
+import sys
+import multiprocessing
+
+# servicio → (variable del puerto, puerto por defecto, tipo de worker)
+SERVICES = {
+    'auth':    ('AUTH_PORT', 7000, 'gthread'),
+    'events':  ('SEATING_PORT', 7001, 'gthread'),
+    'orders':  ('ORDERS_PORT', 7002, 'gthread'),
+    'gateway': ('WEB_PORT', 8080, 'gevent'),
+}
+
+service = os.environ.get('TEATRO_SERVICE', '')
+if service not in SERVICES:
+    raise RuntimeError(f"TEATRO_SERVICE debe ser uno de: {', '.join(SERVICES)}")
+
+port_var, default_port, worker_class = SERVICES[service]
+cpus = multiprocessing.cpu_count()
+
+bind = f"0.0.0.0:{os.environ.get(port_var, default_port)}"
+proc_name = f"teatro-{service}"
+
+default_workers = cpus if worker_class == 'gevent' else cpus + 1
+# La sala de espera (gateway/waiting_room.py) guarda la cola en memoria:
+# todos los compradores deben ver el mismo proceso
+if service == 'gateway' and os.environ.get('WAITING_ROOM_ENABLED', 'false').lower() == 'true':
+    default_workers = 1
+workers = int(os.environ.get('GUNICORN_WORKERS', default_workers))
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+worker_connections = 1000
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+
+# Cada worker importa la app después del fork: pools de PostgreSQL, Mongo
+# y HTTP propios, sin sockets heredados del master
+preload_app = False
+accesslog = '-'
+errorlog = '-'
+
+
+def post_worker_init(worker):
+    """Arranca las tareas de fondo del servicio, si tiene (p. ej. el barrido de holds)."""
+    import app as service_app
+    start = getattr(service_app, 'start_background_tasks', None)
+    if start is not None:
+        start()
+
+
+def worker_exit(server, worker):
+    """Escribe la auditoría pendiente antes de que el worker termine."""
+    audit = sys.modules.get('common.audit')
+    if audit is not None:
+        audit.flush()
@@ -0,0 +1,95 @@
+"""
+Cliente HTTP compartido para las llamadas entre servicios.
+
+Reemplaza `requests.get/post/...` a nivel de módulo, que abren una conexión
+TCP nueva en cada llamada. Aquí todas las llamadas del proceso usan una
+`requests.Session` con keep-alive y un pool de conexiones por servicio
+(host:puerto). Los GET se reintentan ante errores de conexión y 502/503/504;
+los POST/PUT/DELETE nunca, porque no son idempotentes.
+
+Se usa con la misma interfaz que `requests`:
+
+    from common import http_client as http_requests
+    http_requests.get(url, timeout=5)
+
+Configuración (.env):
+    HTTP_POOL_SIZE   conexiones keep-alive que se conservan hacia cada servicio (20)
+    HTTP_RETRIES     reintentos de un GET fallido (2)
+"""
+
+import os
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from common import metrics
+
+
+def make_session(pool_size, retries):
+    session = requests.Session()
+    retry = Retry(
+        total=retries,
+        backoff_factor=0.1,
+        status_forcelist=(502, 503, 504),
+        allowed_methods=frozenset({'GET', 'HEAD', 'OPTIONS'}),
+        respect_retry_after_header=True,
+        raise_on_status=False
+    )
+    # Sin pool_block: si el pool está lleno se abre una conexión extra que se
+    # descarta al terminar. Bloquear esperaría sin límite (requests no pasa
+    # un timeout al pool) y congelaría a los greenlets del gateway.
+    adapter = HTTPAdapter(pool_connections=8, pool_maxsize=pool_size, max_retries=retry)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+# ── Sesión por proceso ─────────────────────────────────────────
+# Como el pool de PostgreSQL: se crea en el primer uso de cada proceso
+# para no compartir sockets entre workers después de un fork.
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+_stats = {'requests': 0, 'errors': 0}
+
+
+def get_session():
+    global _session, _session_pid
+    if _session is None or _session_pid != os.getpid():
+        with _session_lock:
+            if _session is None or _session_pid != os.getpid():
+                _session = make_session(
+                    pool_size=int(os.environ.get('HTTP_POOL_SIZE', 20)),
+                    retries=int(os.environ.get('HTTP_RETRIES', 2))
+                )
+                _session_pid = os.getpid()
+    return _session
+
+
+def request(method, url, **kwargs):
+    _stats['requests'] += 1
+    try:
+        return get_session().request(method, url, **kwargs)
+    except requests.RequestException:
+        _stats['errors'] += 1
+        raise
+
+
+def get(url, **kwargs):
+    return request('GET', url, **kwargs)
+
+
+def post(url, **kwargs):
+    return request('POST', url, **kwargs)
+
+
+def put(url, **kwargs):
+    return request('PUT', url, **kwargs)
+
+
+def delete(url, **kwargs):
+    return request('DELETE', url, **kwargs)
+
+
+metrics.register('http_client', lambda: dict(_stats))
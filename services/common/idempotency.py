@@ -0,0 +1,121 @@
+"""
+Claves de idempotencia (cabecera `Idempotency-Key`) para endpoints POST.
+
+La primera petición con una clave la reserva en la tabla
+`idempotency_keys` (única por usuario + clave) y guarda su respuesta; los
+reintentos con la misma clave reciben esa respuesta sin volver a ejecutar
+el endpoint (cabecera `Idempotent-Replayed: true`).
+
+- Misma clave con otro cuerpo u otro endpoint → 422.
+- Misma clave mientras la primera sigue en curso → 409 con Retry-After.
+- Solo se guardan las respuestas exitosas (2xx/3xx). Con un 4xx (sin
+  asientos en HOLD, límite excedido...) no se compró nada y con un 5xx
+  puede faltar algo: en ambos casos la clave queda libre y el reintento
+  vuelve a ejecutar el endpoint en vez de repetir el error.
+- Una reserva sin respuesta tras IDEMPOTENCY_STALE_SECONDS (60) se considera
+  abandonada (proceso caído) y se puede volver a usar; una clave completa
+  vence a las IDEMPOTENCY_TTL_HOURS (24).
+
+Uso, siempre debajo del decorador que define `request.user_id`:
+
+    @app.route('/api/orders', methods=['POST'])
+    @token_required
+    @idempotency.idempotent
+    def create_order(): ...
+"""
+
+import os
+import hashlib
+from functools import wraps
+import psycopg2.extras
+from flask import request, jsonify, make_response
+
+from common import db
+
+MAX_KEY_LENGTH = 255
+
+
+def _claim(user_id, key, endpoint, request_hash):
+    """True si esta petición se quedó con la clave; si no, la fila existente."""
+    conn = db.get_db()
+    try:
+        with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+            cur.execute("""
+                INSERT INTO idempotency_keys (user_id, idem_key, endpoint, request_hash)
+                VALUES (%(user_id)s, %(key)s, %(endpoint)s, %(hash)s)
+                ON CONFLICT (user_id, idem_key) DO UPDATE
+                    SET endpoint = EXCLUDED.endpoint, request_hash = EXCLUDED.request_hash,
+                        status_code = NULL, response = NULL, created_at = NOW()
+                    WHERE (idempotency_keys.status_code IS NULL
+                           AND idempotency_keys.created_at < NOW() - make_interval(secs => %(stale)s))
+                       OR idempotency_keys.created_at < NOW() - make_interval(hours => %(ttl)s)
+                RETURNING user_id
+            """, {
+                'user_id': user_id, 'key': key, 'endpoint': endpoint, 'hash': request_hash,
+                'stale': int(os.environ.get('IDEMPOTENCY_STALE_SECONDS', 60)),
+                'ttl': int(os.environ.get('IDEMPOTENCY_TTL_HOURS', 24)),
+            })
+            if cur.fetchone():
+                conn.commit()
+                return True, None
+            cur.execute(
+                "SELECT * FROM idempotency_keys WHERE user_id = %s AND idem_key = %s",
+                (user_id, key)
+            )
+            existing = cur.fetchone()
+        conn.commit()
+        return False, existing
+    finally:
+        conn.close()
+
+
+def _finish(user_id, key, resp):
+    conn = db.get_db()
+    try:
+        with conn.cursor() as cur:
+            if resp.status_code >= 400:
+                cur.execute("DELETE FROM idempotency_keys WHERE user_id = %s AND idem_key = %s",
+                            (user_id, key))
+            else:
+                cur.execute("""
+                    UPDATE idempotency_keys SET status_code = %s, response = %s
+                    WHERE user_id = %s AND idem_key = %s
+                """, (resp.status_code, psycopg2.extras.Json(resp.get_json(silent=True)), user_id, key))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def idempotent(f):
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        key = request.headers.get('Idempotency-Key', '').strip()
+        if not key:
+            return f(*args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return jsonify({'error': f'Idempotency-Key admite hasta {MAX_KEY_LENGTH} caracteres'}), 400
+
+        user_id = request.user_id
+        request_hash = hashlib.sha256(request.get_data()).hexdigest()
+        claimed, existing = _claim(user_id, key, request.path, request_hash)
+
+        if not claimed:
+            if existing['endpoint'] != request.path or existing['request_hash'] != request_hash:
+                return jsonify({'error': 'Idempotency-Key ya usada con otra petición'}), 422
+            if existing['status_code'] is None:
+                resp = jsonify({'error': 'Petición con esta Idempotency-Key aún en curso'})
+                resp.headers['Retry-After'] = '1'
+                return resp, 409
+            resp = jsonify(existing['response'])
+            resp.status_code = existing['status_code']
+            resp.headers['Idempotent-Replayed'] = 'true'
+            return resp
+
+        try:
+            resp = make_response(f(*args, **kwargs))
+        except Exception:
+            _finish(user_id, key, make_response('', 500))
+            raise
+        _finish(user_id, key, resp)
+        return resp
+    return decorated
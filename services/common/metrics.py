@@ -0,0 +1,56 @@
+"""
+Registro mínimo de métricas en proceso.
+
+Cada componente (pool de conexiones, cachés, auditoría...) registra una
+función que devuelve un dict con sus contadores; `init_app` expone el
+conjunto en GET /internal/metrics.
+
+La ruta es interna (también en el gateway, que es público): responde
+solo a las IPs de METRICS_ALLOWED_IPS (por defecto, la misma máquina) o a
+quien envíe la cabecera `X-Metrics-Token` igual a METRICS_TOKEN. A los
+demás les responde 404.
+"""
+
+import os
+import hmac
+import threading
+from flask import jsonify, request
+
+_providers = {}
+_lock = threading.Lock()
+
+
+def register(name, provider):
+    """Registra `provider()` bajo `name`. Reemplaza uno previo del mismo nombre."""
+    with _lock:
+        _providers[name] = provider
+
+
+def snapshot():
+    with _lock:
+        providers = dict(_providers)
+    result = {}
+    for name, provider in providers.items():
+        try:
+            result[name] = provider()
+        except Exception as e:
+            result[name] = {'error': str(e)}
+    return result
+
+
+def _allowed():
+    token = os.environ.get('METRICS_TOKEN', '')
+    sent = request.headers.get('X-Metrics-Token', '')
+    if token and sent and hmac.compare_digest(sent.encode(), token.encode()):
+        return True
+    allowed_ips = {ip.strip() for ip in os.environ.get('METRICS_ALLOWED_IPS', '127.0.0.1,::1').split(',') if ip.strip()}
+    return request.remote_addr in allowed_ips
+
+
+def init_app(app):
+    def internal_metrics():
+        if not _allowed():
+            return jsonify({'error': 'Not found'}), 404
+        return jsonify(snapshot())
+
+    app.add_url_rule('/internal/metrics', 'internal_metrics', internal_metrics, methods=['GET'])
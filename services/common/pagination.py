@@ -0,0 +1,63 @@
+"""
+Paginación por cursor (keyset) para los listados.
+
+El cursor es opaco para el cliente: el JSON de los valores de orden de la
+última fila entregada, en base64 url-safe. La respuesta sigue siendo la
+lista de siempre; si hay más filas, el cursor de la siguiente página va en
+la cabecera `X-Next-Cursor` y se pide con `?cursor=<valor>`.
+"""
+
+import base64
+import json
+from flask import request, jsonify
+
+
+def encode_cursor(values):
+    raw = json.dumps(list(values), default=str).encode()
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, size):
+    """Devuelve la lista de `size` valores del cursor. ValueError si no es válido."""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except ValueError:
+        raise ValueError('cursor inválido')
+    if not isinstance(values, list) or len(values) != size:
+        raise ValueError('cursor inválido')
+    return values
+
+
+def page_args(cursor_size, default_limit=None, max_limit=200):
+    """
+    Lee ?limit y ?cursor. Devuelve (limit, cursor); limit None significa
+    sin paginar (el listado completo, como antes). ValueError si son inválidos.
+    """
+    raw = request.args.get('limit')
+    limit = default_limit
+    if raw is not None:
+        try:
+            limit = int(raw)
+        except ValueError:
+            raise ValueError('limit debe ser un número entero')
+        if limit < 1:
+            raise ValueError('limit debe ser mayor que 0')
+    if limit is not None:
+        limit = min(limit, max_limit)
+
+    cursor = request.args.get('cursor')
+    return limit, (decode_cursor(cursor, cursor_size) if cursor else None)
+
+
+def paginated_response(rows, limit, key):
+    """
+    `rows` trae hasta limit + 1 filas: la sobrante solo indica que hay otra
+    página. `key(row)` da los valores de orden con los que se arma el cursor.
+    """
+    has_more = limit is not None and len(rows) > limit
+    if has_more:
+        rows = rows[:limit]
+    resp = jsonify(rows)
+    if has_more:
+        resp.headers['X-Next-Cursor'] = encode_cursor(key(rows[-1]))
+    return resp
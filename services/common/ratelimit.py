@@ -0,0 +1,155 @@
+"""
+Límite de peticiones por usuario y por IP (token bucket).
+
+Cada límite se configura como "N/S": N peticiones cada S segundos, con
+ráfagas de hasta N. Se define en el decorador y se puede cambiar desde
+.env con RATE_LIMIT_<NOMBRE> (p. ej. RATE_LIMIT_HOLD=20/60):
+
+    @app.route('/api/hold', methods=['POST'])
+    @login_required
+    @ratelimit.limit('hold', '20/60', keys=[user_key])
+    @ratelimit.limit('hold_ip', '120/60', keys=[ip_key])
+    def api_hold(): ...
+
+`keys` son funciones que devuelven la clave de cada cubeta (usuario, IP,
+...; None = no aplica); se descuenta de todas y basta que una esté vacía
+para responder 429 con `Retry-After`. Un límite por IP conviene más
+holgado que el de usuario: varios compradores pueden compartir IP.
+
+Los contadores viven en la memoria del proceso. Con RATE_LIMIT_REDIS_URL
+(y el paquete `redis` instalado) se comparten entre procesos y servidores;
+si Redis falla, la petición pasa y se cuenta en `errors`.
+
+Contadores en /internal/metrics como `ratelimit` (permitidas y
+rechazadas por límite).
+"""
+
+import os
+import time
+import threading
+from functools import wraps
+from collections import OrderedDict
+from flask import jsonify
+
+from common import metrics
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+
+def parse_limit(spec):
+    """'N/S' → (tokens por segundo, ráfaga)."""
+    count, seconds = spec.split('/')
+    return int(count) / float(seconds), int(count)
+
+
+# ── Almacenamiento de las cubetas ─────────────────────────────
+
+class MemoryBackend:
+
+    def __init__(self, maxsize=100000):
+        self.maxsize = maxsize
+        self._buckets = OrderedDict()    # clave → (tokens, último cálculo)
+        self._lock = threading.Lock()
+
+    def take(self, key, rate, burst):
+        """Devuelve 0 si se consumió un token, o los segundos a esperar."""
+        now = time.monotonic()
+        with self._lock:
+            tokens, last = self._buckets.get(key, (burst, now))
+            tokens = min(burst, tokens + (now - last) * rate)
+            wait = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / rate
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+        return wait
+
+
+class RedisBackend:
+
+    # Mismo cálculo que MemoryBackend, atómico en Redis y con su reloj
+    _SCRIPT = """
+        local rate, burst = tonumber(ARGV[1]), tonumber(ARGV[2])
+        local t = redis.call('TIME')
+        local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+        local data = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+        local tokens = tonumber(data[1]) or burst
+        local last = tonumber(data[2]) or now
+        tokens = math.min(burst, tokens + (now - last) * rate)
+        local wait = 0
+        if tokens >= 1 then tokens = tokens - 1 else wait = (1 - tokens) / rate end
+        redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+        redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+        return tostring(wait)
+    """
+
+    def __init__(self, url):
+        self._client = redis.Redis.from_url(url, socket_timeout=0.2)
+        self._take = self._client.register_script(self._SCRIPT)
+
+    def take(self, key, rate, burst):
+        return float(self._take(keys=[f'ratelimit:{key}'], args=[rate, burst]))
+
+
+_backend = None
+_backend_lock = threading.Lock()
+_stats = {'errors': 0}
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                url = os.environ.get('RATE_LIMIT_REDIS_URL', '')
+                if url and redis is None:
+                    print("[RATE LIMIT] RATE_LIMIT_REDIS_URL definido pero falta el paquete redis; "
+                          "se usan contadores en memoria")
+                _backend = RedisBackend(url) if url and redis is not None else MemoryBackend()
+    return _backend
+
+
+def _count(name, field):
+    entry = _stats.setdefault(name, {'allowed': 0, 'rejected': 0})
+    entry[field] += 1
+
+
+# ── Decorador ─────────────────────────────────────────────────
+
+def limit(name, default, keys):
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            if os.environ.get('RATE_LIMIT_ENABLED', 'true').lower() != 'true':
+                return f(*args, **kwargs)
+            rate, burst = parse_limit(os.environ.get(f'RATE_LIMIT_{name.upper()}', default))
+            wait = 0.0
+            for key_func in keys:
+                key = key_func()
+                if key is None:
+                    continue
+                try:
+                    wait = max(wait, get_backend().take(f'{name}:{key_func.__name__}:{key}', rate, burst))
+                except Exception as e:
+                    _stats['errors'] += 1
+                    print(f"[RATE LIMIT] {e}")
+            if wait > 0:
+                _count(name, 'rejected')
+                retry_after = int(wait) + 1
+                resp = jsonify({'error': f'Demasiadas solicitudes. Intenta de nuevo en {retry_after} s.'})
+                resp.headers['Retry-After'] = str(retry_after)
+                return resp, 429
+            _count(name, 'allowed')
+            return f(*args, **kwargs)
+        return decorated
+    return decorator
+
+
+metrics.register('ratelimit', lambda: {k: (dict(v) if isinstance(v, dict) else v) for k, v in _stats.items()})
@@ -1,95 +1,63 @@
 """
 Events & Seating Service — Puerto 7001
 Maneja salas (venues), eventos y mapas de asientos.
-Base de datos: PostgreSQL (venues, events) + MongoDB (seat_maps)
+Base de datos: PostgreSQL (venues, events) + MongoDB (seat_maps, ver seat_store.py)
 """
 
 import os
+import sys
 import datetime
+import fcntl
 import threading
 import time
 import psycopg2
 import psycopg2.extras
-import jwt
 from flask import Flask, request, jsonify
-from functools import wraps
 from pymongo import MongoClient
 from dotenv import load_dotenv
 
 load_dotenv(os.path.join(os.path.dirname(__file__), '..', '..', '.env'))
 
-app = Flask(__name__)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common import admission, audit, cache, db, metrics, pagination, ratelimit  # noqa: E402
+from common.auth import token_required, admin_required, optional_claims  # noqa: E402
+from seat_store import SeatQuota, make_store, normalize_seat_ids  # noqa: E402
+import seat_codec  # noqa: E402
 
-SECRET_KEY = os.environ.get('JWT_SECRET', 'super-secret-key-change-me')
+app = Flask(__name__)
 
-# ── Conexión PostgreSQL ────────────────────────────────────────
-def get_pg():
-    return psycopg2.connect(
-        host=os.environ.get('POSTGRES_HOST', 'localhost'),
-        port=int(os.environ.get('POSTGRES_PORT', 5432)),
-        database=os.environ.get('POSTGRES_DB', 'teatro'),
-        user=os.environ.get('POSTGRES_USER', 'teatro'),
-        password=os.environ.get('POSTGRES_PASS', 'teatro123')
-    )
+# ── Conexión PostgreSQL (pool compartido) ─────────────────────
+get_pg = db.get_db
+db.init_app(app)
+metrics.init_app(app)
+
+# ── Caché de eventos (evento + sala) ───────────────────────────
+event_cache = cache.TTLCache(
+    'events',
+    maxsize=int(os.environ.get('EVENT_CACHE_SIZE', 512)),
+    ttl=float(os.environ.get('EVENT_CACHE_TTL', 30))
+)
+event_list_cache = cache.TTLCache(
+    'event_lists',
+    maxsize=64,
+    ttl=float(os.environ.get('EVENT_LIST_CACHE_TTL', 5))
+)
 
 # ── Conexión MongoDB ───────────────────────────────────────────
 mongo_client = MongoClient(os.environ.get('MONGO_URI', 'mongodb://localhost:27017'))
 mongo_db = mongo_client[os.environ.get('MONGO_DB', 'teatro')]
-seat_maps = mongo_db['seat_maps']
-
-
-# ── Decoradores de autenticación ──────────────────────────────
-def _decode_token():
-    token = request.headers.get('Authorization', '').replace('Bearer ', '')
-    if not token:
-        return None
-    try:
-        return jwt.decode(token, SECRET_KEY, algorithms=['HS256'])
-    except (jwt.ExpiredSignatureError, jwt.InvalidTokenError):
-        return None
-
-
-def token_required(f):
-    @wraps(f)
-    def decorated(*args, **kwargs):
-        data = _decode_token()
-        if not data:
-            return jsonify({'error': 'Token requerido o inválido'}), 401
-        request.user_id = data['user_id']
-        request.user_role = data['role']
-        request.user_email = data.get('email', '')
-        return f(*args, **kwargs)
-    return decorated
-
-
-def admin_required(f):
-    @wraps(f)
-    def decorated(*args, **kwargs):
-        data = _decode_token()
-        if not data:
-            return jsonify({'error': 'Token requerido o inválido'}), 401
-        if data['role'] != 'ADMIN':
-            return jsonify({'error': 'Acceso denegado: se requiere rol ADMIN'}), 403
-        request.user_id = data['user_id']
-        request.user_role = data['role']
-        request.user_email = data.get('email', '')
-        return f(*args, **kwargs)
-    return decorated
-
-
-def audit(user_id, action, detail=''):
-    try:
-        conn = get_pg()
-        with conn.cursor() as cur:
-            ip = request.remote_addr or ''
-            cur.execute(
-                "INSERT INTO audit_log (user_id, action, detail, ip_address) VALUES (%s,%s,%s,%s)",
-                (user_id, action, detail, ip)
-            )
-        conn.commit()
-        conn.close()
-    except Exception:
-        pass
+_seat_store_kind = os.environ.get('SEAT_STORE', 'embedded')
+seat_store = make_store(
+    mongo_db, _seat_store_kind,
+    **({'use_transactions': os.environ.get('MONGO_TRANSACTIONS', 'false').lower() == 'true'}
+       if _seat_store_kind == 'per_seat' else {})
+)
+seat_quota = SeatQuota(mongo_db)
+try:
+    seat_store.ensure_indexes()
+    seat_quota.ensure_indexes()
+except Exception as e:
+    print(f"[SEAT STORE] No se pudieron crear los índices: {e}")
 
 
 # ── Helper: serializar filas PG ────────────────────────────────
@@ -110,17 +78,36 @@ def _serialize_row(row):
 @app.route('/api/venues', methods=['GET'])
 @token_required
 def list_venues():
+    """
+    Lista las salas con `has_active_events` en una sola consulta.
+    Paginación opcional: ?limit=N&cursor=<X-Next-Cursor de la página anterior>.
+    """
+    try:
+        limit, cursor = pagination.page_args(cursor_size=2)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    query = """
+        SELECT v.*,
+               EXISTS (SELECT 1 FROM events e
+                       WHERE e.venue_id = v.id AND e.status != 'CLOSED') AS has_active_events
+        FROM venues v
+    """
+    params = []
+    if cursor:
+        query += " WHERE (v.created_at, v.id) < (%s::timestamp, %s)"
+        params += cursor
+    query += " ORDER BY v.created_at DESC, v.id DESC"
+    if limit:
+        query += " LIMIT %s"
+        params.append(limit + 1)
+
     conn = get_pg()
     try:
         with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
-            cur.execute("SELECT * FROM venues ORDER BY created_at DESC")
+            cur.execute(query, params)
             venues = [_serialize_row(v) for v in cur.fetchall()]
-
-            # Check for active events
-            for venue in venues:
-                cur.execute("SELECT 1 FROM events WHERE venue_id = %s AND status != 'CLOSED' LIMIT 1", (venue['id'],))
-                venue['has_active_events'] = bool(cur.fetchone())
-        return jsonify(venues)
+        return pagination.paginated_response(venues, limit, lambda v: (v['created_at'], v['id']))
     finally:
         conn.close()
 
@@ -149,7 +136,7 @@ def create_venue():
             )
             venue = _serialize_row(cur.fetchone())
         conn.commit()
-        audit(request.user_id, 'CREATE_VENUE', f'{name} ({rows_count}x{cols_count})')
+        audit.log(request.user_id, 'CREATE_VENUE', f'{name} ({rows_count}x{cols_count})')
         return jsonify(venue), 201
     finally:
         conn.close()
@@ -194,7 +181,8 @@ def update_venue(venue_id):
             )
             venue = _serialize_row(cur.fetchone())
         conn.commit()
-        audit(request.user_id, 'UPDATE_VENUE', f'{venue["name"]} (ID: {venue_id})')
+        _invalidate_events()    # los eventos en caché llevan nombre y tamaño de la sala
+        audit.log(request.user_id, 'UPDATE_VENUE', f'{venue["name"]} (ID: {venue_id})')
         return jsonify(venue)
     finally:
         conn.close()
@@ -216,7 +204,8 @@ def delete_venue(venue_id):
             if not cur.fetchone():
                 return jsonify({'error': 'Sala no encontrada'}), 404
         conn.commit()
-        audit(request.user_id, 'DELETE_VENUE', f'ID: {venue_id}')
+        _invalidate_events()    # el borrado arrastra los eventos cerrados de la sala
+        audit.log(request.user_id, 'DELETE_VENUE', f'ID: {venue_id}')
         return jsonify({'message': 'Sala eliminada correctamente'})
     finally:
         conn.close()
@@ -226,48 +215,115 @@ def delete_venue(venue_id):
 #  EVENTS (EVENTOS)
 # ═══════════════════════════════════════════════════════════════
 
+# Columnas por proyección: "list" recorta la descripción a lo que muestra
+# una tarjeta (120 caracteres + 1 para saber si hay que poner "…")
+EVENT_FIELDS = {
+    'detail': "e.*",
+    'list': """e.id, e.venue_id, e.title, LEFT(e.description, 121) AS description,
+               e.start_time, e.end_time, e.price, e.max_per_user, e.status""",
+}
+
+
 @app.route('/api/events', methods=['GET'])
 def list_events():
+    """
+    Lista eventos por fecha de inicio.
+    ?status=ACTIVE, ?fields=list|detail (detail por defecto),
+    ?limit=N&cursor=<X-Next-Cursor>. Respuestas en caché EVENT_LIST_CACHE_TTL s.
+    """
     status = request.args.get('status', None)
+    fields = request.args.get('fields', 'detail')
+    if fields not in EVENT_FIELDS:
+        return jsonify({'error': 'fields debe ser list o detail'}), 400
+    try:
+        limit, cursor = pagination.page_args(cursor_size=2)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    key = (status, fields, limit, tuple(cursor) if cursor else None)
+    events = event_list_cache.get_or_load(key, lambda: _query_events(status, fields, limit, cursor))
+    return pagination.paginated_response(events, limit, lambda e: (e['start_time'], e['id']))
+
+
+def _query_events(status, fields, limit, cursor):
+    query = f"""
+        SELECT {EVENT_FIELDS[fields]}, v.name AS venue_name, v.rows_count, v.cols_count
+        FROM events e JOIN venues v ON e.venue_id = v.id
+        WHERE TRUE
+    """
+    params = []
+    if status:
+        query += " AND e.status = %s"
+        params.append(status)
+    if cursor:
+        query += " AND (e.start_time, e.id) > (%s::timestamp, %s)"
+        params += cursor
+    query += " ORDER BY e.start_time, e.id"
+    if limit:
+        query += " LIMIT %s"
+        params.append(limit + 1)
+
     conn = get_pg()
     try:
         with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
-            if status:
-                cur.execute("""
-                    SELECT e.*, v.name AS venue_name, v.rows_count, v.cols_count
-                    FROM events e JOIN venues v ON e.venue_id = v.id
-                    WHERE e.status = %s ORDER BY e.start_time
-                """, (status,))
-            else:
+            cur.execute(query, params)
+            return [_serialize_row(e) for e in cur.fetchall()]
+    finally:
+        conn.close()
+
+
+def _invalidate_events(event_id=None):
+    """Tras cambiar eventos o salas: el evento (o todos) y todos los listados."""
+    event_cache.invalidate(event_id)
+    event_list_cache.invalidate()
+
+
+def load_event(event_id):
+    """
+    Evento con los datos de su sala, desde `event_cache` o PostgreSQL.
+    None si no existe. El dict es compartido: no modificarlo.
+    """
+    def _query():
+        conn = get_pg()
+        try:
+            with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
                 cur.execute("""
                     SELECT e.*, v.name AS venue_name, v.rows_count, v.cols_count
                     FROM events e JOIN venues v ON e.venue_id = v.id
-                    ORDER BY e.start_time
-                """)
-            events = [_serialize_row(e) for e in cur.fetchall()]
-        return jsonify(events)
-    finally:
-        conn.close()
+                    WHERE e.id = %s
+                """, (event_id,))
+                event = cur.fetchone()
+            return _serialize_row(event) if event else None
+        finally:
+            conn.close()
 
+    return event_cache.get_or_load(event_id, _query)
 
-@app.route('/api/events/<int:event_id>', methods=['GET'])
-def get_event(event_id):
+
+def load_event_for_sale(event_id):
+    """
+    Estado y límite por usuario del evento, siempre desde PostgreSQL (una
+    búsqueda por clave primaria). Para reservar no sirve `event_cache`: la
+    invalidación solo llega al proceso que cambió el estado y los demás
+    aceptarían o rechazarían reservas con el estado viejo hasta el TTL.
+    """
     conn = get_pg()
     try:
         with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
-            cur.execute("""
-                SELECT e.*, v.name AS venue_name, v.rows_count, v.cols_count
-                FROM events e JOIN venues v ON e.venue_id = v.id
-                WHERE e.id = %s
-            """, (event_id,))
-            event = cur.fetchone()
-        if not event:
-            return jsonify({'error': 'Evento no encontrado'}), 404
-        return jsonify(_serialize_row(event))
+            cur.execute("SELECT status, max_per_user FROM events WHERE id = %s", (event_id,))
+            return cur.fetchone()
     finally:
         conn.close()
 
 
+@app.route('/api/events/<int:event_id>', methods=['GET'])
+def get_event(event_id):
+    event = load_event(event_id)
+    if not event:
+        return jsonify({'error': 'Evento no encontrado'}), 404
+    return jsonify(event)
+
+
 @app.route('/api/events', methods=['POST'])
 @admin_required
 def create_event():
@@ -323,30 +379,12 @@ def create_event():
             """, (venue_id, title, description, start_time, end_time, price, max_per_user))
             event = _serialize_row(cur.fetchone())
         conn.commit()
+        _invalidate_events(event['id'])
 
         # Crear mapa de asientos en MongoDB
-        seats = {}
-        for r in range(venue['rows_count']):
-            row_letter = chr(65 + r)
-            for c in range(1, venue['cols_count'] + 1):
-                seat_id = f"{row_letter}{c}"
-                seats[seat_id] = {
-                    'status': 'FREE',
-                    'zone': 'GENERAL',
-                    'held_by': None,
-                    'hold_until': None
-                }
-
-        seat_maps.insert_one({
-            'event_id': event['id'],
-            'venue_id': venue['id'],
-            'venue_name': venue['name'],
-            'rows': venue['rows_count'],
-            'cols': venue['cols_count'],
-            'seats': seats
-        })
-
-        audit(request.user_id, 'CREATE_EVENT', f'{title} (sala {venue["name"]})')
+        seat_store.create_map(event['id'], venue)
+
+        audit.log(request.user_id, 'CREATE_EVENT', f'{title} (sala {venue["name"]})')
         return jsonify(event), 201
     finally:
         conn.close()
@@ -372,7 +410,8 @@ def update_event_status(event_id):
             if not event:
                 return jsonify({'error': 'Evento no encontrado'}), 404
         conn.commit()
-        audit(request.user_id, 'UPDATE_EVENT_STATUS', f'Evento {event_id} → {new_status}')
+        _invalidate_events(event_id)
+        audit.log(request.user_id, 'UPDATE_EVENT_STATUS', f'Evento {event_id} → {new_status}')
         return jsonify(_serialize_row(event))
     finally:
         conn.close()
@@ -384,134 +423,160 @@ def update_event_status(event_id):
 
 @app.route('/api/events/<int:event_id>/seats', methods=['GET'])
 def get_seats(event_id):
-    """Devuelve el mapa de asientos con holds expirados limpiados."""
-    doc = seat_maps.find_one({'event_id': event_id}, {'_id': 0})
+    """
+    Devuelve el mapa de asientos. Solo lectura: los holds vencidos se
+    muestran como FREE al serializar y su liberación en Mongo queda a
+    cargo del hilo de limpieza (que sube la versión del mapa).
+
+    Versionado:
+      - ETag "<event_id>-<version>"; con If-None-Match igual responde 304
+        sin leer los asientos.
+      - ?since=<version> devuelve solo los asientos cambiados después de
+        esa versión, con "delta": true.
+
+    ?format=compact: solo el estado de cada asiento, 2 bits por asiento en
+    base64 (`data`), o {seat_id: código} en `changes` si es delta. Con token,
+    `mine` trae los asientos vendidos o en HOLD del usuario.
+    """
+    fmt = request.args.get('format', 'json')
+    if fmt not in ('json', 'compact'):
+        return jsonify({'error': 'format debe ser json o compact'}), 400
+
+    version = seat_store.get_version(event_id)
+    if version is None:
+        return jsonify({'error': 'Mapa de asientos no encontrado'}), 404
+
+    etag = _seats_etag(event_id, version, fmt)
+    if etag in _if_none_match():
+        resp = app.response_class(status=304)
+        resp.headers['ETag'] = etag
+        resp.headers['Cache-Control'] = 'no-cache'
+        return resp
+
+    since = request.args.get('since', None, type=int)
+    if since is not None and not 0 <= since <= version:
+        since = None        # versión desconocida (mapa recreado): mapa completo
+
+    doc = seat_store.get_map(event_id, since=since)
     if not doc:
         return jsonify({'error': 'Mapa de asientos no encontrado'}), 404
 
     now = datetime.datetime.utcnow()
-    cleaned = 0
-    for seat_id, seat in doc.get('seats', {}).items():
-        if seat['status'] == 'HELD' and seat.get('hold_until'):
-            if seat['hold_until'] < now:
-                seat['status'] = 'FREE'
-                seat['held_by'] = None
-                seat['hold_until'] = None
-                cleaned += 1
+    if fmt == 'compact':
+        body = _compact_map(doc, since, now)
+    else:
+        for seat_id, seat in doc.get('seats', {}).items():
+            _serialize_seat(seat, now)
+        body = doc
+    body['delta'] = since is not None
+
+    resp = jsonify(body)
+    resp.headers['ETag'] = _seats_etag(event_id, doc['version'], fmt)
+    resp.headers['Cache-Control'] = 'no-cache'
+    resp.headers['Vary'] = 'Authorization'
+    return resp
+
+
+def _seats_etag(event_id, version, fmt):
+    return f'"{event_id}-{version}"' if fmt == 'json' else f'"{event_id}-{version}-{fmt}"'
 
-    # Actualizar en Mongo los asientos expirados (batch)
-    if cleaned > 0:
-        _release_expired(event_id)
 
-    # Serializar hold_until a string
-    for seat_id, seat in doc.get('seats', {}).items():
-        if seat.get('hold_until') and isinstance(seat['hold_until'], datetime.datetime):
-            seat['hold_until'] = seat['hold_until'].isoformat()
+def _compact_map(doc, since, now):
+    seats = doc.pop('seats', {})
+    token = optional_claims()
+    doc['format'] = 'compact'
+    if since is None:
+        doc['data'] = seat_codec.encode(seats, doc['rows'], doc['cols'], now)
+    else:
+        doc['changes'] = {seat_id: seat_codec.seat_code(seat, now) for seat_id, seat in seats.items()}
+    doc['mine'] = seat_codec.owned_by(seats, token['user_id'] if token else None, now)
+    return doc
 
-    return jsonify(doc)
+
+def _if_none_match():
+    header = request.headers.get('If-None-Match', '')
+    return {tag.strip().removeprefix('W/') for tag in header.split(',') if tag.strip()}
+
+
+def _serialize_seat(seat, now):
+    """Deja el asiento listo para JSON; un HOLD vencido se presenta como FREE."""
+    hold_until = seat.get('hold_until')
+    if seat['status'] == 'HELD' and hold_until and hold_until < now:
+        seat['status'] = 'FREE'
+        seat['held_by'] = None
+        seat['hold_until'] = None
+    elif isinstance(hold_until, datetime.datetime):
+        seat['hold_until'] = hold_until.isoformat()
+    return seat
+
+
+def user_key():
+    return request.user_id
 
 
 @app.route('/api/events/<int:event_id>/hold', methods=['POST'])
 @token_required
+@ratelimit.limit('events_hold', '30/60', keys=[user_key])
 def hold_seats(event_id):
     """
     Reserva temporal (HOLD) de asientos por 10 minutos.
-    Operación atómica en MongoDB para concurrencia.
+    Todo-o-nada: una sola operación atómica en MongoDB para el bloque.
     Body: { "seats": ["A1", "A2"] }
+
+    Con WAITING_ROOM_ENABLED=true exige el turno de la sala de espera del
+    gateway (cabecera X-Admission-Token), salvo a los ADMIN.
     """
+    if (admission.enabled() and request.user_role != 'ADMIN'
+            and not admission.verify(request.headers.get('X-Admission-Token'), event_id, request.user_id)):
+        return jsonify({'error': 'Debes esperar tu turno en la sala de espera', 'waiting_room': True}), 403
+
     data = request.get_json() or {}
-    requested_seats = data.get('seats', [])
+    try:
+        requested_seats = normalize_seat_ids(data.get('seats', []))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
 
     if not requested_seats:
         return jsonify({'error': 'Debe seleccionar al menos un asiento'}), 400
 
-    # Verificar evento activo
-    conn = get_pg()
-    try:
-        with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
-            cur.execute("SELECT * FROM events WHERE id = %s", (event_id,))
-            event = cur.fetchone()
-    finally:
-        conn.close()
-
+    # Verificar evento activo (sin caché: ver load_event_for_sale)
+    event = load_event_for_sale(event_id)
     if not event:
         return jsonify({'error': 'Evento no encontrado'}), 404
     if event['status'] != 'ACTIVE':
         return jsonify({'error': 'El evento no está activo'}), 400
 
-    # Verificar límite de boletos por usuario
-    max_per_user = event['max_per_user']
-    doc = seat_maps.find_one({'event_id': event_id})
-    if not doc:
+    if seat_store.get_version(event_id) is None:
         return jsonify({'error': 'Mapa de asientos no encontrado'}), 404
 
-    # Contar asientos ya reservados/vendidos por este usuario
-    user_seat_count = 0
-    for sid, s in doc.get('seats', {}).items():
-        if s.get('held_by') == request.user_id and s['status'] in ('HELD', 'SOLD'):
-            if s['status'] == 'HELD' and s.get('hold_until'):
-                if s['hold_until'] >= datetime.datetime.utcnow():
-                    user_seat_count += 1
-            elif s['status'] == 'SOLD':
-                user_seat_count += 1
-
-    if user_seat_count + len(requested_seats) > max_per_user:
+    # Verificar y apartar el cupo de boletos por usuario (una escritura atómica)
+    max_per_user = event['max_per_user']
+    now = datetime.datetime.utcnow()
+    hold_until = now + datetime.timedelta(minutes=10)
+    if not seat_quota.reserve(event_id, request.user_id, requested_seats, max_per_user, hold_until, now):
+        used = seat_quota.used(event_id, request.user_id, now)
         return jsonify({
-            'error': f'Excedes el límite de {max_per_user} boletos por usuario. Ya tienes {user_seat_count}.'
+            'error': f'Excedes el límite de {max_per_user} boletos por usuario. Ya tienes {used}.'
         }), 400
 
-    # Intentar HOLD atómico para cada asiento
-    now = datetime.datetime.utcnow()
-    hold_until = now + datetime.timedelta(minutes=10)
-    held = []
-    failed = []
-
-    for seat_id in requested_seats:
-        result = seat_maps.find_one_and_update(
-            {
-                'event_id': event_id,
-                '$or': [
-                    {f'seats.{seat_id}.status': 'FREE'},
-                    {
-                        f'seats.{seat_id}.status': 'HELD',
-                        f'seats.{seat_id}.hold_until': {'$lt': now}
-                    }
-                ]
-            },
-            {
-                '$set': {
-                    f'seats.{seat_id}.status': 'HELD',
-                    f'seats.{seat_id}.held_by': request.user_id,
-                    f'seats.{seat_id}.hold_until': hold_until
-                }
-            }
-        )
-        if result:
-            held.append(seat_id)
-        else:
-            failed.append(seat_id)
-
-    # Si alguno falló, liberar los que sí se reservaron
-    if failed and held:
-        for seat_id in held:
-            seat_maps.update_one(
-                {'event_id': event_id},
-                {'$set': {
-                    f'seats.{seat_id}.status': 'FREE',
-                    f'seats.{seat_id}.held_by': None,
-                    f'seats.{seat_id}.hold_until': None
-                }}
-            )
+    # HOLD atómico del bloque completo
+    held, conflicts = seat_store.hold(event_id, requested_seats, request.user_id, hold_until, now)
+    if conflicts:
+        seat_quota.release(event_id, request.user_id, requested_seats, hold_until)
+
+    if conflicts and len(conflicts) < len(requested_seats):
         return jsonify({
-            'error': f'No se pudieron reservar todos los asientos. Ocupados: {", ".join(failed)}'
+            'error': f'No se pudieron reservar todos los asientos. Ocupados: {", ".join(conflicts)}',
+            'conflicts': conflicts
         }), 409
 
-    if failed:
+    if conflicts:
         return jsonify({
-            'error': f'Asientos no disponibles: {", ".join(failed)}'
+            'error': f'Asientos no disponibles: {", ".join(conflicts)}',
+            'conflicts': conflicts
         }), 409
 
-    audit(request.user_id, 'HOLD_SEATS', f'Evento {event_id}: {", ".join(held)}')
+    audit.log(request.user_id, 'HOLD_SEATS', f'Evento {event_id}: {", ".join(held)}')
     return jsonify({
         'message': 'Asientos reservados temporalmente (10 min)',
         'seats': held,
@@ -525,30 +590,16 @@ def hold_seats(event_id):
 def release_seats(event_id):
     """Libera asientos en HOLD del usuario actual."""
     data = request.get_json() or {}
-    seats_to_release = data.get('seats', [])
+    try:
+        seats_to_release = normalize_seat_ids(data.get('seats', []))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
 
     if not seats_to_release:
         return jsonify({'error': 'Debe indicar asientos a liberar'}), 400
 
-    released = []
-    for seat_id in seats_to_release:
-        result = seat_maps.find_one_and_update(
-            {
-                'event_id': event_id,
-                f'seats.{seat_id}.status': 'HELD',
-                f'seats.{seat_id}.held_by': request.user_id
-            },
-            {
-                '$set': {
-                    f'seats.{seat_id}.status': 'FREE',
-                    f'seats.{seat_id}.held_by': None,
-                    f'seats.{seat_id}.hold_until': None
-                }
-            }
-        )
-        if result:
-            released.append(seat_id)
-
+    released = seat_store.release(event_id, seats_to_release, request.user_id)
+    seat_quota.release(event_id, request.user_id, released)
     return jsonify({'released': released})
 
 
@@ -560,52 +611,66 @@ def confirm_seats(event_id):
     Body: { "seats": ["A1","A2"], "user_id": 5 }
     """
     data = request.get_json() or {}
-    seats_to_confirm = data.get('seats', [])
+    try:
+        seats_to_confirm = normalize_seat_ids(data.get('seats', []))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if not seats_to_confirm:
+        return jsonify({'error': 'Debe indicar asientos a confirmar'}), 400
     user_id = data.get('user_id', request.user_id)
 
-    confirmed = []
-    for seat_id in seats_to_confirm:
-        result = seat_maps.find_one_and_update(
-            {
-                'event_id': event_id,
-                f'seats.{seat_id}.status': 'HELD',
-                f'seats.{seat_id}.held_by': user_id
-            },
-            {
-                '$set': {
-                    f'seats.{seat_id}.status': 'SOLD',
-                    f'seats.{seat_id}.hold_until': None
-                }
-            }
-        )
-        if result:
-            confirmed.append(seat_id)
-
+    # Un HOLD vencido que el barrido aún no liberó no se puede vender
+    confirmed = seat_store.confirm(event_id, seats_to_confirm, user_id, datetime.datetime.utcnow())
+    seat_quota.confirm(event_id, user_id, confirmed)
     return jsonify({'confirmed': confirmed})
 
 
+@app.route('/api/events/<int:event_id>/unconfirm-seats', methods=['POST'])
+@token_required
+def unconfirm_seats(event_id):
+    """
+    Deshace confirm-seats para el usuario del token: los asientos SOLD
+    vuelven a HOLD por 10 minutos (Orders Service, si la orden no se pudo
+    guardar después de confirmar). El reintento de la compra los encuentra.
+    Body: { "seats": ["A1","A2"] }
+    """
+    data = request.get_json() or {}
+    try:
+        seats_to_restore = normalize_seat_ids(data.get('seats', []))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    if not seats_to_restore:
+        return jsonify({'error': 'Debe indicar asientos'}), 400
+
+    hold_until = datetime.datetime.utcnow() + datetime.timedelta(minutes=10)
+    restored = seat_store.unconfirm(event_id, seats_to_restore, request.user_id, hold_until)
+    seat_quota.unconfirm(event_id, request.user_id, restored, hold_until)
+    audit.log(request.user_id, 'UNCONFIRM_SEATS', f'Evento {event_id}: {", ".join(restored)}')
+    return jsonify({'restored': restored, 'hold_until': hold_until.isoformat()})
+
+
+@app.route('/api/events/<int:event_id>/holds/mine', methods=['GET'])
+@token_required
+def my_holds(event_id):
+    """
+    HOLDs vigentes del usuario del token en el evento (lo usa Orders Service
+    al confirmar). Consulta por índice: no lee el mapa completo.
+    """
+    holds = seat_store.user_holds(event_id, request.user_id, datetime.datetime.utcnow())
+    return jsonify({
+        'seats': sorted(holds),
+        'hold_until': min(holds.values()).isoformat() if holds else None
+    })
+
+
 @app.route('/api/events/<int:event_id>/stats', methods=['GET'])
 @admin_required
 def event_stats(event_id):
     """Estadísticas del evento: asientos free/held/sold."""
-    doc = seat_maps.find_one({'event_id': event_id}, {'_id': 0})
-    if not doc:
+    stats = seat_store.stats(event_id, datetime.datetime.utcnow())
+    if stats is None:
         return jsonify({'error': 'Mapa no encontrado'}), 404
-
-    now = datetime.datetime.utcnow()
-    stats = {'free': 0, 'held': 0, 'sold': 0, 'total': 0}
-    for seat_id, seat in doc.get('seats', {}).items():
-        stats['total'] += 1
-        status = seat['status']
-        if status == 'HELD' and seat.get('hold_until') and seat['hold_until'] < now:
-            stats['free'] += 1
-        elif status == 'FREE':
-            stats['free'] += 1
-        elif status == 'HELD':
-            stats['held'] += 1
-        elif status == 'SOLD':
-            stats['sold'] += 1
-
     return jsonify(stats)
 
 
@@ -613,38 +678,79 @@ def event_stats(event_id):
 #  Limpieza automática de holds expirados (background thread)
 # ═══════════════════════════════════════════════════════════════
 
-def _release_expired(event_id=None):
-    """Libera todos los holds expirados de un evento (o todos)."""
-    now = datetime.datetime.utcnow()
-    query = {} if event_id is None else {'event_id': event_id}
+sweeper_stats = {
+    'leader': False,    # este proceso tiene el lock y es quien barre
+    'runs': 0,
+    'errors': 0,
+    'freed_total': 0,
+    'last_freed': 0,
+    'last_duration_ms': 0.0,
+    'last_active_events': 0,
+}
 
-    for doc in seat_maps.find(query):
-        updates = {}
-        for seat_id, seat in doc.get('seats', {}).items():
-            if seat['status'] == 'HELD' and seat.get('hold_until') and seat['hold_until'] < now:
-                updates[f'seats.{seat_id}.status'] = 'FREE'
-                updates[f'seats.{seat_id}.held_by'] = None
-                updates[f'seats.{seat_id}.hold_until'] = None
-        if updates:
-            seat_maps.update_one({'_id': doc['_id']}, {'$set': updates})
+
+def _active_event_ids():
+    conn = get_pg()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT id FROM events WHERE status = 'ACTIVE'")
+            return [row[0] for row in cur.fetchall()]
+    finally:
+        conn.close()
+
+
+def _release_expired():
+    """
+    Libera los holds vencidos de los eventos ACTIVE usando el índice de
+    expiración del motor de asientos. Devuelve (liberados, duración en ms).
+    """
+    started = time.monotonic()
+    event_ids = _active_event_ids()
+    freed = seat_store.release_expired(datetime.datetime.utcnow(), event_ids) if event_ids else 0
+    elapsed_ms = (time.monotonic() - started) * 1000
+
+    sweeper_stats['runs'] += 1
+    sweeper_stats['freed_total'] += freed
+    sweeper_stats['last_freed'] = freed
+    sweeper_stats['last_duration_ms'] = round(elapsed_ms, 2)
+    sweeper_stats['last_active_events'] = len(event_ids)
+    return freed, elapsed_ms
+
+
+metrics.register('hold_sweeper', lambda: dict(sweeper_stats))
 
 
 def hold_cleanup_worker():
-    """Hilo en segundo plano que limpia holds expirados cada 30 segundos."""
+    """
+    Hilo en segundo plano que limpia holds expirados cada 30 segundos.
+
+    Con varios workers de gunicorn cada uno arranca este hilo, pero solo
+    barre quien obtiene el lock de SWEEPER_LOCK_FILE; los demás quedan
+    esperándolo y uno toma el relevo si ese proceso termina.
+    """
+    lock_file = open(os.environ.get('SWEEPER_LOCK_FILE', '/tmp/teatro-hold-sweeper.lock'), 'a')
+    fcntl.flock(lock_file, fcntl.LOCK_EX)
+    sweeper_stats['leader'] = True
+    print(f"🧹 Limpieza de holds activa en el proceso {os.getpid()} (cada 30s)")
     while True:
         try:
-            _release_expired()
+            freed, elapsed_ms = _release_expired()
+            if freed:
+                print(f"[HOLD CLEANUP] {freed} holds liberados en {elapsed_ms:.1f} ms")
         except Exception as e:
+            sweeper_stats['errors'] += 1
             print(f"[HOLD CLEANUP] Error: {e}")
         time.sleep(30)
 
 
+def start_background_tasks():
+    """Llamado al arrancar el proceso (directo o desde gunicorn_conf.post_worker_init)."""
+    threading.Thread(target=hold_cleanup_worker, daemon=True).start()
+
+
 # ── Main ───────────────────────────────────────────────────────
 if __name__ == '__main__':
-    # Iniciar hilo de limpieza
-    cleanup_thread = threading.Thread(target=hold_cleanup_worker, daemon=True)
-    cleanup_thread.start()
-    print("🧹 Hilo de limpieza de holds iniciado (cada 30s)")
+    start_background_tasks()
 
     port = int(os.environ.get('SEATING_PORT', 7001))
     debug = os.environ.get('FLASK_DEBUG', 'false').lower() == 'true'
@@ -0,0 +1,56 @@
+"""
+Formato compacto del mapa de asientos (`?format=compact`).
+
+Cada asiento ocupa 2 bits con su estado, en orden fila por fila (A1, A2,
+..., B1, ...), cuatro asientos por byte empezando por los bits altos. El
+resultado va en base64 junto con las filas y columnas del mapa. No incluye
+`held_by` ni `hold_until` de otros usuarios; los asientos del propio
+usuario se informan aparte en `mine`.
+
+Un HOLD vencido se codifica como FREE, igual que en el formato JSON.
+"""
+
+import base64
+
+CODES = {'FREE': 0, 'HELD': 1, 'SOLD': 2}
+STATUSES = {code: status for status, code in CODES.items()}
+
+
+def seat_code(seat, now):
+    status = seat.get('status', 'FREE')
+    if status == 'HELD' and seat.get('hold_until') and seat['hold_until'] < now:
+        return CODES['FREE']
+    return CODES.get(status, CODES['FREE'])
+
+
+def encode(seats, rows, cols, now):
+    """Empaqueta el estado de todos los asientos del mapa; devuelve base64."""
+    packed = bytearray((rows * cols + 3) // 4)
+    i = 0
+    for r in range(rows):
+        row_letter = chr(65 + r)
+        for c in range(1, cols + 1):
+            seat = seats.get(f'{row_letter}{c}')
+            if seat:
+                packed[i // 4] |= seat_code(seat, now) << (6 - 2 * (i % 4))
+            i += 1
+    return base64.b64encode(bytes(packed)).decode('ascii')
+
+
+def owned_by(seats, user_id, now):
+    """Asientos vendidos o en HOLD vigente del usuario: {seat_id: {status, hold_until}}."""
+    mine = {}
+    if user_id is None:
+        return mine
+    for seat_id, seat in seats.items():
+        if seat.get('held_by') != user_id:
+            continue
+        code = seat_code(seat, now)
+        if code == CODES['FREE']:
+            continue
+        hold_until = seat.get('hold_until')
+        mine[seat_id] = {
+            'status': STATUSES[code],
+            'hold_until': hold_until.isoformat() if hasattr(hold_until, 'isoformat') else hold_until
+        }
+    return mine
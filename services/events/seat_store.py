@@ -0,0 +1,778 @@
+"""
+Almacenamiento de mapas de asientos en MongoDB.
+
+Dos motores con la misma interfaz (`SeatStore`):
+
+- `EmbeddedSeatStore` ("embedded"): un documento por evento en `seat_maps`
+  con todos los asientos en el sub-dict `seats`. Es el formato original.
+- `PerSeatStore` ("per_seat"): `seat_maps` guarda solo la cabecera del mapa
+  (sala, filas, columnas) y cada asiento es un documento de la colección
+  `seats`, indexado por event_id + seat_id + status. Las reservas sobre
+  asientos distintos ya no compiten por el mismo documento.
+
+El motor se elige con SEAT_STORE (por defecto "embedded"). Para pasar los
+mapas existentes al formato por asiento: scripts/migrate_seats.py.
+
+La reserva (`hold`) es todo-o-nada en ambos motores: o se reservan todos
+los asientos pedidos o ninguno, y se informa cuáles estaban ocupados.
+
+La expiración de holds se resuelve por índice en ambos motores: el motor
+embebido mantiene la colección auxiliar `seat_holds` (un documento por
+hold vigente, indexado por hold_until) y el motor por asiento indexa
+status + hold_until. `release_expired` solo toca holds vencidos.
+
+Versionado: cada mapa tiene un contador `version` que sube con cada
+hold, release, confirm o expiración, y cada asiento modificado queda
+marcado con la versión que lo cambió (`v` en el motor embebido, `version`
+en el motor por asiento). `get_map(event_id, since=N)` devuelve solo los
+asientos cambiados después de N. En el motor por asiento la versión
+publicada es la última sin escrituras anteriores en curso (ver
+PerSeatStore).
+"""
+
+import re
+import datetime
+from pymongo import ASCENDING, ReplaceOne, ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+SEAT_ID_RE = re.compile(r'^[A-Z][0-9]{1,4}$')
+
+
+def _seat_ids(rows, cols):
+    for r in range(rows):
+        row_letter = chr(65 + r)
+        for c in range(1, cols + 1):
+            yield row_letter, c, f"{row_letter}{c}"
+
+
+def normalize_seat_ids(seat_ids):
+    """
+    Valida los IDs (se usan como ruta de campo en Mongo) y quita duplicados
+    conservando el orden. Lanza ValueError si alguno es inválido.
+    """
+    if not isinstance(seat_ids, list):
+        raise ValueError('seats debe ser una lista')
+    result = []
+    for seat_id in seat_ids:
+        if not isinstance(seat_id, str) or not SEAT_ID_RE.match(seat_id):
+            raise ValueError(f'Asiento inválido: {seat_id!r}')
+        if seat_id not in result:
+            result.append(seat_id)
+    return result
+
+
+def _is_available(seat, now):
+    if not seat:
+        return False
+    if seat.get('status') == 'FREE':
+        return True
+    return seat.get('status') == 'HELD' and seat.get('hold_until') is not None and seat['hold_until'] < now
+
+
+class _HoldConflict(Exception):
+    def __init__(self, conflicts):
+        super().__init__(conflicts)
+        self.conflicts = conflicts
+
+
+def _new_seat():
+    return {
+        'status': 'FREE',
+        'zone': 'GENERAL',
+        'held_by': None,
+        'hold_until': None
+    }
+
+
+class SeatStore:
+    """Interfaz común de los motores de asientos."""
+
+    def __init__(self, mongo_db):
+        self.db = mongo_db
+        self.maps = mongo_db['seat_maps']
+
+    def ensure_indexes(self):
+        self.maps.create_index([('event_id', ASCENDING)], unique=True)
+
+    def create_map(self, event_id, venue):
+        raise NotImplementedError
+
+    def get_version(self, event_id):
+        """Versión actual del mapa (None si no existe). Lectura de un solo campo."""
+        doc = self.maps.find_one({'event_id': event_id}, {'_id': 0, 'version': 1})
+        return None if doc is None else doc.get('version', 0)
+
+    def get_map(self, event_id, since=None):
+        """
+        Devuelve {event_id, venue_id, venue_name, rows, cols, version,
+        seats: {id: seat}} o None. Con `since`, `seats` contiene solo los
+        asientos cambiados después de esa versión.
+        """
+        raise NotImplementedError
+
+    def hold(self, event_id, seat_ids, user_id, hold_until, now):
+        """
+        Reserva todos los asientos libres (o con HOLD expirado) o ninguno.
+        Devuelve (held, conflicts): si hay conflictos, held es [].
+        """
+        raise NotImplementedError
+
+    def release(self, event_id, seat_ids, user_id):
+        """Libera los asientos en HOLD del usuario. Devuelve la lista liberada."""
+        raise NotImplementedError
+
+    def confirm(self, event_id, seat_ids, user_id, now=None):
+        """
+        Pasa a SOLD los asientos en HOLD del usuario (con `now`, solo los HOLD
+        no vencidos). Devuelve la lista confirmada.
+        """
+        raise NotImplementedError
+
+    def unconfirm(self, event_id, seat_ids, user_id, hold_until):
+        """
+        Deshace `confirm`: los asientos SOLD del usuario vuelven a HOLD hasta
+        `hold_until` (la compra falló después de confirmar). Devuelve la lista.
+        """
+        raise NotImplementedError
+
+    def release_expired(self, now, event_ids):
+        """Libera los holds vencidos de los eventos dados. Devuelve cuántos liberó."""
+        raise NotImplementedError
+
+    def user_holds(self, event_id, user_id, now):
+        """HOLDs vigentes del usuario en el evento: {seat_id: hold_until}. Por índice."""
+        raise NotImplementedError
+
+    def usage_by_user(self, event_id, now):
+        """
+        Recorre el mapa completo: {user_id: {'holds': {seat_id: hold_until}, 'sold': n}}.
+        Solo para reconstruir `seat_quota` (scripts/rebuild_seat_quota.py).
+        """
+        doc = self.get_map(event_id)
+        usage = {}
+        for seat_id, s in (doc or {}).get('seats', {}).items():
+            if s.get('held_by') is None:
+                continue
+            entry = usage.setdefault(s['held_by'], {'holds': {}, 'sold': 0})
+            if s['status'] == 'SOLD':
+                entry['sold'] += 1
+            elif s['status'] == 'HELD' and s.get('hold_until') and s['hold_until'] >= now:
+                entry['holds'][seat_id] = s['hold_until']
+        return usage
+
+    def stats(self, event_id, now):
+        doc = self.get_map(event_id)
+        if not doc:
+            return None
+        stats = {'free': 0, 'held': 0, 'sold': 0, 'total': 0}
+        for seat in doc.get('seats', {}).values():
+            stats['total'] += 1
+            status = seat['status']
+            if status == 'HELD' and seat.get('hold_until') and seat['hold_until'] < now:
+                stats['free'] += 1
+            elif status == 'FREE':
+                stats['free'] += 1
+            elif status == 'HELD':
+                stats['held'] += 1
+            elif status == 'SOLD':
+                stats['sold'] += 1
+        return stats
+
+
+# ═══════════════════════════════════════════════════════════════
+#  Motor "embedded": un documento por evento
+# ═══════════════════════════════════════════════════════════════
+
+# Condiciones sobre un asiento del documento embebido, en tres formas:
+# filtro de consulta, expresión de pipeline y predicado Python (para leer
+# la imagen previa que devuelve find_one_and_update).
+
+def _held_by(user_id, now=None):
+    """HOLD del usuario; con `now`, además no vencido."""
+    if now is None:
+        return (
+            lambda sid: {f'seats.{sid}.status': 'HELD', f'seats.{sid}.held_by': user_id},
+            lambda path: {'$and': [{'$eq': [f'{path}.status', 'HELD']},
+                                   {'$eq': [f'{path}.held_by', user_id]}]},
+            lambda seat: bool(seat) and seat.get('status') == 'HELD' and seat.get('held_by') == user_id
+        )
+    return (
+        lambda sid: {f'seats.{sid}.status': 'HELD', f'seats.{sid}.held_by': user_id,
+                     f'seats.{sid}.hold_until': {'$gte': now}},
+        lambda path: {'$and': [{'$eq': [f'{path}.status', 'HELD']},
+                               {'$eq': [f'{path}.held_by', user_id]},
+                               {'$gte': [f'{path}.hold_until', now]}]},
+        lambda seat: (bool(seat) and seat.get('status') == 'HELD' and seat.get('held_by') == user_id
+                      and seat.get('hold_until') is not None and seat['hold_until'] >= now)
+    )
+
+
+def _sold_to(user_id):
+    return (
+        lambda sid: {f'seats.{sid}.status': 'SOLD', f'seats.{sid}.held_by': user_id},
+        lambda path: {'$and': [{'$eq': [f'{path}.status', 'SOLD']},
+                               {'$eq': [f'{path}.held_by', user_id]}]},
+        lambda seat: bool(seat) and seat.get('status') == 'SOLD' and seat.get('held_by') == user_id
+    )
+
+
+def _expired(now):
+    return (
+        lambda sid: {f'seats.{sid}.status': 'HELD', f'seats.{sid}.hold_until': {'$lt': now}},
+        lambda path: {'$and': [{'$eq': [f'{path}.status', 'HELD']},
+                               {'$lt': [f'{path}.hold_until', now]}]},
+        lambda seat: (bool(seat) and seat.get('status') == 'HELD'
+                      and seat.get('hold_until') is not None and seat['hold_until'] < now)
+    )
+
+
+_BUMP_VERSION = {'$set': {'version': {'$add': [{'$ifNull': ['$version', 0]}, 1]}}}
+
+
+class EmbeddedSeatStore(SeatStore):
+
+    def __init__(self, mongo_db):
+        super().__init__(mongo_db)
+        self.holds = mongo_db['seat_holds']
+
+    def ensure_indexes(self):
+        super().ensure_indexes()
+        self.holds.create_index([('event_id', ASCENDING), ('seat_id', ASCENDING)], unique=True)
+        self.holds.create_index([('hold_until', ASCENDING)])
+        self.holds.create_index([('event_id', ASCENDING), ('held_by', ASCENDING)])
+
+    def _remember_holds(self, event_id, seat_ids, user_id, hold_until):
+        if seat_ids:
+            self.holds.bulk_write([
+                ReplaceOne(
+                    {'event_id': event_id, 'seat_id': seat_id},
+                    {'event_id': event_id, 'seat_id': seat_id, 'held_by': user_id, 'hold_until': hold_until},
+                    upsert=True
+                )
+                for seat_id in seat_ids
+            ], ordered=False)
+
+    def _forget_holds(self, event_id, seat_ids):
+        if seat_ids:
+            self.holds.delete_many({'event_id': event_id, 'seat_id': {'$in': list(seat_ids)}})
+
+    def create_map(self, event_id, venue):
+        seats = {seat_id: _new_seat() for _, _, seat_id in _seat_ids(venue['rows_count'], venue['cols_count'])}
+        self.maps.insert_one({
+            'event_id': event_id,
+            'venue_id': venue['id'],
+            'venue_name': venue['name'],
+            'rows': venue['rows_count'],
+            'cols': venue['cols_count'],
+            'version': 0,
+            'seats': seats
+        })
+
+    def get_map(self, event_id, since=None):
+        doc = self.maps.find_one({'event_id': event_id}, {'_id': 0})
+        if not doc:
+            return None
+        doc.setdefault('version', 0)
+        seats = doc.get('seats', {})
+        if since is not None:
+            seats = {sid: s for sid, s in seats.items() if s.get('v', 0) > since}
+        for seat in seats.values():
+            seat.pop('v', None)
+        doc['seats'] = seats
+        return doc
+
+    def _transition(self, event_id, seat_ids, condition, new_values):
+        """
+        Aplica `new_values` a los asientos que cumplen `condition` en un único
+        find_one_and_update con pipeline (sube la versión y marca cada asiento
+        cambiado). Devuelve los asientos que cambiaron según la imagen previa.
+        """
+        if not seat_ids:
+            return []
+        query_cond, expr_cond, matches = condition
+        stamped = dict(new_values, v='$version')
+        updates = {}
+        for seat_id in seat_ids:
+            path = f'$seats.{seat_id}'
+            updates[f'seats.{seat_id}'] = {
+                '$cond': [expr_cond(path), {'$mergeObjects': [path, stamped]}, path]
+            }
+        before = self.maps.find_one_and_update(
+            {'event_id': event_id, '$or': [query_cond(seat_id) for seat_id in seat_ids]},
+            [_BUMP_VERSION, {'$set': updates}],
+            projection={f'seats.{seat_id}': 1 for seat_id in seat_ids},
+            return_document=ReturnDocument.BEFORE
+        )
+        if not before:
+            return []
+        seats = before.get('seats', {})
+        return [seat_id for seat_id in seat_ids if matches(seats.get(seat_id))]
+
+    def hold(self, event_id, seat_ids, user_id, hold_until, now):
+        # Todos los asientos viven en el mismo documento: un único update_one
+        # con la condición de cada asiento es atómico por definición.
+        conditions = [
+            {'$or': [
+                {f'seats.{seat_id}.status': 'FREE'},
+                {
+                    f'seats.{seat_id}.status': 'HELD',
+                    f'seats.{seat_id}.hold_until': {'$lt': now}
+                }
+            ]}
+            for seat_id in seat_ids
+        ]
+        held_values = {'status': 'HELD', 'held_by': user_id, 'hold_until': hold_until, 'v': '$version'}
+        updates = {
+            f'seats.{seat_id}': {'$mergeObjects': [f'$seats.{seat_id}', held_values]}
+            for seat_id in seat_ids
+        }
+
+        result = self.maps.update_one(
+            {'event_id': event_id, '$and': conditions},
+            [_BUMP_VERSION, {'$set': updates}]
+        )
+        if result.matched_count:
+            self._remember_holds(event_id, seat_ids, user_id, hold_until)
+            return list(seat_ids), []
+
+        # Falló: leer solo esos asientos para saber cuáles estaban ocupados
+        doc = self.maps.find_one(
+            {'event_id': event_id},
+            {f'seats.{seat_id}': 1 for seat_id in seat_ids}
+        ) or {}
+        seats = doc.get('seats', {})
+        conflicts = [s for s in seat_ids if not _is_available(seats.get(s), now)]
+        # Si entre ambas lecturas se liberaron, se informa el bloque completo
+        return [], conflicts or list(seat_ids)
+
+    def release(self, event_id, seat_ids, user_id):
+        released = self._transition(event_id, seat_ids, _held_by(user_id),
+                                    {'status': 'FREE', 'held_by': None, 'hold_until': None})
+        self._forget_holds(event_id, released)
+        return released
+
+    def confirm(self, event_id, seat_ids, user_id, now=None):
+        confirmed = self._transition(event_id, seat_ids, _held_by(user_id, now),
+                                     {'status': 'SOLD', 'hold_until': None})
+        self._forget_holds(event_id, confirmed)
+        return confirmed
+
+    def unconfirm(self, event_id, seat_ids, user_id, hold_until):
+        restored = self._transition(event_id, seat_ids, _sold_to(user_id),
+                                    {'status': 'HELD', 'hold_until': hold_until})
+        self._remember_holds(event_id, restored, user_id, hold_until)
+        return restored
+
+    def release_expired(self, now, event_ids):
+        expired = list(self.holds.find(
+            {'hold_until': {'$lt': now}, 'event_id': {'$in': list(event_ids)}},
+            {'event_id': 1, 'seat_id': 1}
+        ))
+        by_event = {}
+        for h in expired:
+            by_event.setdefault(h['event_id'], []).append(h['seat_id'])
+
+        freed = 0
+        for event_id, seat_ids in by_event.items():
+            # Cada asiento se libera solo si sigue en HOLD vencido, aunque
+            # otro proceso lo haya tocado desde la consulta anterior.
+            freed += len(self._transition(event_id, seat_ids, _expired(now),
+                                          {'status': 'FREE', 'held_by': None, 'hold_until': None}))
+
+        if expired:
+            self.holds.delete_many({'_id': {'$in': [h['_id'] for h in expired]}, 'hold_until': {'$lt': now}})
+        return freed
+
+    def user_holds(self, event_id, user_id, now):
+        candidates = [h['seat_id'] for h in self.holds.find(
+            {'event_id': event_id, 'held_by': user_id, 'hold_until': {'$gte': now}},
+            {'seat_id': 1}
+        )]
+        if not candidates:
+            return {}
+        # seat_holds es un índice auxiliar: el estado vigente está en el mapa
+        doc = self.maps.find_one(
+            {'event_id': event_id},
+            {f'seats.{seat_id}': 1 for seat_id in candidates}
+        ) or {}
+        return {
+            seat_id: seat['hold_until']
+            for seat_id, seat in doc.get('seats', {}).items()
+            if seat.get('status') == 'HELD' and seat.get('held_by') == user_id
+            and seat.get('hold_until') and seat['hold_until'] >= now
+        }
+
+
+# ═══════════════════════════════════════════════════════════════
+#  Motor "per_seat": un documento por asiento
+# ═══════════════════════════════════════════════════════════════
+
+class PerSeatStore(SeatStore):
+    """
+    La versión se reserva en la cabecera antes de marcar los asientos y
+    queda anotada en `pending` hasta que la escritura termina. Dos
+    escrituras concurrentes pueden hacerse visibles fuera de orden (N+1
+    antes que N), así que los lectores solo publican hasta la versión
+    anterior a la menor aún en curso: `get_version` y `get_map` devuelven
+    esa versión y los deltas no pasan de ella. Un cliente nunca avanza su
+    cursor por encima de un cambio que todavía no puede ver.
+
+    Una versión en curso por más de PENDING_TIMEOUT segundos (proceso
+    caído a mitad de una escritura) deja de frenar a los lectores.
+
+    Todas las escrituras de un evento pasan por la cabecera, que queda como
+    único punto de contención. Por eso la versión se toma fuera de la
+    transacción de `hold` (MONGO_TRANSACTIONS): dentro, dos reservas de
+    asientos distintos chocarían en la cabecera y una se reintentaría. Una
+    versión reservada cuyo bloque luego falla queda sin asientos; el
+    cliente solo ve un delta vacío.
+    """
+
+    PENDING_TIMEOUT = 30
+
+    def __init__(self, mongo_db, use_transactions=False):
+        super().__init__(mongo_db)
+        self.seats = mongo_db['seats']
+        self.use_transactions = use_transactions
+
+    def ensure_indexes(self):
+        super().ensure_indexes()
+        self.seats.create_index([('event_id', ASCENDING), ('seat_id', ASCENDING)], unique=True)
+        self.seats.create_index([('event_id', ASCENDING), ('seat_id', ASCENDING), ('status', ASCENDING)])
+        self.seats.create_index([('status', ASCENDING), ('hold_until', ASCENDING)])
+        self.seats.create_index([('event_id', ASCENDING), ('version', ASCENDING)])
+        self.seats.create_index([('event_id', ASCENDING), ('held_by', ASCENDING), ('status', ASCENDING)])
+
+    @staticmethod
+    def seat_docs(event_id, rows, cols, seats=None):
+        """Documentos de asiento para un mapa (desde `seats` embebido si se da)."""
+        seats = seats or {}
+        for row_letter, col, seat_id in _seat_ids(rows, cols):
+            seat = dict(seats.get(seat_id) or _new_seat())
+            seat['version'] = seat.pop('v', 0)
+            seat.update({'event_id': event_id, 'seat_id': seat_id, 'row': row_letter, 'col': col})
+            yield seat
+
+    def create_map(self, event_id, venue):
+        self.maps.insert_one({
+            'event_id': event_id,
+            'venue_id': venue['id'],
+            'venue_name': venue['name'],
+            'rows': venue['rows_count'],
+            'cols': venue['cols_count'],
+            'version': 0,
+            'layout': 'per_seat'
+        })
+        self.seats.insert_many(
+            list(self.seat_docs(event_id, venue['rows_count'], venue['cols_count'])),
+            ordered=False
+        )
+
+    def _visible_version(self, doc):
+        """Última versión sin escrituras anteriores en curso."""
+        cutoff = datetime.datetime.utcnow() - datetime.timedelta(seconds=self.PENDING_TIMEOUT)
+        pending = [p['v'] for p in doc.get('pending', []) if p['at'] >= cutoff]
+        return min(pending) - 1 if pending else doc.get('version', 0)
+
+    def get_version(self, event_id):
+        doc = self.maps.find_one({'event_id': event_id}, {'_id': 0, 'version': 1, 'pending': 1})
+        return None if doc is None else self._visible_version(doc)
+
+    def get_map(self, event_id, since=None):
+        doc = self.maps.find_one({'event_id': event_id}, {'_id': 0, 'layout': 0})
+        if not doc:
+            return None
+        doc['version'] = self._visible_version(doc)
+        doc.pop('pending', None)
+        query = {'event_id': event_id}
+        if since is not None:
+            query['version'] = {'$gt': since, '$lte': doc['version']}
+        doc['seats'] = {
+            s.pop('seat_id'): s
+            for s in self.seats.find(
+                query,
+                {'_id': 0, 'seat_id': 1, 'status': 1, 'zone': 1, 'held_by': 1, 'hold_until': 1}
+            )
+        }
+        return doc
+
+    def _next_version(self, event_id):
+        """Reserva la siguiente versión y la anota en curso (cerrar con `_done`)."""
+        doc = self.maps.find_one_and_update(
+            {'event_id': event_id},
+            [
+                {'$set': {'version': {'$add': [{'$ifNull': ['$version', 0]}, 1]}}},
+                {'$set': {'pending': {'$concatArrays': [
+                    {'$ifNull': ['$pending', []]},
+                    [{'v': '$version', 'at': datetime.datetime.utcnow()}]
+                ]}}}
+            ],
+            projection={'version': 1},
+            return_document=ReturnDocument.AFTER
+        )
+        return doc['version'] if doc else None
+
+    def _done(self, event_id, version):
+        """La escritura de `version` ya es visible; también descarta anotaciones vencidas."""
+        cutoff = datetime.datetime.utcnow() - datetime.timedelta(seconds=self.PENDING_TIMEOUT)
+        self.maps.update_one(
+            {'event_id': event_id},
+            {'$pull': {'pending': {'$or': [{'v': version}, {'at': {'$lt': cutoff}}]}}}
+        )
+
+    def _hold_batch(self, event_id, seat_ids, user_id, hold_until, now, version, session=None):
+        result = self.seats.update_many(
+            {
+                'event_id': event_id,
+                'seat_id': {'$in': seat_ids},
+                '$or': [
+                    {'status': 'FREE'},
+                    {'status': 'HELD', 'hold_until': {'$lt': now}}
+                ]
+            },
+            {'$set': {'status': 'HELD', 'held_by': user_id, 'hold_until': hold_until, 'version': version}},
+            session=session
+        )
+        if result.modified_count == len(seat_ids):
+            return
+
+        mine = {'event_id': event_id, 'seat_id': {'$in': seat_ids},
+                'held_by': user_id, 'hold_until': hold_until}
+        got = {d['seat_id'] for d in self.seats.find(mine, {'seat_id': 1}, session=session)}
+        if session is None:
+            # Sin transacción: deshacer lo reservado en una sola operación
+            undo_version = self._next_version(event_id)
+            try:
+                self.seats.update_many(mine, {'$set': {'status': 'FREE', 'held_by': None, 'hold_until': None,
+                                                       'version': undo_version}})
+            finally:
+                self._done(event_id, undo_version)
+        raise _HoldConflict([s for s in seat_ids if s not in got])
+
+    def hold(self, event_id, seat_ids, user_id, hold_until, now):
+        # Un update_many para todo el bloque. Con MONGO_TRANSACTIONS (requiere
+        # replica set) el bloque se aborta sin que nadie vea la reserva parcial;
+        # sin transacciones se compensa con un segundo update_many.
+        # La versión se toma antes y fuera de la transacción (ver la clase).
+        version = self._next_version(event_id)
+        if version is None:
+            return [], list(seat_ids)
+        try:
+            if self.use_transactions:
+                with self.db.client.start_session() as session:
+                    session.with_transaction(
+                        lambda s: self._hold_batch(event_id, seat_ids, user_id, hold_until, now, version, session=s)
+                    )
+            else:
+                self._hold_batch(event_id, seat_ids, user_id, hold_until, now, version)
+        except _HoldConflict as e:
+            return [], e.conflicts
+        finally:
+            self._done(event_id, version)
+        return list(seat_ids), []
+
+    def _transition(self, event_id, seat_ids, user_id, new_values, now=None, status='HELD'):
+        if not seat_ids:
+            return []
+        version = self._next_version(event_id)
+        if version is None:
+            return []
+        query = {'event_id': event_id, 'status': status, 'held_by': user_id}
+        if now is not None:
+            query['hold_until'] = {'$gte': now}
+        changed = []
+        try:
+            for seat_id in seat_ids:
+                result = self.seats.find_one_and_update(
+                    dict(query, seat_id=seat_id),
+                    {'$set': dict(new_values, version=version)},
+                    projection={'_id': 1}
+                )
+                if result:
+                    changed.append(seat_id)
+        finally:
+            self._done(event_id, version)
+        return changed
+
+    def release(self, event_id, seat_ids, user_id):
+        return self._transition(event_id, seat_ids, user_id,
+                                {'status': 'FREE', 'held_by': None, 'hold_until': None})
+
+    def confirm(self, event_id, seat_ids, user_id, now=None):
+        return self._transition(event_id, seat_ids, user_id,
+                                {'status': 'SOLD', 'hold_until': None}, now=now)
+
+    def unconfirm(self, event_id, seat_ids, user_id, hold_until):
+        return self._transition(event_id, seat_ids, user_id,
+                                {'status': 'HELD', 'hold_until': hold_until}, status='SOLD')
+
+    def release_expired(self, now, event_ids):
+        query = {'status': 'HELD', 'hold_until': {'$lt': now}, 'event_id': {'$in': list(event_ids)}}
+        freed = 0
+        for event_id in self.seats.distinct('event_id', query):
+            version = self._next_version(event_id)
+            try:
+                result = self.seats.update_many(
+                    dict(query, event_id=event_id),
+                    {'$set': {'status': 'FREE', 'held_by': None, 'hold_until': None, 'version': version}}
+                )
+            finally:
+                self._done(event_id, version)
+            freed += result.modified_count
+        return freed
+
+    def user_holds(self, event_id, user_id, now):
+        return {
+            s['seat_id']: s['hold_until']
+            for s in self.seats.find(
+                {'event_id': event_id, 'held_by': user_id, 'status': 'HELD', 'hold_until': {'$gte': now}},
+                {'_id': 0, 'seat_id': 1, 'hold_until': 1}
+            )
+        }
+
+
+# ═══════════════════════════════════════════════════════════════
+#  Cupo por usuario (max_per_user)
+# ═══════════════════════════════════════════════════════════════
+
+def _active_holds(now):
+    """Expresión: los pares {k: seat_id, v: hold_until} del documento aún vigentes."""
+    return {'$filter': {
+        'input': {'$objectToArray': {'$ifNull': ['$holds', {}]}},
+        'cond': {'$gte': ['$$this.v', now]}
+    }}
+
+
+class SeatQuota:
+    """
+    Un documento por (event_id, user_id) en `seat_quota`, con los HOLDs del
+    usuario ({seat_id: hold_until}) y cuántos asientos compró. Lo ocupado es
+    `sold` + HOLDs no vencidos, así que la expiración no requiere escribir
+    aquí: un HOLD vencido deja de contar solo, lo libere quien lo libere.
+
+    `reserve` comprueba el límite y anota los asientos en un único
+    update_one condicional; dos reservas simultáneas del mismo usuario no
+    pueden superar el límite entre ambas.
+    """
+
+    def __init__(self, mongo_db):
+        self.quota = mongo_db['seat_quota']
+
+    def ensure_indexes(self):
+        self.quota.create_index([('event_id', ASCENDING), ('user_id', ASCENDING)], unique=True)
+
+    def used(self, event_id, user_id, now):
+        doc = self.quota.find_one({'event_id': event_id, 'user_id': user_id}, {'_id': 0})
+        if not doc:
+            return 0
+        return doc.get('sold', 0) + sum(1 for until in doc.get('holds', {}).values() if until >= now)
+
+    def reserve(self, event_id, user_id, seat_ids, limit, hold_until, now):
+        """
+        Anota los asientos si caben en el límite. Devuelve False si no caben.
+        Un asiento que el usuario ya tiene en HOLD vigente no vuelve a contar.
+        """
+        if len(seat_ids) > limit:
+            return False
+        active = _active_holds(now)
+        new_seats = {'$setDifference': [
+            {'$literal': list(seat_ids)},
+            {'$map': {'input': active, 'in': '$$this.k'}}
+        ]}
+        for _ in range(2):
+            try:
+                self.quota.update_one(
+                    {
+                        'event_id': event_id,
+                        'user_id': user_id,
+                        '$expr': {'$lte': [
+                            {'$add': [{'$ifNull': ['$sold', 0]}, {'$size': active}, {'$size': new_seats}]},
+                            limit
+                        ]}
+                    },
+                    [{'$set': {
+                        'sold': {'$ifNull': ['$sold', 0]},
+                        # Un HOLD vigente del mismo asiento conserva su vencimiento
+                        'holds': {'$mergeObjects': [
+                            {seat_id: {'$literal': hold_until} for seat_id in seat_ids},
+                            {'$arrayToObject': active}
+                        ]}
+                    }}],
+                    upsert=True
+                )
+                return True
+            except DuplicateKeyError:
+                # O el documento existe y no cumple el límite (el upsert intentó
+                # insertar), o dos primeras reservas del usuario lo crearon a la
+                # vez: se reintenta una vez, ya con el documento creado
+                continue
+        return False
+
+    def release(self, event_id, user_id, seat_ids, hold_until=None):
+        """Quita los asientos; con `hold_until`, solo los anotados con ese vencimiento."""
+        if not seat_ids:
+            return
+        if hold_until is None:
+            self.quota.update_one(
+                {'event_id': event_id, 'user_id': user_id},
+                {'$unset': {f'holds.{seat_id}': '' for seat_id in seat_ids}}
+            )
+            return
+        self.quota.update_one(
+            {'event_id': event_id, 'user_id': user_id},
+            [{'$set': {'holds': {'$arrayToObject': {'$filter': {
+                'input': {'$objectToArray': {'$ifNull': ['$holds', {}]}},
+                'cond': {'$not': [{'$and': [
+                    {'$in': ['$$this.k', list(seat_ids)]},
+                    {'$eq': ['$$this.v', {'$literal': hold_until}]}
+                ]}]}
+            }}}}}]
+        )
+
+    def confirm(self, event_id, user_id, seat_ids):
+        """Los asientos pasan de HOLD a vendidos."""
+        if not seat_ids:
+            return
+        self.quota.update_one(
+            {'event_id': event_id, 'user_id': user_id},
+            {
+                '$unset': {f'holds.{seat_id}': '' for seat_id in seat_ids},
+                '$inc': {'sold': len(seat_ids)}
+            },
+            upsert=True
+        )
+
+    def unconfirm(self, event_id, user_id, seat_ids, hold_until):
+        """Deshace `confirm`: los asientos vuelven a contar como HOLD."""
+        if not seat_ids:
+            return
+        self.quota.update_one(
+            {'event_id': event_id, 'user_id': user_id},
+            {
+                '$set': {f'holds.{seat_id}': hold_until for seat_id in seat_ids},
+                '$inc': {'sold': -len(seat_ids)}
+            }
+        )
+
+    def rebuild(self, event_id, usage):
+        """Reemplaza los cupos del evento con `usage` (ver SeatStore.usage_by_user)."""
+        self.quota.delete_many({'event_id': event_id})
+        if usage:
+            self.quota.insert_many([
+                {'event_id': event_id, 'user_id': user_id, 'holds': u['holds'], 'sold': u['sold']}
+                for user_id, u in usage.items()
+            ])
+
+
+STORES = {
+    'embedded': EmbeddedSeatStore,
+    'per_seat': PerSeatStore,
+}
+
+
+def make_store(mongo_db, kind='embedded', **options):
+    if kind not in STORES:
+        raise ValueError(f"SEAT_STORE desconocido: {kind!r} (opciones: {', '.join(STORES)})")
+    if kind == 'per_seat':
+        return PerSeatStore(mongo_db, **options)
+    return STORES[kind](mongo_db)
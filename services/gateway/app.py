@@ -3,15 +3,35 @@ Web Gateway / Frontend — Puerto 8080
 Sirve la interfaz web (HTML/CSS/JS) y hace proxy a los microservicios.
 """
 
+# Con gevent instalado, el stream de asientos (SSE) mantiene miles de
+# conexiones abiertas como greenlets. El parcheo debe ir antes de importar
+# requests y demás módulos de red.
+try:
+    from gevent import monkey
+    monkey.patch_all()
+    from gevent.pywsgi import WSGIServer
+except ImportError:
+    WSGIServer = None
+
 import os
-import jwt as pyjwt
-import requests as http_requests
+import sys
+import time
+import hashlib
+import threading
+import jwt
 from werkzeug.utils import secure_filename
-from flask import (Flask, render_template, request, redirect,
-                   url_for, session, flash, jsonify, send_from_directory)
+from flask import (Flask, Response, render_template, request, redirect,
+                   url_for, session, flash, jsonify, send_from_directory, g)
+from concurrent.futures import ThreadPoolExecutor
 from functools import wraps
 from dotenv import load_dotenv
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common import admission, auth, cache, metrics, ratelimit  # noqa: E402
+from common import http_client as http_requests  # noqa: E402
+from seat_feed import SeatFeed  # noqa: E402
+from waiting_room import WaitingRoom  # noqa: E402
+
 load_dotenv(os.path.join(os.path.dirname(__file__), '..', '..', '.env'))
 
 app = Flask(__name__)
@@ -23,26 +43,163 @@ UPLOAD_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 
-SECRET_KEY = os.environ.get('JWT_SECRET', 'super-secret-key-change-me')
 AUTH_URL = os.environ.get('AUTH_SERVICE_URL', 'http://localhost:7000')
 EVENTS_URL = os.environ.get('EVENTS_SERVICE_URL', 'http://localhost:7001')
 ORDERS_URL = os.environ.get('ORDERS_SERVICE_URL', 'http://localhost:7002')
 TIMEOUT = 8
+# Segundos antes del vencimiento del access token en que se renueva
+TOKEN_RENEW_MARGIN = int(os.environ.get('TOKEN_RENEW_MARGIN', 60))
+
+# Renovaciones recientes (hash del refresh token usado → tokens nuevos):
+# las peticiones paralelas de una sesión (página, XHR, SSE) llegan con la
+# misma cookie; la primera rota el refresh token y las demás reutilizan su
+# resultado en vez de recibir 409 (o revocar la sesión al repetirlo).
+# Se guardan lo mismo que la gracia de reuso del Auth Service.
+_renewals = cache.TTLCache('token_renewals', maxsize=4096,
+                           ttl=float(os.environ.get('REFRESH_REUSE_GRACE', 10)))
+_renew_locks = [threading.Lock() for _ in range(64)]
+
+# Llamadas independientes a los backends en paralelo (ver admin_event_sales)
+_fanout = ThreadPoolExecutor(max_workers=int(os.environ.get('GATEWAY_FANOUT_WORKERS', 16)))
+
+seat_feed = SeatFeed(
+    EVENTS_URL,
+    poll_interval=float(os.environ.get('SEAT_STREAM_POLL', 1)),
+    heartbeat=float(os.environ.get('SEAT_STREAM_HEARTBEAT', 15)),
+    timeout=TIMEOUT
+)
+metrics.register('seat_feed', seat_feed.stats)
+
+# Sala de espera por evento (solo con WAITING_ROOM_ENABLED=true)
+WAITING_ROOM_POLL = int(os.environ.get('WAITING_ROOM_POLL', 5))
+waiting_room = WaitingRoom(
+    rate=float(os.environ.get('WAITING_ROOM_RATE', 5)),
+    burst=int(os.environ.get('WAITING_ROOM_BURST', 50)),
+    idle_timeout=WAITING_ROOM_POLL * 6
+)
+metrics.register('waiting_room', waiting_room.stats)
+
+# Listado de la portada: datos de cada página, en memoria por pocos segundos
+HOME_PAGE_SIZE = int(os.environ.get('HOME_PAGE_SIZE', 24))
+home_events_cache = cache.TTLCache(
+    'home_events',
+    maxsize=32,
+    ttl=float(os.environ.get('EVENT_LIST_CACHE_TTL', 5))
+)
+metrics.init_app(app)
 
 
 # ── Helpers ────────────────────────────────────────────────────
 
-def get_current_user():
-    """Decodifica el JWT almacenado en sesión."""
+@app.before_request
+def renew_session_token():
+    """
+    Renueva el access token de la sesión con el refresh token cuando está
+    por vencer (o venció), antes de que la petición lo use. Así el
+    comprador que vuelve no pasa por el login (bcrypt).
+    """
     token = session.get('token')
-    if not token:
-        return None
+    refresh_token = session.get('refresh_token')
+    if not token or not refresh_token or request.endpoint == 'static':
+        return
     try:
-        data = pyjwt.decode(token, SECRET_KEY, algorithms=['HS256'])
-        return data
-    except Exception:
-        session.pop('token', None)
-        return None
+        if auth.decode(token).get('exp', 0) - time.time() > TOKEN_RENEW_MARGIN:
+            return
+    except jwt.ExpiredSignatureError:
+        pass
+    except jwt.InvalidTokenError:
+        return
+    key = hashlib.sha256(refresh_token.encode()).hexdigest()
+    # Una renovación a la vez por refresh token (en este proceso)
+    with _renew_locks[int(key[:8], 16) % len(_renew_locks)]:
+        renewed = _renewals.get(key)
+        if renewed is None:
+            try:
+                resp = http_requests.post(f'{AUTH_URL}/api/auth/refresh',
+                                          json={'refresh_token': refresh_token}, timeout=TIMEOUT)
+            except Exception:
+                return
+            if resp.status_code in (400, 401):
+                session.pop('token', None)
+                session.pop('refresh_token', None)
+                return
+            if resp.status_code != 200:
+                # 409: lo renovó una petición atendida por otro proceso; la
+                # sesión no se toca para no pisar la cookie que trae el nuevo
+                return
+            data = resp.json()
+            renewed = (data['token'], data['refresh_token'])
+            _renewals.set(key, renewed)
+    session['token'], session['refresh_token'] = renewed
+
+
+def get_current_user():
+    """
+    Claims del JWT almacenado en sesión. La verificación se reutiliza entre
+    peticiones (common.auth) y dentro de la misma petición (g).
+    """
+    if '_current_user' in g:
+        return g._current_user
+    token = session.get('token')
+    user = None
+    if token:
+        try:
+            user = auth.decode(token)
+        except jwt.ExpiredSignatureError:
+            # No se quita de la sesión: si otra petición paralela lo renovó,
+            # esta respuesta pisaría su cookie con una sesión vacía
+            pass
+        except Exception:
+            session.pop('token', None)
+    g._current_user = user
+    return user
+
+
+def get_json_concurrently(calls):
+    """
+    GET en paralelo. `calls` es {nombre: (url, headers)}; devuelve
+    {nombre: JSON si respondió 200, None si no, o la excepción}.
+    """
+    futures = {
+        name: _fanout.submit(http_requests.get, url, headers=headers, timeout=TIMEOUT)
+        for name, (url, headers) in calls.items()
+    }
+    results = {}
+    for name, future in futures.items():
+        try:
+            resp = future.result()
+            results[name] = resp.json() if resp.status_code == 200 else None
+        except Exception as e:
+            results[name] = e
+    return results
+
+
+def admission_token(event_id):
+    """Token de la sala de espera guardado en sesión para este evento."""
+    return (session.get('admission') or {}).get(str(event_id))
+
+
+def store_admission(event_id, token):
+    tokens = {k: v for k, v in (session.get('admission') or {}).items()
+              if admission.seconds_left(v) > 0}
+    tokens[str(event_id)] = token
+    session['admission'] = tokens
+
+
+def needs_waiting_room(event_id, user):
+    """True si el usuario debe pasar por la cola antes de reservar en este evento."""
+    if not admission.enabled() or user['role'] == 'ADMIN':
+        return False
+    return not admission.verify(admission_token(event_id), event_id, user['user_id'])
+
+
+def user_key():
+    user = get_current_user()
+    return user['user_id'] if user else None
+
+
+def ip_key():
+    return request.remote_addr
 
 
 def auth_headers():
@@ -84,14 +241,23 @@ def admin_required(f):
 @app.route('/')
 def index():
     user = get_current_user()
-    events = []
+    cursor = request.args.get('cursor', '')
     try:
-        resp = http_requests.get(f'{EVENTS_URL}/api/events?status=ACTIVE', timeout=TIMEOUT)
-        if resp.status_code == 200:
-            events = resp.json()
+        events, next_cursor = home_events_cache.get_or_load(cursor, lambda: _fetch_home_events(cursor))
     except Exception:
+        events, next_cursor = [], None
         flash('No se pudo conectar con el servicio de eventos.', 'danger')
-    return render_template('index.html', user=user, events=events)
+    return render_template('index.html', user=user, events=events, next_cursor=next_cursor)
+
+
+def _fetch_home_events(cursor):
+    """Una página de eventos activos (proyección de tarjeta) y el cursor siguiente."""
+    params = {'status': 'ACTIVE', 'fields': 'list', 'limit': HOME_PAGE_SIZE}
+    if cursor:
+        params['cursor'] = cursor
+    resp = http_requests.get(f'{EVENTS_URL}/api/events', params=params, timeout=TIMEOUT)
+    resp.raise_for_status()
+    return resp.json(), resp.headers.get('X-Next-Cursor')
 
 
 @app.route('/login', methods=['GET'])
@@ -109,10 +275,12 @@ def login_action():
     try:
         resp = http_requests.post(f'{AUTH_URL}/api/auth/login',
                                   json={'email': email, 'password': password},
+                                  headers={'X-Forwarded-For': request.remote_addr or ''},
                                   timeout=TIMEOUT)
         data = resp.json()
         if resp.status_code == 200:
             session['token'] = data['token']
+            session['refresh_token'] = data.get('refresh_token')
             flash(f'¡Bienvenido, {data["user"]["name"]}!', 'success')
             if data['user']['role'] == 'ADMIN':
                 return redirect(url_for('admin_dashboard'))
@@ -146,10 +314,12 @@ def register_action():
     try:
         resp = http_requests.post(f'{AUTH_URL}/api/auth/register',
                                   json={'name': name, 'email': email, 'password': password},
+                                  headers={'X-Forwarded-For': request.remote_addr or ''},
                                   timeout=TIMEOUT)
         data = resp.json()
         if resp.status_code == 201:
             session['token'] = data['token']
+            session['refresh_token'] = data.get('refresh_token')
             flash('¡Cuenta creada con éxito! Bienvenido.', 'success')
             return redirect(url_for('index'))
         else:
@@ -161,6 +331,13 @@ def register_action():
 
 @app.route('/logout')
 def logout():
+    refresh_token = session.pop('refresh_token', None)
+    if refresh_token:
+        try:
+            http_requests.post(f'{AUTH_URL}/api/auth/logout',
+                               json={'refresh_token': refresh_token}, timeout=TIMEOUT)
+        except Exception:
+            pass
     session.pop('token', None)
     flash('Sesión cerrada.', 'info')
     return redirect(url_for('index'))
@@ -184,41 +361,105 @@ def event_detail(event_id):
     if not event:
         flash('Evento no encontrado.', 'warning')
         return redirect(url_for('index'))
+    if needs_waiting_room(event_id, user):
+        status = waiting_room.join(event_id, user['user_id'])
+        if not status['admitted']:
+            return render_template('waiting_room.html', user=user, event=event,
+                                   status=status, poll_seconds=WAITING_ROOM_POLL)
+        store_admission(event_id, status['token'])
     return render_template('event_detail.html', user=user, event=event)
 
 
+@app.route('/api/queue/<int:event_id>')
+@login_required
+def api_queue(event_id):
+    """Posición en la sala de espera. Solo memoria del gateway: sin llamadas a backends."""
+    user = get_current_user()
+    if not needs_waiting_room(event_id, user):
+        return jsonify({'admitted': True})
+    status = waiting_room.join(event_id, user['user_id'])
+    token = status.pop('token', None)
+    if token:
+        store_admission(event_id, token)
+    status['poll_after'] = WAITING_ROOM_POLL
+    return jsonify(status)
+
+
 # ── API JSON para el frontend JS ──
 
 @app.route('/api/seats/<int:event_id>')
 @login_required
 def api_seats(event_id):
+    # Reenvía la validación por versión: If-None-Match → 304, ?since → delta.
+    # Por defecto el formato compacto (solo estados); ?format=json, el completo.
+    headers = auth_headers()
+    if request.headers.get('If-None-Match'):
+        headers['If-None-Match'] = request.headers['If-None-Match']
+    params = {'format': request.args.get('format', 'compact')}
+    if request.args.get('since'):
+        params['since'] = request.args['since']
     try:
-        resp = http_requests.get(f'{EVENTS_URL}/api/events/{event_id}/seats', timeout=TIMEOUT)
-        return jsonify(resp.json()), resp.status_code
+        resp = http_requests.get(f'{EVENTS_URL}/api/events/{event_id}/seats',
+                                 params=params, headers=headers, timeout=TIMEOUT)
+        if resp.status_code == 304:
+            out = app.response_class(status=304)
+        else:
+            out = jsonify(resp.json())
+            out.status_code = resp.status_code
+        if resp.headers.get('ETag'):
+            out.headers['ETag'] = resp.headers['ETag']
+        out.headers['Cache-Control'] = 'no-cache'
+        return out
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
+@app.route('/api/seats/<int:event_id>/stream')
+@login_required
+def api_seats_stream(event_id):
+    """
+    Server-Sent Events con los deltas del mapa (evento `seats`, id = versión).
+    Al reconectar, el navegador manda Last-Event-ID y recibe lo que se perdió.
+    """
+    since = request.headers.get('Last-Event-ID') or request.args.get('since')
+    since = int(since) if since and since.isdigit() else None
+    return Response(
+        seat_feed.stream(event_id, since),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
 @app.route('/api/hold', methods=['POST'])
 @login_required
+@ratelimit.limit('hold', '20/60', keys=[user_key])
+@ratelimit.limit('hold_ip', '120/60', keys=[ip_key])
 def api_hold():
     data = request.get_json() or {}
     event_id = data.get('event_id')
     seats = data.get('seats', [])
     try:
+        headers = auth_headers()
+        if admission_token(event_id):
+            headers['X-Admission-Token'] = admission_token(event_id)
         resp = http_requests.post(
             f'{EVENTS_URL}/api/events/{event_id}/hold',
             json={'seats': seats},
-            headers=auth_headers(),
+            headers=headers,
             timeout=TIMEOUT
         )
-        return jsonify(resp.json()), resp.status_code
+        out = jsonify(resp.json())
+        if 'Retry-After' in resp.headers:
+            out.headers['Retry-After'] = resp.headers['Retry-After']
+        return out, resp.status_code
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 
 @app.route('/api/release', methods=['POST'])
 @login_required
+@ratelimit.limit('release', '30/60', keys=[user_key])
+@ratelimit.limit('release_ip', '180/60', keys=[ip_key])
 def api_release():
     data = request.get_json() or {}
     event_id = data.get('event_id')
@@ -237,34 +478,28 @@ def api_release():
 
 @app.route('/api/purchase', methods=['POST'])
 @login_required
+@ratelimit.limit('purchase', '10/60', keys=[user_key])
+@ratelimit.limit('purchase_ip', '60/60', keys=[ip_key])
 def api_purchase():
-    """Crea orden y confirma de inmediato (pago simulado)."""
+    """Compra los asientos en HOLD en una sola llamada (pago simulado)."""
     data = request.get_json() or {}
-    event_id = data.get('event_id')
-    seats = data.get('seats', [])
-
-    # 1) Crear orden
+    headers = auth_headers()
+    # La clave del navegador viaja tal cual: un reintento tras un timeout
+    # devuelve la misma orden en vez de comprar dos veces
+    if request.headers.get('Idempotency-Key'):
+        headers['Idempotency-Key'] = request.headers['Idempotency-Key']
     try:
         resp = http_requests.post(
-            f'{ORDERS_URL}/api/orders',
-            json={'event_id': event_id, 'seats': seats},
-            headers=auth_headers(),
-            timeout=TIMEOUT
-        )
-        if resp.status_code != 201:
-            return jsonify(resp.json()), resp.status_code
-        order = resp.json()
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
-
-    # 2) Confirmar orden (pago simulado)
-    try:
-        resp2 = http_requests.post(
-            f'{ORDERS_URL}/api/orders/{order["id"]}/confirm',
-            headers=auth_headers(),
+            f'{ORDERS_URL}/api/orders/checkout',
+            json={'event_id': data.get('event_id'), 'seats': data.get('seats', [])},
+            headers=headers,
             timeout=TIMEOUT
         )
-        return jsonify(resp2.json()), resp2.status_code
+        out = jsonify(resp.json())
+        for name in ('Retry-After', 'Idempotent-Replayed'):
+            if name in resp.headers:
+                out.headers[name] = resp.headers[name]
+        return out, resp.status_code
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -519,30 +754,22 @@ def admin_event_status(event_id):
 @admin_required
 def admin_event_sales(event_id):
     user = get_current_user()
-    event = None
-    orders = []
-    stats = {}
-    try:
-        resp = http_requests.get(f'{EVENTS_URL}/api/events/{event_id}', timeout=TIMEOUT)
-        if resp.status_code == 200:
-            event = resp.json()
-        resp2 = http_requests.get(
-            f'{ORDERS_URL}/api/orders/event/{event_id}',
-            headers=auth_headers(), timeout=TIMEOUT
-        )
-        if resp2.status_code == 200:
-            orders = resp2.json()
-        resp3 = http_requests.get(
-            f'{EVENTS_URL}/api/events/{event_id}/stats',
-            headers=auth_headers(), timeout=TIMEOUT
-        )
-        if resp3.status_code == 200:
-            stats = resp3.json()
-    except Exception:
+    headers = auth_headers()
+    # Las tres consultas son independientes: la página tarda lo que la más lenta
+    results = get_json_concurrently({
+        'event': (f'{EVENTS_URL}/api/events/{event_id}', {}),
+        'orders': (f'{ORDERS_URL}/api/orders/event/{event_id}', headers),
+        'stats': (f'{EVENTS_URL}/api/events/{event_id}/stats', headers),
+    })
+    if any(isinstance(r, Exception) for r in results.values()):
         flash('Error obteniendo datos de ventas.', 'danger')
 
-    return render_template('admin/event_sales.html',
-                           user=user, event=event, orders=orders, stats=stats)
+    def ok(name, default):
+        value = results[name]
+        return default if value is None or isinstance(value, Exception) else value
+
+    return render_template('admin/event_sales.html', user=user, event=ok('event', None),
+                           orders=ok('orders', []), stats=ok('stats', {}))
 
 
 # ── Main ───────────────────────────────────────────────────────
@@ -550,4 +777,7 @@ if __name__ == '__main__':
     port = int(os.environ.get('WEB_PORT', 8080))
     debug = os.environ.get('FLASK_DEBUG', 'false').lower() == 'true'
     print(f"🌐 Web Gateway iniciando en puerto {port}")
-    app.run(host='0.0.0.0', port=port, debug=debug)
+    if WSGIServer is not None and not debug:
+        WSGIServer(('0.0.0.0', port), app).serve_forever()
+    else:
+        app.run(host='0.0.0.0', port=port, debug=debug, threaded=True)
@@ -0,0 +1,149 @@
+"""
+Canal de novedades del mapa de asientos (Server-Sent Events).
+
+Por cada evento con navegadores conectados hay un único sondeo al Events
+Service con `?since=<versión>` (304 mientras no haya cambios); cada delta
+recibido se reparte a todas las colas suscritas a ese evento. El costo
+hacia el backend no depende de cuántos compradores estén mirando.
+
+Con gevent instalado (ver app.py) cada conexión abierta y cada sondeo son
+greenlets, no hilos del sistema.
+"""
+
+import json
+import queue
+import threading
+import time
+
+from common import http_client as http_requests
+
+
+class _Channel:
+    def __init__(self, event_id):
+        self.event_id = event_id
+        self.version = None
+        self.subscribers = set()
+        self.poller = None
+
+
+class SeatFeed:
+
+    def __init__(self, events_url, poll_interval=1.0, heartbeat=15.0, queue_size=50, timeout=8):
+        self.events_url = events_url
+        self.poll_interval = poll_interval
+        self.heartbeat = heartbeat
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._channels = {}
+        self._dropped = 0
+
+    # ── Backend ──────────────────────────────────────────────────
+
+    def fetch(self, event_id, since=None):
+        """
+        Mapa completo, o delta desde `since`, en formato compacto (sin datos
+        de usuarios: el mismo mensaje sirve a todos). None si no hubo cambios.
+        """
+        params, headers = {'format': 'compact'}, {}
+        if since is not None:
+            params['since'] = since
+            headers['If-None-Match'] = f'"{event_id}-{since}-compact"'
+        resp = http_requests.get(f'{self.events_url}/api/events/{event_id}/seats',
+                                 params=params, headers=headers, timeout=self.timeout)
+        if resp.status_code == 304:
+            return None
+        resp.raise_for_status()
+        return resp.json()
+
+    def _poll(self, channel):
+        while True:
+            with self._lock:
+                if not channel.subscribers:
+                    channel.poller = None
+                    self._channels.pop(channel.event_id, None)
+                    return
+            try:
+                data = self.fetch(channel.event_id, channel.version)
+            except Exception as e:
+                print(f"[SEAT FEED] Evento {channel.event_id}: {e}")
+                time.sleep(self.poll_interval * 5)
+                continue
+
+            if data is not None:
+                # La primera lectura solo fija la versión de partida
+                if channel.version is not None:
+                    self._publish(channel, data)
+                channel.version = data['version']
+            time.sleep(self.poll_interval)
+
+    def _publish(self, channel, data):
+        with self._lock:
+            subscribers = list(channel.subscribers)
+        for q in subscribers:
+            try:
+                q.put_nowait(data)
+            except queue.Full:
+                # Cliente que no consume: se desconecta y resincroniza al volver
+                with self._lock:
+                    channel.subscribers.discard(q)
+                    self._dropped += 1
+                with q.mutex:
+                    q.queue.clear()
+                q.put_nowait(None)
+
+    # ── Suscriptores ─────────────────────────────────────────────
+
+    def subscribe(self, event_id):
+        q = queue.Queue(maxsize=self.queue_size)
+        with self._lock:
+            channel = self._channels.get(event_id)
+            if channel is None:
+                channel = self._channels[event_id] = _Channel(event_id)
+            channel.subscribers.add(q)
+            if channel.poller is None:
+                channel.poller = threading.Thread(target=self._poll, args=(channel,), daemon=True)
+                channel.poller.start()
+        return q
+
+    def unsubscribe(self, event_id, q):
+        with self._lock:
+            channel = self._channels.get(event_id)
+            if channel is not None:
+                channel.subscribers.discard(q)
+
+    def stream(self, event_id, since=None):
+        """
+        Generador de mensajes SSE para un navegador. Con `since` envía
+        primero lo cambiado desde esa versión (reconexión con Last-Event-ID).
+        """
+        q = self.subscribe(event_id)
+        try:
+            if since is not None:
+                data = self.fetch(event_id, since)
+                if data is not None:
+                    yield self._format(data)
+            while True:
+                try:
+                    data = q.get(timeout=self.heartbeat)
+                except queue.Empty:
+                    yield ': ping\n\n'
+                    continue
+                if data is None:
+                    yield 'event: resync\ndata: {}\n\n'
+                    return
+                yield self._format(data)
+        finally:
+            self.unsubscribe(event_id, q)
+
+    @staticmethod
+    def _format(data):
+        return f"id: {data['version']}\nevent: seats\ndata: {json.dumps(data)}\n\n"
+
+    def stats(self):
+        with self._lock:
+            return {
+                'events': len(self._channels),
+                'subscribers': sum(len(c.subscribers) for c in self._channels.values()),
+                'dropped': self._dropped,
+            }
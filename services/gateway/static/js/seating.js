@@ -1,6 +1,6 @@
 /* eslint-disable */
 // seating.js — Mapa de asientos interactivo
-// Maneja: carga de asientos, selección, HOLD, confirmación de compra, countdown.
+// Maneja: carga de asientos, cambios en vivo (SSE), refresco incremental, selección, HOLD, confirmación de compra, countdown.
 // Variables globales esperadas del template: EVENT_ID, EVENT_PRICE, EVENT_ROWS, EVENT_COLS, MAX_PER_USER, CURRENT_USER_ID
 
 let seatData = {};       // { "A1": {status, zone, held_by, hold_until}, ... }
@@ -8,10 +8,15 @@ let selectedSeats = [];   // ["A1", "A2"]
 let heldSeats = [];       // Asientos en HOLD por este usuario
 let holdTimer = null;     // Interval del countdown
 let isExpired = false;    // Estado de expiración
+let seatVersion = null;   // Versión del mapa recibida (para ?since= e If-None-Match)
+let seatFormat = 'json';  // Formato del mapa recibido ('compact' por defecto del gateway)
+let seatStream = null;    // EventSource con los cambios del mapa en vivo
+let purchaseKey = null;   // Idempotency-Key de la compra en curso ({ seats, key })
 
 // ── Inicialización ────────────────────────────────────────────
 document.addEventListener('DOMContentLoaded', async () => {
     await loadSeats();
+    subscribeSeats();
 });
 
 async function loadSeats() {
@@ -28,7 +33,9 @@ async function loadSeats() {
         return;
     }
 
-    seatData = result.data.seats || {};
+    seatData = seatsFromPayload(result.data);
+    seatVersion = result.data.version ?? null;
+    seatFormat = result.data.format || 'json';
     renderSeatMap(result.data);
 
     loading.style.display = 'none';
@@ -41,6 +48,45 @@ async function loadSeats() {
     document.getElementById('seat-map').classList.remove('map-expired');
 }
 
+// ── Formato compacto ─────────────────────────────────────────
+// El gateway entrega solo el estado de cada asiento: 2 bits (0 FREE, 1 HELD,
+// 2 SOLD) fila por fila, en base64 (`data`), o {id: código} en `changes` si
+// es un delta. Los asientos propios vienen en `mine`; los deltas del stream
+// no lo traen y se reconocen por `heldSeats`.
+const SEAT_CODES = ['FREE', 'HELD', 'SOLD'];
+
+function seatsFromPayload(data) {
+    if (data.format !== 'compact') return data.seats || {};
+
+    const seats = {};
+    const put = (seatId, code) => {
+        const own = (data.mine || {})[seatId];
+        const ownLocal = !own && code !== 0 && heldSeats.includes(seatId);
+        seats[seatId] = {
+            status: SEAT_CODES[code] || 'FREE',
+            zone: 'GENERAL',
+            held_by: own || ownLocal ? CURRENT_USER_ID : null,
+            hold_until: own ? own.hold_until : (ownLocal ? (seatData[seatId] || {}).hold_until : null)
+        };
+    };
+
+    if (data.changes) {
+        for (const [seatId, code] of Object.entries(data.changes)) put(seatId, code);
+        return seats;
+    }
+
+    const bytes = atob(data.data || '');
+    let i = 0;
+    for (let r = 0; r < data.rows; r++) {
+        const rowLetter = String.fromCharCode(65 + r);
+        for (let c = 1; c <= data.cols; c++) {
+            put(`${rowLetter}${c}`, (bytes.charCodeAt(i >> 2) >> (6 - 2 * (i & 3))) & 3);
+            i++;
+        }
+    }
+    return seats;
+}
+
 function renderSeatMap(data) {
     const mapEl = document.getElementById('seat-map');
     mapEl.innerHTML = '';
@@ -73,45 +119,11 @@ function renderSeatMap(data) {
 
         for (let c = 1; c <= cols; c++) {
             const seatId = `${rowLetter}${c}`;
-            const seat = seatData[seatId] || { status: 'FREE', zone: 'GENERAL' };
 
             const btn = document.createElement('button');
-            btn.className = `seat seat-${seat.status.toLowerCase()}`;
             btn.dataset.seatId = seatId;
             btn.textContent = c;
-            if (seat.status === 'SOLD') {
-                if (seat.held_by == CURRENT_USER_ID) { // Relaxed check
-                    btn.className = 'seat seat-my-sold';
-                    btn.disabled = true;
-                    btn.title = 'Tu asiento (Comprado)';
-                } else {
-                    btn.className = 'seat seat-sold';
-                    btn.disabled = true;
-                }
-            } else if (seat.status === 'HELD') {
-                if (seat.held_by == CURRENT_USER_ID) { // Relaxed check
-                    btn.className = 'seat seat-my-hold';
-                    btn.disabled = true;
-                    btn.title = 'Tu reserva temporal';
-                } else {
-                    btn.className = 'seat seat-held'; // Visualmente ocupado
-                    btn.disabled = true;
-                }
-            } else {
-                btn.className = 'seat seat-free';
-                btn.addEventListener('click', () => toggleSeat(seatId));
-            }
-
-            // Si es un asiento con HOLD expirado, mostrarlo como libre
-            if (seat.status === 'HELD' && seat.hold_until) {
-                const holdEnd = new Date(seat.hold_until);
-                if (holdEnd < new Date()) {
-                    btn.className = 'seat seat-free';
-                    btn.addEventListener('click', () => toggleSeat(seatId));
-                    seat.status = 'FREE';
-                    seatData[seatId] = seat;
-                }
-            }
+            paintSeat(btn, seatId);
 
             rowEl.appendChild(btn);
         }
@@ -120,6 +132,120 @@ function renderSeatMap(data) {
     }
 }
 
+function paintSeat(btn, seatId) {
+    const seat = seatData[seatId] || { status: 'FREE', zone: 'GENERAL' };
+
+    // Si es un asiento con HOLD expirado, mostrarlo como libre
+    if (seat.status === 'HELD' && seat.hold_until && new Date(seat.hold_until) < new Date()) {
+        seat.status = 'FREE';
+        seatData[seatId] = seat;
+    }
+
+    btn.disabled = false;
+    btn.title = '';
+    btn.onclick = null;
+
+    if (seat.status === 'SOLD') {
+        btn.className = seat.held_by == CURRENT_USER_ID ? 'seat seat-my-sold' : 'seat seat-sold'; // Relaxed check
+        btn.disabled = true;
+        if (seat.held_by == CURRENT_USER_ID) btn.title = 'Tu asiento (Comprado)';
+    } else if (seat.status === 'HELD') {
+        btn.className = seat.held_by == CURRENT_USER_ID ? 'seat seat-my-hold' : 'seat seat-held'; // Visualmente ocupado
+        btn.disabled = true;
+        if (seat.held_by == CURRENT_USER_ID) btn.title = 'Tu reserva temporal';
+    } else {
+        btn.className = selectedSeats.includes(seatId) ? 'seat seat-selected' : 'seat seat-free';
+        btn.onclick = () => toggleSeat(seatId);
+    }
+}
+
+// ── Refresco incremental ─────────────────────────────────────
+// Pide solo los asientos cambiados desde `seatVersion`; si nada cambió el
+// servidor responde 304 sin cuerpo.
+// ETag que envía el Events Service para esa versión y formato.
+function seatEtag() {
+    return seatFormat === 'json'
+        ? `"${EVENT_ID}-${seatVersion}"`
+        : `"${EVENT_ID}-${seatVersion}-${seatFormat}"`;
+}
+
+async function refreshSeats() {
+    if (seatVersion === null) return loadSeats();
+
+    let resp;
+    try {
+        resp = await fetch(`/api/seats/${EVENT_ID}?since=${seatVersion}`, {
+            headers: { 'If-None-Match': seatEtag() }
+        });
+    } catch (err) {
+        return;
+    }
+    if (resp.status === 304) return;
+    if (!resp.ok) return loadSeats();
+
+    const data = await resp.json();
+    if (!data.delta) {
+        // El servidor mandó el mapa completo (versión desconocida)
+        seatData = seatsFromPayload(data);
+        seatVersion = data.version ?? null;
+        seatFormat = data.format || 'json';
+        renderSeatMap(data);
+        updateLimitStatus();
+        return;
+    }
+
+    applySeatDelta(seatsFromPayload(data));
+    seatVersion = data.version;
+}
+
+// ── Cambios en vivo (Server-Sent Events) ─────────────────────
+// El gateway empuja cada delta del mapa; al reconectar, EventSource envía
+// Last-Event-ID (la versión) y el servidor completa lo que faltó.
+function subscribeSeats() {
+    if (!window.EventSource || seatStream) return;
+
+    seatStream = new EventSource(`/api/seats/${EVENT_ID}/stream?since=${seatVersion ?? ''}`);
+
+    seatStream.addEventListener('seats', (e) => {
+        const data = JSON.parse(e.data);
+        if (seatVersion !== null && data.version <= seatVersion) return;
+        if (data.delta) {
+            applySeatDelta(seatsFromPayload(data));
+            seatVersion = data.version;
+        } else {
+            seatData = seatsFromPayload(data);
+            seatVersion = data.version;
+            seatFormat = data.format || 'json';
+            renderSeatMap(data);
+            updateLimitStatus();
+        }
+    });
+
+    // El servidor cortó por atraso: EventSource reconecta solo
+    seatStream.addEventListener('resync', () => refreshSeats());
+}
+
+// Tras una acción propia: con el stream abierto el cambio llega solo
+function syncSeats() {
+    if (seatStream && seatStream.readyState === EventSource.OPEN) return;
+    return refreshSeats();
+}
+
+function applySeatDelta(changed) {
+    for (const [seatId, seat] of Object.entries(changed)) {
+        seatData[seatId] = seat;
+
+        // Un asiento seleccionado que otro usuario tomó sale de la selección
+        const idx = selectedSeats.indexOf(seatId);
+        if (idx >= 0 && seat.status !== 'FREE') selectedSeats.splice(idx, 1);
+
+        const btn = document.querySelector(`[data-seat-id="${seatId}"]`);
+        if (btn) paintSeat(btn, seatId);
+    }
+    updateSelectionPanel();
+    updateLimitStatus();
+}
+
 // ── Selección de asientos ─────────────────────────────────────
 function toggleSeat(seatId) {
     if (isExpired) {
@@ -204,6 +330,12 @@ async function holdSeats() {
             body: JSON.stringify({ event_id: EVENT_ID, seats: selectedSeats })
         });
 
+        if (result.status === 403 && result.data.waiting_room) {
+            // El turno de la sala de espera venció: volver a la cola
+            showToast(result.data.error, 'warning');
+            setTimeout(() => location.reload(), 1500);
+            return;
+        }
         if (!result.ok) {
             throw new Error(result.data.error || 'Error al reservar asientos.');
         }
@@ -211,7 +343,10 @@ async function holdSeats() {
         heldSeats = result.data.seats || selectedSeats;
         const holdUntil = result.data.hold_until;
 
-        heldSeats.forEach(s => updateSeatUI(s, 'my-hold'));
+        heldSeats.forEach(s => {
+            seatData[s] = { status: 'HELD', zone: 'GENERAL', held_by: CURRENT_USER_ID, hold_until: holdUntil };
+            updateSeatUI(s, 'my-hold');
+        });
         selectedSeats = [];
 
         document.getElementById('selection-panel').style.display = 'none';
@@ -222,10 +357,9 @@ async function holdSeats() {
         showToast(error.message, 'danger');
         holdBtn.disabled = false;
         holdBtn.textContent = '🔒 Reservar (10 min)';
-        // Intentar recargar el mapa para sincronizar estado
-        await loadSeats();
-        selectedSeats = [];
-        updateSelectionPanel();
+        // Sincronizar solo los asientos que cambiaron
+        clearSelection();
+        await syncSeats();
     }
 }
 
@@ -289,6 +423,23 @@ function handleExpiration() {
 }
 
 // ── Confirmar compra ─────────────────────────────────────────
+// Una clave por intento de compra: si la respuesta se pierde y el usuario
+// vuelve a pulsar, el servidor devuelve la misma orden en vez de otra.
+// Cambia si cambian los asientos, si el servidor rechazó la compra o si se
+// liberó el HOLD: el siguiente intento es una compra nueva.
+function newIdempotencyKey() {
+    if (window.crypto && crypto.randomUUID) return crypto.randomUUID();
+    return Date.now().toString(36) + '-' + Math.random().toString(36).slice(2);
+}
+
+function purchaseKeyFor(seats) {
+    const joined = seats.join(',');
+    if (!purchaseKey || purchaseKey.seats !== joined) {
+        purchaseKey = { seats: joined, key: newIdempotencyKey() };
+    }
+    return purchaseKey.key;
+}
+
 async function confirmPurchase() {
     const confirmBtn = document.getElementById('btn-confirm');
     confirmBtn.disabled = true;
@@ -296,10 +447,14 @@ async function confirmPurchase() {
 
     const result = await apiFetch('/api/purchase', {
         method: 'POST',
+        headers: { 'Idempotency-Key': purchaseKeyFor(heldSeats) },
         body: JSON.stringify({ event_id: EVENT_ID, seats: heldSeats })
     });
 
     if (!result.ok) {
+        // Sin respuesta (status 0) la compra pudo haberse hecho: se conserva
+        // la clave para que el reintento devuelva esa orden
+        if (result.status !== 0) purchaseKey = null;
         showToast(result.data.error || 'Error al confirmar la compra.', 'danger');
         confirmBtn.disabled = false;
         confirmBtn.textContent = '✅ Confirmar Compra';
@@ -308,6 +463,7 @@ async function confirmPurchase() {
 
     // Limpiar timer
     if (holdTimer) clearInterval(holdTimer);
+    purchaseKey = null;
 
     // Actualizar asientos a SOLD
     heldSeats.forEach(s => updateSeatUI(s, 'sold'));
@@ -340,6 +496,7 @@ async function releaseHold() {
 
     // Guardar referencia antes de limpiar
     const seatsToRelease = [...heldSeats];
+    purchaseKey = null;
 
     const result = await apiFetch('/api/release', {
         method: 'POST',
@@ -365,8 +522,8 @@ async function releaseHold() {
 
     showToast('Reserva cancelada. Los asientos están disponibles nuevamente.', 'info');
 
-    // Esperar un momento para que el servidor procese y luego recargar
-    setTimeout(() => loadSeats(), 500);
+    // Esperar un momento para que el servidor procese y luego sincronizar
+    setTimeout(() => syncSeats(), 500);
 }
 
 // ── Verificar holds existentes ───────────────────────────────
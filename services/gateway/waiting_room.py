@@ -0,0 +1,136 @@
+"""
+Sala de espera (cola de admisión) por evento.
+
+Cuando un evento sale a la venta todos los compradores llegan a la vez.
+Con WAITING_ROOM_ENABLED=true cada comprador que abre /event/<id> entra a
+una cola FIFO de ese evento; la cola deja pasar a `rate` compradores por
+segundo (con un margen inicial de `burst`) y a cada uno le entrega un
+token de admisión firmado (common/admission.py) que el Events Service
+exige para reservar. Si la cola está vacía y hay margen, el comprador
+pasa sin esperar: en eventos tranquilos la sala no se nota.
+
+Las admisiones se calculan al consultar (join), sin hilos: el
+margen se recarga según el tiempo transcurrido, como un token bucket.
+Quien deja de consultar la posición por más de `idle_timeout` segundos
+pierde su lugar (si vuelve, entra al final). Una vez por segundo se quitan
+esos lugares vacíos y se renumera la fila, para que la posición y la
+espera estimada no los cuenten.
+
+El estado vive en la memoria del proceso: con la sala activa el gateway
+debe correr en un solo proceso gunicorn (gevent atiende la concurrencia;
+ver gunicorn_conf.py).
+"""
+
+import time
+import threading
+from collections import OrderedDict
+
+from common import admission
+
+SWEEP_INTERVAL = 1.0
+
+
+class _Queue:
+    def __init__(self, burst, now):
+        self.waiting = OrderedDict()   # user_id → {'seq', 'seen'}
+        self.admitted = {}             # user_id → (token, emitido) aún no entregado
+        self.next_seq = 0
+        self.allowance = float(burst)
+        self.last = now
+        self.swept = now
+
+
+class WaitingRoom:
+
+    def __init__(self, rate=5.0, burst=50, idle_timeout=30.0):
+        self.rate = rate
+        self.burst = burst
+        self.idle_timeout = idle_timeout
+        self._lock = threading.Lock()
+        self._queues = {}
+        self._stats = {'joined': 0, 'admitted': 0, 'abandoned': 0}
+
+    def _sweep(self, q, now):
+        """Quita a quien dejó de consultar y renumera la fila (a lo sumo una vez por segundo)."""
+        if now - q.swept < SWEEP_INTERVAL:
+            return
+        q.swept = now
+        for user_id in [u for u, e in q.waiting.items() if now - e['seen'] > self.idle_timeout]:
+            del q.waiting[user_id]
+            self._stats['abandoned'] += 1
+        for seq, entry in enumerate(q.waiting.values()):
+            entry['seq'] = seq
+        q.next_seq = len(q.waiting)
+
+    def _advance(self, event_id, q, now):
+        """Recarga el margen y admite a los primeros de la cola que quepan."""
+        q.allowance = min(self.burst, q.allowance + (now - q.last) * self.rate)
+        q.last = now
+        while q.waiting and q.allowance >= 1:
+            user_id, entry = q.waiting.popitem(last=False)
+            if now - entry['seen'] > self.idle_timeout:
+                self._stats['abandoned'] += 1
+                continue
+            q.allowance -= 1
+            q.admitted[user_id] = (admission.issue(event_id, user_id), now)
+            self._stats['admitted'] += 1
+        # Admisiones que nadie vino a buscar
+        ttl = admission.token_ttl()
+        for user_id in [u for u, (_, issued) in q.admitted.items() if now - issued > ttl]:
+            del q.admitted[user_id]
+
+    def _status(self, q, user_id, now):
+        if user_id in q.admitted:
+            token, _ = q.admitted.pop(user_id)
+            return {'admitted': True, 'token': token}
+        entry = q.waiting.get(user_id)
+        if entry is None:
+            return None
+        head = next(iter(q.waiting.values()))['seq']
+        position = entry['seq'] - head + 1
+        return {
+            'admitted': False,
+            'position': position,
+            'eta_seconds': int(max(0, position - q.allowance) / self.rate) + 1
+        }
+
+    def join(self, event_id, user_id):
+        """
+        Estado del usuario en la cola. Si no estaba (primera visita o tras
+        un reinicio del gateway) lo pone al final. La misma llamada sirve
+        para consultar la posición.
+        """
+        now = time.monotonic()
+        with self._lock:
+            q = self._queues.get(event_id)
+            if q is None:
+                q = self._queues[event_id] = _Queue(self.burst, now)
+            # Quien consulta sigue presente: se marca antes de admitir o
+            # barrer, para no darlo por abandonado en su propia consulta
+            if user_id in q.waiting:
+                q.waiting[user_id]['seen'] = now
+            elif user_id not in q.admitted:
+                q.waiting[user_id] = {'seq': q.next_seq, 'seen': now}
+                q.next_seq += 1
+                self._stats['joined'] += 1
+            self._sweep(q, now)
+            self._advance(event_id, q, now)
+            status = self._status(q, user_id, now)
+            if status is None:
+                # No debería ocurrir; por si acaso, al final de la fila
+                q.waiting[user_id] = {'seq': q.next_seq, 'seen': now}
+                q.next_seq += 1
+                status = self._status(q, user_id, now)
+            if not q.waiting and not q.admitted and q.allowance >= self.burst:
+                del self._queues[event_id]
+            return status
+
+    def stats(self):
+        with self._lock:
+            data = dict(self._stats)
+            data['events'] = {
+                event_id: {'waiting': len(q.waiting), 'allowance': round(q.allowance, 1)}
+                for event_id, q in self._queues.items()
+            }
+            data.update({'rate': self.rate, 'burst': self.burst})
+        return data
@@ -6,87 +6,37 @@ Llama internamente al Events Service para confirmar asientos.
 """
 
 import os
-import uuid
+import sys
 import datetime
 import psycopg2
 import psycopg2.extras
-import jwt
-import requests as http_requests
 from flask import Flask, request, jsonify
-from functools import wraps
 from dotenv import load_dotenv
 
 load_dotenv(os.path.join(os.path.dirname(__file__), '..', '..', '.env'))
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common import audit, cache, db, idempotency, metrics, pagination  # noqa: E402
+from common import http_client as http_requests  # noqa: E402
+from common.auth import token_required, admin_required  # noqa: E402
+
 app = Flask(__name__)
 
-SECRET_KEY = os.environ.get('JWT_SECRET', 'super-secret-key-change-me')
 EVENTS_SERVICE_URL = os.environ.get('EVENTS_SERVICE_URL', 'http://localhost:7001')
 
 
-# ── Conexión PostgreSQL ────────────────────────────────────────
-def get_db():
-    return psycopg2.connect(
-        host=os.environ.get('POSTGRES_HOST', 'localhost'),
-        port=int(os.environ.get('POSTGRES_PORT', 5432)),
-        database=os.environ.get('POSTGRES_DB', 'teatro'),
-        user=os.environ.get('POSTGRES_USER', 'teatro'),
-        password=os.environ.get('POSTGRES_PASS', 'teatro123')
-    )
+# ── Conexión PostgreSQL (pool compartido) ─────────────────────
+get_db = db.get_db
+db.init_app(app)
+metrics.init_app(app)
 
 
-# ── Decoradores ────────────────────────────────────────────────
-def _decode_token():
-    token = request.headers.get('Authorization', '').replace('Bearer ', '')
-    if not token:
-        return None
-    try:
-        return jwt.decode(token, SECRET_KEY, algorithms=['HS256'])
-    except (jwt.ExpiredSignatureError, jwt.InvalidTokenError):
-        return None
-
-
-def token_required(f):
-    @wraps(f)
-    def decorated(*args, **kwargs):
-        data = _decode_token()
-        if not data:
-            return jsonify({'error': 'Token requerido o inválido'}), 401
-        request.user_id = data['user_id']
-        request.user_role = data['role']
-        request.user_email = data.get('email', '')
-        request.token_raw = request.headers.get('Authorization', '').replace('Bearer ', '')
-        return f(*args, **kwargs)
-    return decorated
-
-
-def admin_required(f):
-    @wraps(f)
-    def decorated(*args, **kwargs):
-        data = _decode_token()
-        if not data:
-            return jsonify({'error': 'Token requerido o inválido'}), 401
-        if data['role'] != 'ADMIN':
-            return jsonify({'error': 'Acceso denegado'}), 403
-        request.user_id = data['user_id']
-        request.user_role = data['role']
-        request.user_email = data.get('email', '')
-        request.token_raw = request.headers.get('Authorization', '').replace('Bearer ', '')
-        return f(*args, **kwargs)
-    return decorated
-
-
-def audit(conn, user_id, action, detail=''):
-    try:
-        with conn.cursor() as cur:
-            ip = request.remote_addr or ''
-            cur.execute(
-                "INSERT INTO audit_log (user_id, action, detail, ip_address) VALUES (%s,%s,%s,%s)",
-                (user_id, action, detail, ip)
-            )
-        conn.commit()
-    except Exception:
-        pass
+# ── Caché de eventos consultados al Events Service ────────────
+event_cache = cache.TTLCache(
+    'events',
+    maxsize=int(os.environ.get('EVENT_CACHE_SIZE', 512)),
+    ttl=float(os.environ.get('EVENT_CACHE_TTL', 30))
+)
 
 
 def _serialize_row(row):
@@ -99,8 +49,81 @@ def _serialize_row(row):
     return d
 
 
-def generate_ticket_code():
-    return f"TCK-{uuid.uuid4().hex[:8].upper()}"
+# Códigos generados en PostgreSQL (pgcrypto), mismo formato TCK-XXXXXXXX
+TICKET_CODE_SQL = "'TCK-' || upper(encode(gen_random_bytes(4), 'hex'))"
+TICKET_CODE_ATTEMPTS = 5
+
+
+def insert_tickets(cur, order, seat_ids):
+    """
+    Inserta los tickets de todos los asientos y marca la orden CONFIRMED en
+    una sola sentencia. Un código que choca con uno existente se omite por
+    ON CONFLICT y solo ese asiento se reintenta con un código nuevo.
+    """
+    tickets = []
+    pending = list(seat_ids)
+    for _ in range(TICKET_CODE_ATTEMPTS):
+        cur.execute(f"""
+            WITH new_tickets AS (
+                INSERT INTO tickets (order_id, event_id, seat_id, code)
+                SELECT %(order_id)s, %(event_id)s, s.seat_id, {TICKET_CODE_SQL}
+                FROM unnest(%(seats)s::text[]) AS s(seat_id)
+                ON CONFLICT (code) DO NOTHING
+                RETURNING *
+            ), confirmed AS (
+                UPDATE orders SET status = 'CONFIRMED', seat_count = %(seat_count)s, total = %(total)s
+                WHERE id = %(order_id)s
+            )
+            SELECT * FROM new_tickets
+        """, {
+            'order_id': order['id'],
+            'event_id': order['event_id'],
+            'seats': pending,
+            'seat_count': len(seat_ids),
+            'total': float(order['total'])
+        })
+        tickets += [_serialize_row(t) for t in cur.fetchall()]
+        inserted = {t['seat_id'] for t in tickets}
+        pending = [seat_id for seat_id in pending if seat_id not in inserted]
+        if not pending:
+            return sorted(tickets, key=lambda t: t['seat_id'])
+    raise RuntimeError('No se pudieron generar códigos de ticket únicos')
+
+
+def fetch_event(event_id):
+    """
+    Evento desde el Events Service; None si no existe (404). Cualquier otra
+    respuesta de error lanza una excepción: no es lo mismo que no exista.
+    """
+    resp = http_requests.get(
+        f'{EVENTS_SERVICE_URL}/api/events/{event_id}',
+        headers={'Authorization': f'Bearer {request.token_raw}'},
+        timeout=5
+    )
+    if resp.status_code == 404:
+        return None
+    resp.raise_for_status()
+    return resp.json()
+
+
+def unconfirm_seats(event_id, seat_ids):
+    """
+    Compensa una confirmación cuya orden no se pudo guardar: los asientos
+    vuelven a HOLD del usuario en el Events Service y el reintento de la
+    compra los vuelve a encontrar. Devuelve False si tampoco se pudo.
+    """
+    try:
+        resp = http_requests.post(
+            f'{EVENTS_SERVICE_URL}/api/events/{event_id}/unconfirm-seats',
+            json={'seats': seat_ids},
+            headers={'Authorization': f'Bearer {request.token_raw}'},
+            timeout=5
+        )
+        resp.raise_for_status()
+        return True
+    except Exception as e:
+        print(f"[ORDERS] No se pudo deshacer la confirmación de {seat_ids} (evento {event_id}): {e}")
+        return False
 
 
 # ═══════════════════════════════════════════════════════════════
@@ -109,6 +132,7 @@ def generate_ticket_code():
 
 @app.route('/api/orders', methods=['POST'])
 @token_required
+@idempotency.idempotent
 def create_order():
     """
     Crea una orden PENDING. Los asientos ya deben estar en HOLD.
@@ -123,16 +147,11 @@ def create_order():
 
     # Obtener info del evento
     try:
-        resp = http_requests.get(
-            f'{EVENTS_SERVICE_URL}/api/events/{event_id}',
-            headers={'Authorization': f'Bearer {request.token_raw}'},
-            timeout=5
-        )
-        if resp.status_code != 200:
-            return jsonify({'error': 'Evento no encontrado'}), 404
-        event = resp.json()
+        event = event_cache.get_or_load(event_id, lambda: fetch_event(event_id))
     except Exception as e:
-        return jsonify({'error': f'Error contactando Events Service: {str(e)}'}), 500
+        return jsonify({'error': f'Error contactando Events Service: {str(e)}'}), 502
+    if not event:
+        return jsonify({'error': 'Evento no encontrado'}), 404
 
     price = float(event.get('price', 0))
     total = price * len(seats)
@@ -169,6 +188,7 @@ def create_order():
 
 @app.route('/api/orders/<int:order_id>/confirm', methods=['POST'])
 @token_required
+@idempotency.idempotent
 def confirm_order(order_id):
     """
     Confirma la orden: pago simulado, confirma asientos en Events Service,
@@ -187,28 +207,17 @@ def confirm_order(order_id):
         if order['status'] != 'PENDING':
             return jsonify({'error': 'La orden ya fue procesada'}), 400
 
-        # Obtener asientos en HOLD de este usuario para este evento
+        # Obtener asientos en HOLD vigente de este usuario para este evento
         try:
             resp = http_requests.get(
-                f'{EVENTS_SERVICE_URL}/api/events/{order["event_id"]}/seats',
+                f'{EVENTS_SERVICE_URL}/api/events/{order["event_id"]}/holds/mine',
+                headers={'Authorization': f'Bearer {request.token_raw}'},
                 timeout=5
             )
-            seat_data = resp.json()
+            resp.raise_for_status()
+            user_held_seats = resp.json().get('seats', [])
         except Exception as e:
-            return jsonify({'error': f'Error obteniendo mapa de asientos: {str(e)}'}), 500
-
-        user_held_seats = []
-        now = datetime.datetime.utcnow()
-        for seat_id, seat in seat_data.get('seats', {}).items():
-            if seat['status'] == 'HELD' and seat.get('held_by') == request.user_id:
-                # Verificar que no haya expirado
-                if seat.get('hold_until'):
-                    hold_dt = seat['hold_until']
-                    if isinstance(hold_dt, str):
-                        hold_dt = datetime.datetime.fromisoformat(hold_dt.replace('Z', ''))
-                    if hold_dt < now:
-                        continue
-                user_held_seats.append(seat_id)
+            return jsonify({'error': f'Error obteniendo asientos en HOLD: {str(e)}'}), 500
 
         if not user_held_seats:
             # Cancelar orden
@@ -234,27 +243,26 @@ def confirm_order(order_id):
             )
         except Exception as e:
             return jsonify({'error': f'Error confirmando asientos: {str(e)}'}), 500
+        if resp.status_code != 200:
+            return jsonify(resp.json()), resp.status_code
 
-        # ── Generar tickets ──
-        tickets = []
-        with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
-            for seat_id in user_held_seats:
-                code = generate_ticket_code()
-                cur.execute("""
-                    INSERT INTO tickets (order_id, event_id, seat_id, code)
-                    VALUES (%s,%s,%s,%s) RETURNING *
-                """, (order_id, order['event_id'], seat_id, code))
-                tickets.append(_serialize_row(cur.fetchone()))
-
-            # Actualizar orden
-            cur.execute(
-                "UPDATE orders SET status = 'CONFIRMED', seat_count = %s, total = %s WHERE id = %s",
-                (len(user_held_seats), float(order['total']), order_id)
-            )
-        conn.commit()
+        # Solo los que Events Service pasó a SOLD (un HOLD pudo vencer entre
+        # la consulta y la confirmación)
+        confirmed = resp.json().get('confirmed', [])
+        if not confirmed:
+            return jsonify({'error': 'No hay asientos en HOLD. La reserva pudo haber expirado.'}), 409
 
-        audit(conn, request.user_id, 'CONFIRM_ORDER',
-              f'Orden {order_id}, {len(tickets)} tickets, evento {order["event_id"]}')
+        # ── Generar tickets y confirmar la orden (una sentencia) ──
+        try:
+            with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+                tickets = insert_tickets(cur, order, confirmed)
+            conn.commit()
+        except Exception as e:
+            unconfirm_seats(order['event_id'], confirmed)
+            return jsonify({'error': f'No se pudo registrar la compra, intenta de nuevo: {str(e)}'}), 503
+
+        audit.log(request.user_id, 'CONFIRM_ORDER',
+                  f'Orden {order_id}, {len(tickets)} tickets, evento {order["event_id"]}')
 
         return jsonify({
             'message': '¡Compra confirmada con éxito!',
@@ -265,32 +273,151 @@ def confirm_order(order_id):
         conn.close()
 
 
+@app.route('/api/orders/checkout', methods=['POST'])
+@token_required
+@idempotency.idempotent
+def checkout():
+    """
+    Compra en una sola llamada: confirma los asientos en HOLD (una llamada
+    al Events Service) y crea la orden CONFIRMED con sus tickets en una sola
+    transacción. El límite por usuario ya se aplicó al reservar.
+    Body: { "event_id": 1, "seats": ["A1","A2"] }
+    """
+    data = request.get_json() or {}
+    event_id = data.get('event_id')
+    seats = data.get('seats', [])
+
+    if not event_id or not seats or not isinstance(seats, list):
+        return jsonify({'error': 'event_id y seats son requeridos'}), 400
+
+    try:
+        event = event_cache.get_or_load(event_id, lambda: fetch_event(event_id))
+    except Exception as e:
+        return jsonify({'error': f'Error contactando Events Service: {str(e)}'}), 502
+    if not event:
+        return jsonify({'error': 'Evento no encontrado'}), 404
+
+    # ── Pago simulado ──
+    # (Aquí iría la integración con pasarela de pago real)
+    payment_ok = True
+
+    if not payment_ok:
+        return jsonify({'error': 'Error en el pago'}), 402
+
+    price = float(event.get('price', 0))
+
+    # La conexión y la orden PENDING van antes de confirmar: si PostgreSQL
+    # no responde (pool agotado, error al insertar) los asientos siguen en
+    # HOLD y el reintento puede completarlos. Si la confirmación falla, la
+    # transacción se descarta al devolver la conexión.
+    conn = get_db()
+    try:
+        with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+            cur.execute("""
+                INSERT INTO orders (user_id, event_id, total, seat_count, status)
+                VALUES (%s,%s,%s,%s,'PENDING') RETURNING *
+            """, (request.user_id, event_id, price * len(seats), len(seats)))
+            order = cur.fetchone()
+
+        # ── Confirmar asientos: solo los HOLD vigentes del usuario pasan a SOLD ──
+        try:
+            resp = http_requests.post(
+                f'{EVENTS_SERVICE_URL}/api/events/{event_id}/confirm-seats',
+                json={'seats': seats, 'user_id': request.user_id},
+                headers={'Authorization': f'Bearer {request.token_raw}'},
+                timeout=5
+            )
+        except Exception as e:
+            return jsonify({'error': f'Error confirmando asientos: {str(e)}'}), 500
+        if resp.status_code != 200:
+            return jsonify(resp.json()), resp.status_code
+
+        confirmed = resp.json().get('confirmed', [])
+        if not confirmed:
+            return jsonify({'error': 'No hay asientos en HOLD. La reserva pudo haber expirado.'}), 409
+
+        # ── Tickets de los asientos confirmados y commit ──
+        # Si falla ya con los asientos en SOLD, se devuelven a HOLD: la
+        # respuesta 5xx libera la Idempotency-Key y el reintento los compra
+        order['total'] = price * len(confirmed)
+        try:
+            with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
+                tickets = insert_tickets(cur, order, confirmed)
+            conn.commit()
+        except Exception as e:
+            unconfirm_seats(event_id, confirmed)
+            return jsonify({'error': f'No se pudo registrar la compra, intenta de nuevo: {str(e)}'}), 503
+
+        audit.log(request.user_id, 'CHECKOUT',
+                  f'Orden {order["id"]}, {len(tickets)} tickets, evento {event_id}')
+
+        return jsonify({
+            'message': '¡Compra confirmada con éxito!',
+            'order_id': order['id'],
+            'tickets': tickets
+        }), 201
+    finally:
+        conn.close()
+
+
+def _attach_tickets(cur, orders):
+    """Carga los tickets de todas las órdenes en una sola consulta."""
+    by_order = {order['id']: order for order in orders}
+    for order in orders:
+        order['tickets'] = []
+    if not by_order:
+        return orders
+    cur.execute(
+        "SELECT * FROM tickets WHERE order_id = ANY(%s) ORDER BY order_id, seat_id",
+        (list(by_order),)
+    )
+    for t in cur.fetchall():
+        by_order[t['order_id']]['tickets'].append(_serialize_row(t))
+    return orders
+
+
+def _list_orders(cur, select, key_column, key_value, page):
+    """
+    Órdenes filtradas por `key_column`, de la más reciente a la más antigua,
+    con sus tickets. `page` es el (limit, cursor) de pagination.page_args.
+    """
+    limit, cursor = page
+    query = select + f" WHERE o.{key_column} = %s"
+    params = [key_value]
+    if cursor:
+        query += " AND (o.created_at, o.id) < (%s::timestamp, %s)"
+        params += cursor
+    query += " ORDER BY o.created_at DESC, o.id DESC"
+    if limit:
+        query += " LIMIT %s"
+        params.append(limit + 1)
+
+    cur.execute(query, params)
+    orders = [_serialize_row(o) for o in cur.fetchall()]
+    # La fila sobrante (si la hay) solo indica que existe otra página
+    _attach_tickets(cur, orders[:limit] if limit else orders)
+    return pagination.paginated_response(orders, limit, lambda o: (o['created_at'], o['id']))
+
+
 @app.route('/api/orders/my', methods=['GET'])
 @token_required
 def my_orders():
-    """Lista las órdenes del usuario actual con sus tickets."""
+    """Lista las órdenes del usuario actual con sus tickets (?limit, ?cursor opcionales)."""
+    try:
+        page = pagination.page_args(cursor_size=2)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
     conn = get_db()
     try:
         with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
-            cur.execute("""
+            return _list_orders(cur, """
                 SELECT o.*, e.title AS event_title, e.start_time AS event_date,
                        v.name AS venue_name
                 FROM orders o
                 JOIN events e ON o.event_id = e.id
                 JOIN venues v ON e.venue_id = v.id
-                WHERE o.user_id = %s
-                ORDER BY o.created_at DESC
-            """, (request.user_id,))
-            orders = [_serialize_row(o) for o in cur.fetchall()]
-
-            for order in orders:
-                cur.execute(
-                    "SELECT * FROM tickets WHERE order_id = %s ORDER BY seat_id",
-                    (order['id'],)
-                )
-                order['tickets'] = [_serialize_row(t) for t in cur.fetchall()]
-
-        return jsonify(orders)
+            """, 'user_id', request.user_id, page)
     finally:
         conn.close()
 
@@ -298,27 +425,20 @@ def my_orders():
 @app.route('/api/orders/event/<int:event_id>', methods=['GET'])
 @admin_required
 def orders_by_event(event_id):
-    """Admin: lista órdenes y tickets de un evento."""
+    """Admin: lista órdenes y tickets de un evento (?limit, ?cursor opcionales)."""
+    try:
+        page = pagination.page_args(cursor_size=2)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
     conn = get_db()
     try:
         with conn.cursor(cursor_factory=psycopg2.extras.RealDictCursor) as cur:
-            cur.execute("""
+            return _list_orders(cur, """
                 SELECT o.*, u.email AS user_email, u.name AS user_name
                 FROM orders o
                 JOIN users u ON o.user_id = u.id
-                WHERE o.event_id = %s
-                ORDER BY o.created_at DESC
-            """, (event_id,))
-            orders = [_serialize_row(o) for o in cur.fetchall()]
-
-            for order in orders:
-                cur.execute(
-                    "SELECT * FROM tickets WHERE order_id = %s ORDER BY seat_id",
-                    (order['id'],)
-                )
-                order['tickets'] = [_serialize_row(t) for t in cur.fetchall()]
-
-        return jsonify(orders)
+            """, 'event_id', event_id, page)
     finally:
         conn.close()
 
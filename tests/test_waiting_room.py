@@ -0,0 +1,61 @@
+"""
+Pruebas de la sala de espera del gateway (services/gateway/waiting_room.py).
+
+    python3 -m unittest discover tests
+"""
+
+import os
+import sys
+import unittest
+from unittest import mock
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, os.path.join(ROOT, 'services'))
+sys.path.insert(0, os.path.join(ROOT, 'services', 'gateway'))
+
+import waiting_room  # noqa: E402
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class WaitingRoomTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = mock.patch.object(waiting_room.time, 'monotonic', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_returning_idle_buyer_keeps_working(self):
+        room = waiting_room.WaitingRoom(rate=0.1, burst=1, idle_timeout=30)
+        self.assertTrue(room.join(1, 10)['admitted'])
+        self.assertEqual(room.join(1, 11)['position'], 1)
+
+        # Deja de consultar más que idle_timeout y vuelve: sigue en la
+        # fila (antes: KeyError → 500) y, con margen recargado, pasa
+        self.clock.now += 31
+        self.assertTrue(room.join(1, 11)['admitted'])
+
+    def test_position_skips_abandoned_buyers(self):
+        room = waiting_room.WaitingRoom(rate=0.01, burst=1, idle_timeout=5)
+        self.assertTrue(room.join(1, 1)['admitted'])
+        for user_id in (2, 3, 4):
+            room.join(1, user_id)
+        self.assertEqual(room.join(1, 4)['position'], 3)
+
+        # 2 y 3 dejan de consultar; solo 4 sigue
+        self.clock.now += 6
+        status = room.join(1, 4)
+        self.assertFalse(status['admitted'])
+        self.assertEqual(status['position'], 1)
+        self.assertEqual(room.stats()['abandoned'], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
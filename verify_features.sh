@@ -50,13 +50,14 @@ EVENT_RES=$(curl -s -X POST http://localhost:7001/api/events \
   -H "Authorization: Bearer $TOKEN" \
   -H "Content-Type: application/json" \
   -d "{
-    "venue_id": $VENUE_ID,
-    "title": "Evento Test",
-    "start_time": \"$START_TIME\",
-    "end_time": \"$END_TIME\",
-    "price": 10
+    \"venue_id\": $VENUE_ID,
+    \"title\": \"Evento Test\",
+    \"start_time\": \"$START_TIME\",
+    \"end_time\": \"$END_TIME\",
+    \"price\": 10
   }")
 echo $EVENT_RES
+EVENT_ID=$(echo $EVENT_RES | python3 -c "import sys, json; print(json.load(sys.stdin).get('id', 0))")
 
 # 5. Create Event (Overlap Fail)
 echo -e "\n--- Create Event (Overlap) ---"
@@ -65,11 +66,11 @@ curl -s -X POST http://localhost:7001/api/events \
   -H "Authorization: Bearer $TOKEN" \
   -H "Content-Type: application/json" \
   -d "{
-    "venue_id": $VENUE_ID,
-    "title": "Evento Overlap",
-    "start_time": \"$START_TIME\",
-    "end_time": \"$END_TIME\",
-    "price": 10
+    \"venue_id\": $VENUE_ID,
+    \"title\": \"Evento Overlap\",
+    \"start_time\": \"$START_TIME\",
+    \"end_time\": \"$END_TIME\",
+    \"price\": 10
   }"
 
 # 6. Delete Venue (Fail due to event)
@@ -80,3 +81,86 @@ curl -s -X DELETE http://localhost:7001/api/venues/$VENUE_ID \
 # 7. Cleanup: Delete Event manually (via DB or ignored for now)
 # We can't delete event via API yet (only status update).
 # So we can't test successful venue deletion unless we access DB directly.
+
+# 8. List Venues: una sola consulta SQL por página (servicio con PG_QUERY_COUNT=true)
+echo -e "\n--- List Venues (Query Count) ---"
+check_query_count() {
+    local headers="$1"
+    local max="${2:-1}"
+    local count=$(echo "$headers" | grep -i '^X-Query-Count:' | tr -d '\r' | awk '{print $2}')
+    echo "X-Query-Count: $count (máximo $max)"
+    if [ -z "$count" ] || [ "$count" -gt "$max" ]; then
+        echo "Demasiadas consultas SQL (¿PG_QUERY_COUNT=true en el servicio?)"
+        exit 1
+    fi
+}
+HEADERS=$(curl -s -D - -o /dev/null "http://localhost:7001/api/venues?limit=1" \
+  -H "Authorization: Bearer $TOKEN")
+check_query_count "$HEADERS"
+NEXT_CURSOR=$(echo "$HEADERS" | grep -i '^X-Next-Cursor:' | tr -d '\r' | awk '{print $2}')
+if [ -n "$NEXT_CURSOR" ]; then
+    HEADERS=$(curl -s -D - -o /dev/null "http://localhost:7001/api/venues?limit=1&cursor=$NEXT_CURSOR" \
+      -H "Authorization: Bearer $TOKEN")
+    check_query_count "$HEADERS"
+fi
+
+# 9. Dos órdenes confirmadas con tickets (HOLD → orden → confirmar), para
+# que el conteo de consultas del paso 10 tenga órdenes y tickets que cargar
+echo -e "\n--- Create Orders ---"
+curl -s -o /dev/null -X PUT http://localhost:7001/api/events/$EVENT_ID/status \
+  -H "Authorization: Bearer $TOKEN" -H "Content-Type: application/json" \
+  -d '{"status": "ACTIVE"}'
+buy_seat() {
+    local seat="$1"
+    curl -s -o /dev/null -X POST http://localhost:7001/api/events/$EVENT_ID/hold \
+      -H "Authorization: Bearer $TOKEN" -H "Content-Type: application/json" \
+      -d "{\"seats\": [\"$seat\"]}"
+    local order_id=$(curl -s -X POST http://localhost:7002/api/orders \
+      -H "Authorization: Bearer $TOKEN" -H "Content-Type: application/json" \
+      -d "{\"event_id\": $EVENT_ID, \"seats\": [\"$seat\"]}" \
+      | python3 -c "import sys, json; print(json.load(sys.stdin).get('id', ''))")
+    local tickets=$(curl -s -X POST http://localhost:7002/api/orders/$order_id/confirm \
+      -H "Authorization: Bearer $TOKEN" \
+      | python3 -c "import sys, json; print(len(json.load(sys.stdin).get('tickets', [])))")
+    echo "Orden $order_id ($seat): $tickets ticket(s)"
+    if [ -z "$order_id" ] || [ "$tickets" != "1" ]; then
+        echo "No se pudo completar la compra de $seat"
+        exit 1
+    fi
+}
+buy_seat B1
+buy_seat B2
+
+# 10. Orders: órdenes + tickets en dos consultas, sin importar cuántas órdenes haya
+echo -e "\n--- List Orders (Query Count) ---"
+HEADERS=$(curl -s -D - -o /dev/null "http://localhost:7002/api/orders/my" \
+  -H "Authorization: Bearer $TOKEN")
+check_query_count "$HEADERS" 2
+HEADERS=$(curl -s -D - -o /dev/null "http://localhost:7002/api/orders/event/$EVENT_ID?limit=50" \
+  -H "Authorization: Bearer $TOKEN")
+check_query_count "$HEADERS" 2
+
+# 11. Idempotency-Key: el reintento devuelve la misma orden, otro cuerpo → 422
+echo -e "\n--- Idempotency-Key ---"
+IDEM_KEY="verify-$(date +%s)-$$"
+FIRST=$(curl -s -X POST http://localhost:7002/api/orders \
+  -H "Authorization: Bearer $TOKEN" -H "Content-Type: application/json" \
+  -H "Idempotency-Key: $IDEM_KEY" \
+  -d "{\"event_id\": $EVENT_ID, \"seats\": [\"A1\"]}")
+SECOND_HEADERS=$(curl -s -D - -o /tmp/verify_idem.json -X POST http://localhost:7002/api/orders \
+  -H "Authorization: Bearer $TOKEN" -H "Content-Type: application/json" \
+  -H "Idempotency-Key: $IDEM_KEY" \
+  -d "{\"event_id\": $EVENT_ID, \"seats\": [\"A1\"]}")
+FIRST_ID=$(echo "$FIRST" | python3 -c "import sys, json; print(json.load(sys.stdin).get('id', ''))")
+SECOND_ID=$(python3 -c "import json; print(json.load(open('/tmp/verify_idem.json')).get('id', ''))")
+echo "Orden: $FIRST_ID / reintento: $SECOND_ID"
+if [ -z "$FIRST_ID" ] || [ "$FIRST_ID" != "$SECOND_ID" ] || ! echo "$SECOND_HEADERS" | grep -qi '^Idempotent-Replayed: true'; then
+    echo "El reintento no devolvió la orden original"
+    exit 1
+fi
+STATUS=$(curl -s -o /dev/null -w "%{http_code}" -X POST http://localhost:7002/api/orders \
+  -H "Authorization: Bearer $TOKEN" -H "Content-Type: application/json" \
+  -H "Idempotency-Key: $IDEM_KEY" \
+  -d "{\"event_id\": $EVENT_ID, \"seats\": [\"A2\"]}")
+echo "Misma clave, otro cuerpo: HTTP $STATUS (esperado 422)"
+[ "$STATUS" = "422" ] || exit 1